@@ -1,14 +1,19 @@
 import logging
 from aiogram import Router, F, types
 from aiogram.filters import Command
+from aiogram.fsm.context import FSMContext
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from datetime import datetime, timedelta
 from typing import Optional
 
 from config import config
-from database.models import User, Payment, VideoProcessing, Referral
+from database.models import User
 from services.payments import payment_system
+from services.db_writer import db_writer
+from services.rollups import rollups
+from services.broadcast import SEGMENTS, broadcasts
 from utils.helpers import format_rub, format_bytes
+from utils.states import AdminStates
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -24,6 +29,8 @@ async def admin_check_middleware(handler, event, data):
         return
     return await handler(event, data)
 
+router.callback_query.middleware(admin_check_middleware)
+
 @router.message(Command("admin"))
 async def admin_panel(message: types.Message):
     """Главное меню админ-панели"""
@@ -56,10 +63,12 @@ async def admin_users(callback: types.CallbackQuery):
     builder.button(text="🔙 Назад", callback_data="admin_back")
     builder.adjust(1)
     
-    total_users = await User.all().count()
-    active_today = await User.filter(
-        last_active__gte=datetime.now() - timedelta(days=1)
-    ).count()
+    now = datetime.now()
+    all_time = await rollups.totals(None, now)
+    total_users = int(all_time['new_users'])
+    # Различные пользователи за 24 часа (индекс по last_active); максимум
+    # часовых агрегатов занижал бы это число
+    active_today = await User.filter(last_active__gte=now - timedelta(days=1)).count()
     
     await callback.message.edit_text(
         f"👥 <b>Пользователи</b>\n\n"
@@ -79,12 +88,12 @@ async def admin_finance(callback: types.CallbackQuery):
     builder.button(text="🔙 Назад", callback_data="admin_back")
     builder.adjust(1)
     
-    total_payments = await Payment.filter(status="paid").count()
-    total_amount = await Payment.filter(status="paid").sum("amount") or 0
-    today_amount = await Payment.filter(
-        status="paid",
-        paid_at__gte=datetime.now().replace(hour=0, minute=0, second=0)
-    ).sum("amount") or 0
+    now = datetime.now()
+    all_time = await rollups.totals(None, now)
+    today = await rollups.totals(rollups.day_start(now), now)
+    total_payments = int(all_time['paid:count'])
+    total_amount = all_time['paid:amount']
+    today_amount = today['paid:amount']
     
     await callback.message.edit_text(
         f"💰 <b>Финансы</b>\n\n"
@@ -105,13 +114,24 @@ async def admin_stats(callback: types.CallbackQuery):
     builder.button(text="🔙 Назад", callback_data="admin_back")
     builder.adjust(1)
     
-    videos_processed = await VideoProcessing.all().count()
-    refs_count = await Referral.all().count()
+    all_time = await rollups.totals(None, datetime.now())
+    videos_processed = int(sum(rollups.group(all_time, 'videos:').values()))
+    refs_count = int(all_time['referrals'])
+    
+    writer = ""
+    if db_writer.enabled:
+        metrics = db_writer.metrics.snapshot()
+        writer = (
+            f"\n💾 Запись в БД: {metrics['writes']} операций, "
+            f"пакет {metrics['avg_batch']} (макс. {metrics['max_batch']}), "
+            f"ожидание блокировки {metrics['avg_lock_wait_ms']} мс (макс. {metrics['max_lock_wait_ms']})\n"
+        )
     
     await callback.message.edit_text(
         f"📊 <b>Статистика</b>\n\n"
         f"Обработано видео: {videos_processed}\n"
-        f"Рефералов: {refs_count}\n\n"
+        f"Рефералов: {refs_count}\n"
+        f"{writer}\n"
         "Выберите раздел:",
         reply_markup=builder.as_markup()
     )
@@ -121,7 +141,7 @@ async def admin_stats(callback: types.CallbackQuery):
 async def admin_broadcast(callback: types.CallbackQuery):
     """Рассылка сообщений"""
     builder = InlineKeyboardBuilder()
-    builder.button(text="📢 Всем пользователям", callback_data="broadcast_all")
+    builder.button(text="📢 Всем пользователям", callback_data="broadcast_segment:all")
     builder.button(text="🎯 По фильтру", callback_data="broadcast_filter")
     builder.button(text="🔙 Назад", callback_data="admin_back")
     builder.adjust(1)
@@ -133,6 +153,93 @@ async def admin_broadcast(callback: types.CallbackQuery):
     )
     await callback.answer()
 
+@router.callback_query(F.data == "broadcast_filter")
+async def broadcast_filter(callback: types.CallbackQuery):
+    """Выбор получателей рассылки"""
+    builder = InlineKeyboardBuilder()
+    for key, segment in SEGMENTS.items():
+        if key != "all":
+            builder.button(text=segment.title, callback_data=f"broadcast_segment:{key}")
+    builder.button(text="🔙 Назад", callback_data="admin_broadcast")
+    builder.adjust(1)
+
+    await callback.message.edit_text(
+        "🎯 <b>Рассылка по фильтру</b>\n\n"
+        "Выберите получателей:",
+        reply_markup=builder.as_markup()
+    )
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("broadcast_segment:"))
+async def broadcast_segment(callback: types.CallbackQuery, state: FSMContext):
+    """Запрос сообщения для рассылки"""
+    segment = callback.data.split(":")[1]
+    if segment not in SEGMENTS:
+        await callback.answer("Неизвестный фильтр", show_alert=True)
+        return
+
+    count = await broadcasts.recipients(segment).count()
+    await state.set_state(AdminStates.waiting_for_broadcast)
+    await state.update_data(segment=segment)
+    await callback.message.edit_text(
+        f"{SEGMENTS[segment].title}\n"
+        f"Получателей: {count}\n\n"
+        "Отправьте сообщение для рассылки (текст, фото, видео, документ)"
+    )
+    await callback.answer()
+
+@router.message(AdminStates.waiting_for_broadcast)
+async def broadcast_message(message: types.Message, state: FSMContext):
+    """Подтверждение рассылки присланного сообщения"""
+    data = await state.get_data()
+    await state.update_data(from_chat_id=message.chat.id, message_id=message.message_id)
+    count = await broadcasts.recipients(data["segment"]).count()
+
+    builder = InlineKeyboardBuilder()
+    builder.button(text="✅ Запустить", callback_data="broadcast_confirm")
+    builder.button(text="❌ Отмена", callback_data="broadcast_abort")
+    builder.adjust(2)
+
+    await message.answer(
+        f"Сообщение выше получат {count} пользователей "
+        f"({SEGMENTS[data['segment']].title}). Запустить рассылку?",
+        reply_markup=builder.as_markup()
+    )
+
+@router.callback_query(F.data == "broadcast_confirm")
+async def broadcast_confirm(callback: types.CallbackQuery, state: FSMContext):
+    """Запуск рассылки"""
+    data = await state.get_data()
+    await state.clear()
+    if "message_id" not in data:
+        await callback.answer("Сообщение для рассылки не найдено", show_alert=True)
+        return
+
+    broadcast = await broadcasts.start(
+        callback.bot,
+        admin_id=callback.from_user.id,
+        from_chat_id=data["from_chat_id"],
+        message_id=data["message_id"],
+        segment=data["segment"]
+    )
+    await callback.message.edit_text(f"🚀 Рассылка #{broadcast.id} запущена: {broadcast.total} получателей")
+    await callback.answer()
+
+@router.callback_query(F.data == "broadcast_abort")
+async def broadcast_abort(callback: types.CallbackQuery, state: FSMContext):
+    """Отмена подготовки рассылки"""
+    await state.clear()
+    await callback.message.edit_text("❌ Рассылка отменена")
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("broadcast_cancel:"))
+async def broadcast_cancel(callback: types.CallbackQuery):
+    """Остановка идущей рассылки"""
+    broadcast_id = int(callback.data.split(":")[1])
+    if await broadcasts.cancel(broadcast_id):
+        await callback.message.edit_text(f"{callback.message.text}\n\n⛔ Рассылка остановлена")
+    await callback.answer()
+
 @router.callback_query(F.data == "admin_back")
 async def admin_back(callback: types.CallbackQuery):
     """Возврат в главное меню"""
@@ -153,13 +260,89 @@ async def user_balance_edit(callback: types.CallbackQuery):
 @router.callback_query(F.data == "stats_videos")
 async def stats_videos(callback: types.CallbackQuery):
     """Статистика по видео"""
-    methods = await VideoProcessing.all().group_by("method").count()
+    all_time = await rollups.totals(None, datetime.now())
+    methods = {}
+    for key, count in rollups.group(all_time, 'videos:').items():
+        method, status = key.split(':', 1)
+        methods.setdefault(method, {})[status] = int(count)
     stats_text = "🎥 <b>Статистика видео</b>\n\n"
     
-    for method, count in methods.items():
-        stats_text += f"{method}: {count}\n"
+    for method, statuses in methods.items():
+        details = ", ".join(f"{status}: {count}" for status, count in statuses.items())
+        stats_text += f"{method}: {sum(statuses.values())} ({details})\n"
     
     await callback.message.edit_text(stats_text)
     await callback.answer()
 
+@router.callback_query(F.data == "finance_period")
+async def finance_period(callback: types.CallbackQuery, state: FSMContext):
+    """Выбор периода для отчета"""
+    builder = InlineKeyboardBuilder()
+    builder.button(text="Сегодня", callback_data="period_days:0")
+    builder.button(text="7 дней", callback_data="period_days:7")
+    builder.button(text="30 дней", callback_data="period_days:30")
+    builder.button(text="🔙 Назад", callback_data="admin_finance")
+    builder.adjust(3, 1)
+
+    await callback.message.edit_text(
+        "📅 <b>Отчет за период</b>\n\n"
+        "Выберите период или отправьте даты сообщением:\n"
+        "<code>01.03.2025 31.03.2025</code>",
+        reply_markup=builder.as_markup()
+    )
+    await state.set_state(AdminStates.waiting_for_period)
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("period_days:"))
+async def finance_period_days(callback: types.CallbackQuery, state: FSMContext):
+    """Отчет за последние N дней"""
+    days = int(callback.data.split(":")[1])
+    now = datetime.now()
+    start = rollups.day_start(now) - timedelta(days=days)
+    await state.clear()
+    await callback.message.edit_text(await _period_report(start, now))
+    await callback.answer()
+
+@router.message(AdminStates.waiting_for_period)
+async def finance_period_input(message: types.Message, state: FSMContext):
+    """Отчет за произвольный период из сообщения"""
+    try:
+        start_text, end_text = message.text.split()
+        start = datetime.strptime(start_text, "%d.%m.%Y")
+        end = datetime.strptime(end_text, "%d.%m.%Y") + timedelta(days=1)
+    except ValueError:
+        await message.answer("Формат: <code>ДД.ММ.ГГГГ ДД.ММ.ГГГГ</code>")
+        return
+
+    if end <= start:
+        await message.answer("Дата окончания должна быть не раньше даты начала")
+        return
+
+    await state.clear()
+    await message.answer(await _period_report(start, end))
+
+async def _period_report(start: datetime, end: datetime) -> str:
+    """Текст отчета по агрегатам за период"""
+    totals = await rollups.totals(start, end)
+    videos = rollups.group(totals, 'videos:')
+    payments = rollups.group(totals, 'payments:')
+
+    text = (
+        f"📅 <b>Отчет {start.strftime('%d.%m.%Y')} - "
+        f"{(end - timedelta(seconds=1)).strftime('%d.%m.%Y')}</b>\n\n"
+        f"👥 Новых пользователей: {int(totals['new_users'])}\n"
+        f"🟢 Активных (макс. за интервал): {int(totals['active_users'])}\n"
+        f"🤝 Рефералов: {int(totals['referrals'])}\n\n"
+        f"💰 Оплачено: {int(totals['paid:count'])} на {format_rub(totals['paid:amount'])}\n"
+    )
+    for status in ('pending', 'paid', 'failed', 'expired'):
+        count = payments.get(f'{status}:count')
+        if count:
+            text += f"   {status}: {int(count)} ({format_rub(payments[f'{status}:amount'])})\n"
+
+    text += f"\n🎥 Видео: {int(sum(videos.values()))}\n"
+    for key, count in sorted(videos.items()):
+        text += f"   {key}: {int(count)}\n"
+    return text
+
 __all__ = ['router']
\ No newline at end of file
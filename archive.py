@@ -0,0 +1,159 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Type
+
+from tortoise.models import Model
+from tortoise.queryset import QuerySet
+
+from config import config
+from database.db import placeholders
+from database.models import (
+    Payment, PaymentArchive, PaymentStatus, Referral, ReferralArchive,
+    TicketMessage, TicketMessageArchive, TicketStatus,
+    VideoProcessing, VideoProcessingArchive, VideoStatus
+)
+from services.db_writer import db_writer
+
+logger = logging.getLogger(__name__)
+
+class ArchivePolicy(NamedTuple):
+    hot: Type[Model]
+    cold: Type[Model]
+    filters: dict  # Какие строки старше ARCHIVE_AFTER_DAYS можно переносить
+
+POLICIES: List[ArchivePolicy] = [
+    ArchivePolicy(VideoProcessing, VideoProcessingArchive,
+                  {'status__in': [VideoStatus.COMPLETED, VideoStatus.FAILED]}),
+    ArchivePolicy(Payment, PaymentArchive,
+                  {'status__in': [PaymentStatus.PAID, PaymentStatus.FAILED, PaymentStatus.EXPIRED]}),
+    ArchivePolicy(TicketMessage, TicketMessageArchive,
+                  {'ticket__status': TicketStatus.CLOSED}),
+    ArchivePolicy(Referral, ReferralArchive, {}),
+]
+
+class ArchiveService:
+    """
+    Перенос старых строк из рабочих таблиц в архивные пачками.
+    Рабочие таблицы и их индексы остаются небольшими, а отчеты и история
+    пользователя читают обе таблицы через querysets/count/exists/fetch.
+    В фильтрах используются колонки, общие для обеих таблиц (user_id, а не user).
+    """
+
+    def __init__(self):
+        self.after_days = config.ARCHIVE_AFTER_DAYS
+        self.batch_size = config.ARCHIVE_BATCH_SIZE
+        self.pause = config.ARCHIVE_BATCH_PAUSE
+        self.interval = config.ARCHIVE_INTERVAL
+        self._cold: Dict[Type[Model], Type[Model]] = {policy.hot: policy.cold for policy in POLICIES}
+
+    @staticmethod
+    def _columns(model: Type[Model]) -> List[str]:
+        return list(model._meta.fields_db_projection.values())
+
+    def _check_columns(self, policy: ArchivePolicy):
+        """Архивная таблица должна повторять колонки рабочей"""
+        hot, cold = set(self._columns(policy.hot)), set(self._columns(policy.cold))
+        if hot != cold:
+            raise RuntimeError(
+                f"{policy.cold._meta.db_table} columns differ from {policy.hot._meta.db_table}: "
+                f"{sorted(hot ^ cold)}"
+            )
+
+    async def _move_batch(self, policy: ArchivePolicy, cutoff: datetime) -> int:
+        ids = await policy.hot.filter(created_at__lt=cutoff, **policy.filters) \
+            .order_by('id').limit(self.batch_size).values_list('id', flat=True)
+        if not ids:
+            return 0
+
+        hot_table, cold_table = policy.hot._meta.db_table, policy.cold._meta.db_table
+        columns = ", ".join(self._columns(policy.hot))
+        marks = ", ".join("?" for _ in ids)
+
+        async def move(conn):
+            dialect = conn.capabilities.dialect
+            await conn.execute_query(placeholders(
+                f"INSERT INTO {cold_table} ({columns}) "
+                f"SELECT {columns} FROM {hot_table} WHERE id IN ({marks})", dialect
+            ), list(ids))
+            await conn.execute_query(placeholders(
+                f"DELETE FROM {hot_table} WHERE id IN ({marks})", dialect
+            ), list(ids))
+
+        await db_writer.transaction(move)
+        return len(ids)
+
+    async def run_once(self) -> Dict[str, int]:
+        """Перенос всех строк старше ARCHIVE_AFTER_DAYS, возвращает число по таблицам"""
+        cutoff = datetime.now() - timedelta(days=self.after_days)
+        moved = {}
+        for policy in POLICIES:
+            self._check_columns(policy)
+            total = 0
+            while True:
+                count = await self._move_batch(policy, cutoff)
+                total += count
+                if count < self.batch_size:
+                    break
+                # Пауза между пачками пропускает вперед запросы обработчиков
+                await asyncio.sleep(self.pause)
+            moved[policy.hot._meta.db_table] = total
+        logger.info(f"Archived rows older than {self.after_days} days: {moved}")
+        return moved
+
+    async def run_periodic(self):
+        """Фоновая архивация"""
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Archiving failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def querysets(self, model: Type[Model], **filters) -> List[QuerySet]:
+        """QuerySet рабочей и архивной таблицы с одинаковыми фильтрами"""
+        cold = self._cold.get(model)
+        return [model.filter(**filters)] + ([cold.filter(**filters)] if cold else [])
+
+    async def count(self, model: Type[Model], **filters) -> int:
+        return sum([await queryset.count() for queryset in self.querysets(model, **filters)])
+
+    async def exists(self, model: Type[Model], **filters) -> bool:
+        for queryset in self.querysets(model, **filters):
+            if await queryset.exists():
+                return True
+        return False
+
+    async def fetch(self, model: Type[Model], order_by: str = '-created_at',
+                    limit: int = None, **filters) -> List[dict]:
+        """Строки обеих таблиц одним списком (словари с колонками архивной модели)"""
+        cold = self._cold.get(model)
+        fields = list(cold._meta.fields_db_projection) if cold else None
+        rows = []
+        for queryset in self.querysets(model, **filters):
+            queryset = queryset.order_by(order_by)
+            if limit:
+                queryset = queryset.limit(limit)
+            rows.extend(await (queryset.values(*fields) if fields else queryset.values()))
+
+        key = order_by.lstrip('-')
+        rows.sort(key=lambda row: row[key], reverse=order_by.startswith('-'))
+        return rows[:limit] if limit else rows
+
+# Глобальный экземпляр для использования в системе
+archive = ArchiveService()
+
+if __name__ == '__main__':
+    # Разовая архивация: python -m services.archive
+    from tortoise import run_async
+    from database.db import init_db, close_db
+
+    async def archive_once():
+        await init_db()
+        try:
+            await archive.run_once()
+        finally:
+            await db_writer.close()
+            await close_db()
+
+    run_async(archive_once())
\ No newline at end of file
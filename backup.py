@@ -0,0 +1,133 @@
+import asyncio
+import gzip
+import logging
+import shutil
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Optional
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+class BackupService:
+    """
+    Онлайн-резервное копирование SQLite через backup API.
+    Копирование идет в отдельном потоке порциями по BACKUP_PAGES страниц
+    с паузой между порциями, поэтому не блокирует event loop и писателей.
+    Снимок согласован: читается в одной транзакции вместе с WAL.
+    """
+
+    def __init__(self):
+        self.db_path = config.DB_PATH
+        self.backup_dir = config.BACKUP_DIR
+        self.pages = config.BACKUP_PAGES
+        self.sleep = config.BACKUP_SLEEP
+        self.compress = config.BACKUP_COMPRESS
+        self.keep = config.BACKUP_KEEP
+        self._lock = asyncio.Lock()
+
+    async def backup(self, target: Optional[Path] = None) -> Optional[Path]:
+        """Создание копии (по умолчанию - в BACKUP_DIR с ротацией), возвращает путь"""
+        if config.DB_ENGINE != 'sqlite':
+            logger.error("Online backup is only available for SQLite, use pg_dump for PostgreSQL")
+            return None
+
+        async with self._lock:
+            started = time.perf_counter()
+            try:
+                path = await asyncio.to_thread(self._backup, target)
+            except Exception as e:
+                logger.error(f"Backup failed: {e}")
+                return None
+
+            if target is None:
+                await asyncio.to_thread(self._rotate)
+            logger.info(
+                f"Database backup created at {path} "
+                f"({path.stat().st_size} bytes, {time.perf_counter() - started:.1f} s)"
+            )
+            return path
+
+    def _backup(self, target: Optional[Path]) -> Path:
+        if target is None:
+            self.backup_dir.mkdir(parents=True, exist_ok=True)
+            target = self.backup_dir / f"{self.db_path.stem}-{datetime.now():%Y%m%d-%H%M%S}.db"
+        target.parent.mkdir(parents=True, exist_ok=True)
+        partial = target.with_name(target.name + '.part')
+
+        source = sqlite3.connect(self.db_path)
+        destination = sqlite3.connect(partial)
+        try:
+            # Открытая транзакция чтения фиксирует снимок WAL: без нее каждая
+            # запись другого соединения перезапускает копирование с начала
+            source.execute("BEGIN")
+            source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+            # Пауза после каждой порции отдает блокировку писателям
+            pause = lambda status, remaining, total: time.sleep(self.sleep)
+            source.backup(destination, pages=self.pages, progress=pause)
+        finally:
+            destination.close()
+            source.close()
+
+        if self.compress:
+            compressed = target.with_name(target.name + '.gz')
+            with open(partial, 'rb') as raw, gzip.open(compressed, 'wb', compresslevel=6) as packed:
+                shutil.copyfileobj(raw, packed, length=1024 * 1024)
+            partial.unlink()
+            return compressed
+
+        partial.replace(target)
+        return target
+
+    def _backups(self) -> List[Path]:
+        """Копии в BACKUP_DIR, от новых к старым"""
+        pattern = f"{self.db_path.stem}-*.db*"
+        return sorted(
+            (path for path in self.backup_dir.glob(pattern) if not path.name.endswith('.part')),
+            key=lambda path: path.name,
+            reverse=True
+        )
+
+    def _rotate(self):
+        for path in self._backups()[self.keep:]:
+            try:
+                path.unlink()
+                logger.info(f"Old backup removed: {path}")
+            except OSError as e:
+                logger.warning(f"Could not remove backup {path}: {e}")
+
+    @staticmethod
+    def restore(backup_path: Path, db_path: Path):
+        """Восстановление из копии (бот должен быть остановлен)"""
+        opener = gzip.open if backup_path.suffix == '.gz' else open
+        with opener(backup_path, 'rb') as source, open(db_path, 'wb') as target:
+            shutil.copyfileobj(source, target, length=1024 * 1024)
+        for suffix in ('-wal', '-shm'):
+            db_path.with_name(db_path.name + suffix).unlink(missing_ok=True)
+
+    async def run_periodic(self):
+        """Ежедневная копия в BACKUP_HOUR"""
+        while True:
+            now = datetime.now()
+            next_run = now.replace(hour=config.BACKUP_HOUR, minute=0, second=0, microsecond=0)
+            if next_run <= now:
+                next_run += timedelta(days=1)
+            await asyncio.sleep((next_run - now).total_seconds())
+            await self.backup()
+
+# Глобальный экземпляр для использования в системе
+backup_service = BackupService()
+
+if __name__ == '__main__':
+    # Разовая копия: python -m services.backup [path]
+    # Восстановление: python -m services.backup --restore path
+    import sys
+    if len(sys.argv) == 3 and sys.argv[1] == '--restore':
+        BackupService.restore(Path(sys.argv[2]), config.DB_PATH)
+        print(f"Restored {config.DB_PATH} from {sys.argv[2]}")
+    else:
+        path = asyncio.run(backup_service.backup(Path(sys.argv[1]) if len(sys.argv) > 1 else None))
+        sys.exit(0 if path else 1)
\ No newline at end of file
@@ -0,0 +1,208 @@
+"""
+Бенчмарк комнат VideoEditor на синтетических роликах.
+
+Входные видео генерируются ffmpeg через lavfi (testsrc2 + шум + синус),
+поэтому запуск не требует сети, GPU и реальных пользовательских файлов:
+
+    python benchmark.py --resolutions 640x360,1280x720 --durations 5,15 \\
+        --presets veryfast,medium --threads 1,2 --baseline bench/baseline.json
+
+Каждый прогон выполняется в отдельном процессе, чтобы CPU-время и пиковый
+RSS дочерних ffmpeg считались для одного случая.
+"""
+import argparse
+import csv
+import json
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from fractions import Fraction
+from itertools import product
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import ffmpeg
+
+# Конфиг требует токены, которые бенчмарку не нужны
+os.environ.setdefault('BOT_TOKEN', 'benchmark')
+os.environ.setdefault('LOLZ_API_KEY', 'benchmark')
+os.environ.setdefault('LOLZ_SECRET_KEY', 'benchmark')
+
+from config import config
+
+REPORT_FIELDS = [
+    'method', 'resolution', 'duration', 'preset', 'threads',
+    'wall_time', 'cpu_time', 'encode_fps', 'peak_rss_kb', 'output_size', 'error',
+]
+
+
+def generate_input(work_dir: Path, resolution: str, duration: int, fps: int = 30) -> Path:
+    """Синтетический ролик: testsrc2 с шумом и синусоидальным звуком"""
+    path = work_dir / f"input_{resolution}_{duration}s.mp4"
+    if path.exists():
+        return path
+
+    video = (
+        ffmpeg.input(f"testsrc2=size={resolution}:rate={fps}:duration={duration}", f='lavfi')
+        .filter('noise', alls=12, allf='t')
+    )
+    audio = ffmpeg.input(f"sine=frequency=440:sample_rate=44100:duration={duration}", f='lavfi')
+    (
+        ffmpeg.output(
+            video, audio, str(path),
+            **{'c:v': 'libx264', 'c:a': 'aac', 'preset': 'ultrafast', 'pix_fmt': 'yuv420p'}
+        )
+        .overwrite_output()
+        .run(quiet=True)
+    )
+    return path
+
+
+def _count_frames(path: Path) -> int:
+    """Количество кадров в видеодорожке результата"""
+    for stream in ffmpeg.probe(str(path)).get('streams', []):
+        if stream.get('codec_type') == 'video':
+            if stream.get('nb_frames', '').isdigit():
+                return int(stream['nb_frames'])
+            return int(float(stream.get('duration', 0)) * Fraction(stream.get('r_frame_rate', '0/1')))
+    return 0
+
+
+def run_case(case: Dict[str, object]) -> Dict[str, object]:
+    """Один прогон комнаты (выполняется в отдельном процессе)"""
+    from services.video_editor import VideoEditor
+
+    editor = VideoEditor()
+    input_path = Path(case['input'])
+    output_path = Path(case['work_dir']) / f"out_{case['method']}_{case['preset']}_{case['threads']}_{input_path.name}"
+    tier = dict(config.get_tier(config.DEFAULT_TIER), preset=case['preset'], threads=case['threads'])
+
+    result = {field: case.get(field) for field in REPORT_FIELDS}
+    usage_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    started = time.perf_counter()
+    try:
+        editor.render(input_path, output_path, case['method'], tier)
+    except Exception as e:
+        result['error'] = str(e)
+        return result
+
+    wall_time = time.perf_counter() - started
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    frames = _count_frames(output_path)
+
+    result.update(
+        wall_time=round(wall_time, 3),
+        cpu_time=round(
+            (usage.ru_utime - usage_before.ru_utime) + (usage.ru_stime - usage_before.ru_stime), 3
+        ),
+        encode_fps=round(frames / wall_time, 2) if wall_time else 0,
+        # ru_maxrss у Linux в килобайтах
+        peak_rss_kb=max(usage.ru_maxrss, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss),
+        output_size=output_path.stat().st_size,
+        error=None,
+    )
+    output_path.unlink(missing_ok=True)
+    return result
+
+
+def _case_key(row: Dict[str, object]) -> tuple:
+    return tuple(str(row[field]) for field in ('method', 'resolution', 'duration', 'preset', 'threads'))
+
+
+def compare_with_baseline(results: List[Dict[str, object]], baseline_path: Path,
+                          tolerance: float) -> List[str]:
+    """Сравнение с сохраненным прогоном, возвращает описания регрессий"""
+    baseline = {_case_key(row): row for row in json.loads(baseline_path.read_text())['results']}
+    regressions = []
+
+    for row in results:
+        base = baseline.get(_case_key(row))
+        if not base or row['error'] or base.get('error'):
+            continue
+        for metric in ('wall_time', 'cpu_time', 'output_size', 'peak_rss_kb'):
+            if base[metric] and row[metric] > base[metric] * (1 + tolerance):
+                regressions.append(
+                    f"{'/'.join(_case_key(row))}: {metric} {base[metric]} -> {row[metric]} "
+                    f"(+{(row[metric] / base[metric] - 1) * 100:.1f}%)"
+                )
+    return regressions
+
+
+def write_report(results: List[Dict[str, object]], out_dir: Path) -> None:
+    """Сохранение отчета в JSON и CSV"""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'cpu_count': os.cpu_count(),
+        'ffmpeg_threads_default': config.FFMPEG_THREADS,
+        'results': results,
+    }
+    (out_dir / 'report.json').write_text(json.dumps(report, indent=2, ensure_ascii=False))
+
+    with open(out_dir / 'report.csv', 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="VideoEditor benchmark on synthetic lavfi clips")
+    parser.add_argument('--methods', default='crocodile,dolphin,grizzly')
+    parser.add_argument('--resolutions', default='640x360,1280x720,1920x1080')
+    parser.add_argument('--durations', default='5,15')
+    parser.add_argument('--presets', default='veryfast,medium')
+    parser.add_argument('--threads', default=str(config.FFMPEG_THREADS))
+    parser.add_argument('--work-dir', type=Path, default=config.TEMP_DIR / 'bench')
+    parser.add_argument('--out', type=Path, default=Path('bench'))
+    parser.add_argument('--baseline', type=Path, help="JSON-отчет для сравнения")
+    parser.add_argument('--save-baseline', action='store_true', help="Сохранить отчет как baseline")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="Допустимый рост метрик (доля)")
+    args = parser.parse_args(argv)
+
+    args.work_dir.mkdir(parents=True, exist_ok=True)
+    cases = []
+    for resolution, duration in product(args.resolutions.split(','), args.durations.split(',')):
+        input_path = generate_input(args.work_dir, resolution, int(duration))
+        for method, preset, threads in product(
+            args.methods.split(','), args.presets.split(','), args.threads.split(',')
+        ):
+            cases.append({
+                'method': method,
+                'resolution': resolution,
+                'duration': int(duration),
+                'preset': preset,
+                'threads': int(threads),
+                'input': str(input_path),
+                'work_dir': str(args.work_dir),
+            })
+
+    results = []
+    for case in cases:
+        # Новый процесс на каждый случай - честные CPU и RSS
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            row = pool.submit(run_case, case).result()
+        results.append(row)
+        print(
+            f"{row['method']:>9} {row['resolution']:>9} {row['duration']:>3}s "
+            f"{row['preset']:>9} t={row['threads']}: "
+            + (f"ERROR {row['error']}" if row['error'] else
+               f"{row['wall_time']}s wall, {row['cpu_time']}s cpu, {row['encode_fps']} fps, "
+               f"{row['output_size']} bytes")
+        )
+
+    write_report(results, args.out)
+    if args.save_baseline:
+        (args.out / 'baseline.json').write_text((args.out / 'report.json').read_text())
+
+    if args.baseline:
+        regressions = compare_with_baseline(results, args.baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
\ No newline at end of file
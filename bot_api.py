@@ -0,0 +1,68 @@
+import asyncio
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import Optional, Union
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import FSInputFile
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+def bot_session() -> Optional[AiohttpSession]:
+    """Сессия для локального Bot API сервера (None - api.telegram.org)"""
+    if not config.BOT_API_SERVER:
+        return None
+    return AiohttpSession(api=TelegramAPIServer.from_base(config.BOT_API_SERVER, is_local=True))
+
+def local_path(file_path: str) -> Path:
+    """Путь файла сервера в файловой системе бота (каталог сервера может быть смонтирован иначе)"""
+    path = Path(file_path)
+    try:
+        return config.BOT_API_FILES_DIR / path.relative_to(config.BOT_API_SERVER_DIR)
+    except ValueError:
+        return path
+
+def server_path(path: Path) -> Path:
+    """Путь файла бота в файловой системе сервера (обратное local_path)"""
+    path = path.resolve()
+    for bot_dir, server_dir in (
+        (config.TEMP_DIR, config.BOT_API_TEMP_DIR),
+        (config.PROCESSED_DIR, config.BOT_API_PROCESSED_DIR),
+        (config.BOT_API_FILES_DIR, config.BOT_API_SERVER_DIR),
+    ):
+        try:
+            return server_dir / path.relative_to(bot_dir.resolve())
+        except ValueError:
+            continue
+    return path
+
+def _link(source: Path, destination: Path):
+    destination.unlink(missing_ok=True)
+    try:
+        os.link(source, destination)
+    except OSError as e:
+        # Другой раздел диска или запрет жестких ссылок
+        logger.warning(f"Could not hardlink {source} ({e}), copying")
+        shutil.copyfile(source, destination)
+
+async def download_file(bot: Bot, file_path: str, destination: Path):
+    """
+    Скачивание файла в рабочий каталог.
+    С локальным сервером файл уже на диске: создается жесткая ссылка без копирования.
+    """
+    if not config.BOT_API_SERVER:
+        await bot.download_file(file_path, destination=destination)
+        return
+    await asyncio.to_thread(_link, local_path(file_path), destination)
+
+def input_file(path: Path) -> Union[str, FSInputFile]:
+    """Файл для отправки: локальный сервер сам читает его по file:// без передачи байтов"""
+    if config.BOT_API_SERVER:
+        return server_path(path).as_uri()
+    return FSInputFile(path)
@@ -0,0 +1,148 @@
+import asyncio
+import hmac
+import logging
+import secrets
+from collections import deque
+from typing import Deque, Dict, Set
+
+import uvicorn
+from aiogram import Bot, Dispatcher
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+def order_key(update: dict) -> int:
+    """Чат (или пользователь) обновления - обновления с одним ключом обрабатываются по порядку"""
+    for name, event in update.items():
+        if name == "update_id" or not isinstance(event, dict):
+            continue
+        chat = event.get("chat") or (event.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+        sender = event.get("from") or event.get("user")
+        if sender:
+            return sender["id"]
+    return update.get("update_id", 0)
+
+class UpdatePool:
+    """
+    Обработка обновлений не более чем в WEBHOOK_CONCURRENCY задачах.
+    У каждого чата своя очередь: его обновления идут строго друг за другом,
+    а медленный обработчик одного чата не задерживает остальные.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.max_backlog = config.WEBHOOK_MAX_BACKLOG
+        self.backlog = 0  # Принятые, но еще не обработанные обновления
+        self._slots = asyncio.Semaphore(config.WEBHOOK_CONCURRENCY)
+        self._chats: Dict[int, Deque[dict]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def submit(self, update: dict) -> bool:
+        """Постановка обновления в очередь чата (False - очередь переполнена)"""
+        if self.backlog >= self.max_backlog:
+            return False
+        self.backlog += 1
+
+        key = order_key(update)
+        queue = self._chats.get(key)
+        if queue is not None:
+            queue.append(update)
+            return True
+
+        self._chats[key] = deque([update])
+        task = asyncio.create_task(self._run_chat(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def _run_chat(self, key: int):
+        queue = self._chats[key]
+        try:
+            while queue:
+                update = queue.popleft()
+                async with self._slots:
+                    try:
+                        await self.dispatcher.feed_raw_update(self.bot, update)
+                    except Exception as e:
+                        logger.error(f"Update {update.get('update_id')} failed: {e}", exc_info=True)
+                    finally:
+                        self.backlog -= 1
+        finally:
+            del self._chats[key]
+
+    async def close(self, timeout: float = 30):
+        """Ожидание принятых обновлений, затем отмена оставшихся"""
+        if not self._tasks:
+            return
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning(f"Dropped {self.backlog} unprocessed updates on shutdown")
+
+class BotWebhook:
+    """
+    Прием обновлений Telegram через вебхук: запрос проверяется по секретному
+    токену и сразу получает ответ 200, а обработка идет в UpdatePool.
+    При переполнении очереди отвечаем 503 - Telegram повторит доставку позже.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        if not config.WEBHOOK_SECRET:
+            logger.warning("WEBHOOK_SECRET is not set, using a random token for this run")
+        self.secret = config.WEBHOOK_SECRET or secrets.token_urlsafe(32)
+        self.pool = UpdatePool(dispatcher, bot)
+        self.app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None)
+        self.app.add_api_route(config.WEBHOOK_PATH, self.receive, methods=["POST"])
+
+    async def receive(self, request: Request):
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            return JSONResponse({"error": "invalid secret token"}, status_code=401)
+        try:
+            update = await request.json()
+        except ValueError:
+            return JSONResponse({"error": "invalid payload"}, status_code=400)
+
+        if not self.pool.submit(update):
+            logger.warning(f"Update backlog is full ({self.pool.backlog}), asking Telegram to retry")
+            return JSONResponse({"error": "overloaded"}, status_code=503)
+        return Response(status_code=200)
+
+    async def run(self):
+        """Регистрация вебхука и прием обновлений до сигнала остановки"""
+        workflow_data = {"dispatcher": self.dispatcher, "bots": [self.bot], **self.dispatcher.workflow_data}
+        await self.dispatcher.emit_startup(bot=self.bot, **workflow_data)
+        try:
+            await self.bot.set_webhook(
+                url=config.webhook_url,
+                secret_token=self.secret,
+                allowed_updates=self.dispatcher.resolve_used_update_types(),
+                max_connections=config.WEBHOOK_MAX_CONNECTIONS
+            )
+            logger.info(
+                f"Webhook set to {config.webhook_url}, listening on "
+                f"{config.WEBHOOK_LISTEN_HOST}:{config.WEBHOOK_LISTEN_PORT} "
+                f"({config.WEBHOOK_CONCURRENCY} concurrent updates)"
+            )
+            server = uvicorn.Server(uvicorn.Config(
+                self.app,
+                host=config.WEBHOOK_LISTEN_HOST,
+                port=config.WEBHOOK_LISTEN_PORT,
+                log_level="warning",
+                access_log=False
+            ))
+            # Сервер сам останавливается по SIGINT/SIGTERM
+            await server.serve()
+        finally:
+            await self.pool.close()
+            await self.dispatcher.emit_shutdown(bot=self.bot, **workflow_data)
@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, NamedTuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+from tortoise.queryset import QuerySet
+
+from config import config
+from database.models import Broadcast, BroadcastStatus, User
+from services.db_writer import db_writer
+from services.telegram_limiter import bulk_lane
+from services.user_cache import user_cache
+from utils.helpers import format_timedelta
+
+logger = logging.getLogger(__name__)
+
+class Segment(NamedTuple):
+    title: str
+    filters: Callable[[], dict]  # Фильтры User; даты считаются в момент выборки
+
+SEGMENTS: Dict[str, Segment] = {
+    "all": Segment("📢 Всем пользователям", lambda: {}),
+    "active_7d": Segment("🟢 Активные за 7 дней", lambda: {"last_active__gte": datetime.now() - timedelta(days=7)}),
+    "with_balance": Segment("💰 С положительным балансом", lambda: {"balance__gt": 0}),
+    "new_30d": Segment("🆕 Зарегистрированные за 30 дней", lambda: {"registered_at__gte": datetime.now() - timedelta(days=30)}),
+}
+
+SENT, FAILED, BLOCKED = "sent", "failed", "blocked"
+
+class BroadcastService:
+    """
+    Рассылка копией сообщения администратора (copy_message - медиа не загружается заново).
+    Получатели читаются страницами по id, курсор и счетчики сохраняются после
+    каждой пачки, поэтому после перезапуска рассылка продолжается с места остановки.
+    Темп задает telegram_limiter: рассылка идет в очереди BULK и не задерживает ответы.
+    """
+
+    def __init__(self):
+        self.page = config.BROADCAST_PAGE
+        self.chunk = config.BROADCAST_CHUNK
+        self.progress_interval = config.BROADCAST_PROGRESS_INTERVAL
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._stopping = False
+
+    @staticmethod
+    def recipients(segment: str) -> QuerySet:
+        return User.filter(is_active=True, **SEGMENTS[segment].filters())
+
+    async def start(self, bot: Bot, admin_id: int, from_chat_id: int, message_id: int, segment: str) -> Broadcast:
+        broadcast = await Broadcast.create(
+            admin_id=admin_id,
+            from_chat_id=from_chat_id,
+            message_id=message_id,
+            segment=segment,
+            total=await self.recipients(segment).count()
+        )
+        self._spawn(bot, broadcast)
+        return broadcast
+
+    async def resume(self, bot: Bot):
+        """Продолжение рассылок, прерванных остановкой бота"""
+        for broadcast in await Broadcast.filter(status=BroadcastStatus.RUNNING):
+            logger.info(f"Resuming broadcast {broadcast.id} after user {broadcast.last_user_id}")
+            self._spawn(bot, broadcast)
+
+    async def cancel(self, broadcast_id: int) -> bool:
+        updated = await Broadcast.filter(id=broadcast_id, status=BroadcastStatus.RUNNING) \
+            .update(status=BroadcastStatus.CANCELLED, finished_at=datetime.now())
+        task = self._tasks.get(broadcast_id)
+        if task:
+            task.cancel()
+        return bool(updated)
+
+    def _spawn(self, bot: Bot, broadcast: Broadcast):
+        task = asyncio.create_task(self._run(bot, broadcast))
+        self._tasks[broadcast.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(broadcast.id, None))
+
+    async def _send(self, bot: Bot, broadcast: Broadcast, user_id: int) -> str:
+        try:
+            with bulk_lane():
+                await bot.copy_message(user_id, broadcast.from_chat_id, broadcast.message_id)
+            return SENT
+        except TelegramForbiddenError:
+            return BLOCKED
+        except TelegramBadRequest as e:
+            if "chat not found" in e.message.lower():
+                return BLOCKED
+            logger.warning(f"Broadcast {broadcast.id} to {user_id} failed: {e}")
+            return FAILED
+        except Exception as e:
+            logger.warning(f"Broadcast {broadcast.id} to {user_id} failed: {e}")
+            return FAILED
+
+    async def _send_chunk(self, bot: Bot, broadcast: Broadcast, user_ids: List[int]):
+        results = await asyncio.gather(*(self._send(bot, broadcast, user_id) for user_id in user_ids))
+        blocked = [user_id for user_id, result in zip(user_ids, results) if result == BLOCKED]
+        broadcast.sent += results.count(SENT)
+        broadcast.failed += results.count(FAILED)
+        broadcast.blocked += len(blocked)
+        broadcast.last_user_id = user_ids[-1]
+
+        async def save(conn):
+            if blocked:
+                # Заблокировавшие бота больше не попадают в рассылки
+                await User.filter(id__in=blocked).using_db(conn).update(is_active=False)
+                # Кэш перечитает флаг: вернувшийся пользователь снова станет активным
+                for user_id in blocked:
+                    db_writer.after_commit(lambda user_id=user_id: user_cache.invalidate(user_id))
+            await broadcast.save(using_db=conn, update_fields=["sent", "failed", "blocked", "last_user_id"])
+
+        await db_writer.transaction(save)
+
+    async def _run(self, bot: Bot, broadcast: Broadcast):
+        started = time.monotonic()
+        done_before = self._processed(broadcast)
+        progress = None
+        try:
+            progress = await bot.send_message(
+                broadcast.admin_id,
+                self._progress_text(broadcast, started, done_before),
+                reply_markup=self._cancel_markup(broadcast)
+            )
+        except Exception as e:
+            logger.warning(f"Broadcast {broadcast.id} progress message failed: {e}")
+
+        last_report = time.monotonic()
+        while True:
+            page = await self.recipients(broadcast.segment) \
+                .filter(id__gt=broadcast.last_user_id) \
+                .order_by("id").limit(self.page).values_list("id", flat=True)
+            if not page:
+                break
+
+            for offset in range(0, len(page), self.chunk):
+                await self._send_chunk(bot, broadcast, page[offset:offset + self.chunk])
+                if self._stopping:
+                    logger.info(f"Broadcast {broadcast.id} paused after user {broadcast.last_user_id}")
+                    return
+                if progress and time.monotonic() - last_report >= self.progress_interval:
+                    await self._report(progress, broadcast, started, done_before)
+                    last_report = time.monotonic()
+
+            if len(page) < self.page:
+                break
+
+        broadcast.status = BroadcastStatus.DONE
+        broadcast.finished_at = datetime.now()
+        await Broadcast.filter(id=broadcast.id, status=BroadcastStatus.RUNNING) \
+            .update(status=broadcast.status, finished_at=broadcast.finished_at)
+        logger.info(
+            f"Broadcast {broadcast.id} finished: {broadcast.sent} sent, "
+            f"{broadcast.blocked} blocked, {broadcast.failed} failed"
+        )
+        if progress:
+            await self._report(progress, broadcast, started, done_before)
+
+    async def close(self, timeout: float = 10):
+        """
+        Остановка рассылок при выключении бота: текущая пачка дописывается,
+        рассылка остается RUNNING и продолжится после запуска (resume)
+        """
+        self._stopping = True
+        tasks = list(self._tasks.values())
+        if not tasks:
+            return
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _report(self, progress, broadcast: Broadcast, started: float, done_before: int):
+        try:
+            await progress.edit_text(
+                self._progress_text(broadcast, started, done_before),
+                reply_markup=self._cancel_markup(broadcast) if broadcast.status == BroadcastStatus.RUNNING else None
+            )
+        except Exception as e:
+            logger.debug(f"Broadcast {broadcast.id} progress update failed: {e}")
+
+    @staticmethod
+    def _processed(broadcast: Broadcast) -> int:
+        return broadcast.sent + broadcast.failed + broadcast.blocked
+
+    def _progress_text(self, broadcast: Broadcast, started: float, done_before: int) -> str:
+        processed = self._processed(broadcast)
+        elapsed = time.monotonic() - started
+        rate = (processed - done_before) / elapsed if elapsed > 0 else 0.0
+        title = "✅ Рассылка завершена" if broadcast.status == BroadcastStatus.DONE else "📢 Рассылка идет"
+        text = (
+            f"{title} #{broadcast.id} ({SEGMENTS[broadcast.segment].title})\n\n"
+            f"Обработано: {processed} из {broadcast.total}\n"
+            f"✉️ Доставлено: {broadcast.sent}\n"
+            f"🚫 Заблокировали бота: {broadcast.blocked}\n"
+            f"⚠️ Ошибок: {broadcast.failed}\n"
+            f"⚡ Скорость: {rate:.1f} сообщ./с"
+        )
+        if broadcast.status == BroadcastStatus.RUNNING and rate > 0:
+            remaining = max(broadcast.total - processed, 0) / rate
+            text += f"\n⏳ Осталось: {format_timedelta(timedelta(seconds=remaining))}"
+        return text
+
+    @staticmethod
+    def _cancel_markup(broadcast: Broadcast):
+        builder = InlineKeyboardBuilder()
+        builder.button(text="⛔ Остановить", callback_data=f"broadcast_cancel:{broadcast.id}")
+        return builder.as_markup()
+
+# Глобальный экземпляр для использования в системе
+broadcasts = BroadcastService()
@@ -28,6 +28,12 @@ class FileCleanup:
         except Exception as e:
             logger.error(f"Cleanup error: {e}")
 
+    async def run_periodic_cleanup(self):
+        """Фоновая очистка раз в CLEANUP_INTERVAL секунд"""
+        while True:
+            await self.run_cleanup()
+            await asyncio.sleep(config.CLEANUP_INTERVAL)
+
     async def clean_temp_files(self, max_age_hours: int = 24):
         """Очистка временных файлов старше указанного возраста"""
         def _clean_files():
@@ -1,6 +1,6 @@
 import os
 from pathlib import Path
-from typing import List, Optional, Set
+from typing import Dict, List, Optional, Set
 from dotenv import load_dotenv
 
 # Загрузка переменных окружения из .env файла
@@ -21,31 +21,210 @@ class Config:
         self.DB_PATH: Path = Path('database/bot_database.db')
         self.DB_ECHO: bool = self._get_bool('DB_ECHO', default=False)
         self.DB_TIMEZONE: str = self._get_env_var('DB_TIMEZONE', default='UTC')
+        # sqlite - один процесс; postgres - несколько процессов бота и воркеров на одной БД
+        self.DB_ENGINE: str = self._get_env_var('DB_ENGINE', default='sqlite').lower()
+        self.DB_HOST: str = self._get_env_var('DB_HOST', default='localhost')
+        self.DB_PORT: int = int(self._get_env_var('DB_PORT', default='5432'))
+        self.DB_USER: str = self._get_env_var('DB_USER', default='postgres')
+        self.DB_PASSWORD: str = self._get_env_var('DB_PASSWORD', default='')
+        self.DB_NAME: str = self._get_env_var('DB_NAME', default='video_bot')
+        self.DB_POOL_MIN: int = int(self._get_env_var('DB_POOL_MIN', default='2'))
+        self.DB_POOL_MAX: int = int(self._get_env_var('DB_POOL_MAX', default='10'))  # На процесс
+        self.DB_STATEMENT_TIMEOUT: int = int(self._get_env_var('DB_STATEMENT_TIMEOUT', default='30000'))  # мс
+
+        # Режим SQLite: PRAGMA соединения
+        self.SQLITE_PRAGMAS: Dict[str, object] = {
+            'synchronous': self._get_env_var('SQLITE_SYNCHRONOUS', default='NORMAL'),  # В WAL без потери целостности
+            'mmap_size': int(self._get_env_var('SQLITE_MMAP_SIZE', default=str(256 * 1024 * 1024))),
+            'cache_size': -int(self._get_env_var('SQLITE_CACHE_KB', default='65536')),  # Отрицательное - в КБ
+            'busy_timeout': int(self._get_env_var('SQLITE_BUSY_TIMEOUT', default='30000')),  # мс
+            'temp_store': 'MEMORY',
+        }
+        # Групповая фиксация записей одной фоновой задачей (только SQLite)
+        self.DB_WRITE_COALESCING: bool = self._get_bool('DB_WRITE_COALESCING', default=True)
+        self.DB_WRITE_BATCH_MAX: int = int(self._get_env_var('DB_WRITE_BATCH_MAX', default='64'))
+        self.DB_WRITE_BATCH_WINDOW: float = float(self._get_env_var('DB_WRITE_BATCH_WINDOW', default='0.005'))  # Секунд
+
+        # Резервные копии SQLite
+        self.BACKUP_DIR: Path = Path(self._get_env_var('BACKUP_DIR', default='backups'))
+        self.BACKUP_HOUR: int = int(self._get_env_var('BACKUP_HOUR', default='4'))  # Час ежедневной копии
+        self.BACKUP_PAGES: int = int(self._get_env_var('BACKUP_PAGES', default='1024'))  # Страниц за шаг
+        self.BACKUP_SLEEP: float = float(self._get_env_var('BACKUP_SLEEP', default='0.01'))  # Пауза между шагами, секунд
+        self.BACKUP_COMPRESS: bool = self._get_bool('BACKUP_COMPRESS', default=True)
+        self.BACKUP_KEEP: int = int(self._get_env_var('BACKUP_KEEP', default='7'))  # Сколько копий хранить
+
+        # Архивация старых записей (видео, платежи, сообщения тикетов, рефералы)
+        self.ARCHIVE_AFTER_DAYS: int = int(self._get_env_var('ARCHIVE_AFTER_DAYS', default='90'))
+        self.ARCHIVE_BATCH_SIZE: int = int(self._get_env_var('ARCHIVE_BATCH_SIZE', default='500'))
+        self.ARCHIVE_BATCH_PAUSE: float = 0.05  # Пауза между пачками, секунд
+        self.ARCHIVE_INTERVAL: int = 6 * 3600  # Период работы архиватора, секунд
         
         # Настройки платежной системы (Lolz.live)
         self.LOLZ_API_KEY: str = self._get_env_var('LOLZ_API_KEY', required=True)
         self.LOLZ_SECRET_KEY: str = self._get_env_var('LOLZ_SECRET_KEY', required=True)
         self.LOLZ_CALLBACK_URL: Optional[str] = self._get_env_var('LOLZ_CALLBACK_URL')
+        self.LOLZ_API_URL: str = self._get_env_var('LOLZ_API_URL', default='https://api.lolz.guru')
+
+        # HTTP-клиент платежного API (один на процесс)
+        self.PAYMENT_MAX_CONNECTIONS: int = int(self._get_env_var('PAYMENT_MAX_CONNECTIONS', default='20'))
+        self.PAYMENT_MAX_KEEPALIVE: int = int(self._get_env_var('PAYMENT_MAX_KEEPALIVE', default='10'))
+        self.PAYMENT_HTTP2: bool = self._get_bool('PAYMENT_HTTP2', default=False)  # Нужен пакет h2
+        self.PAYMENT_CONNECT_TIMEOUT: float = 5.0
+        self.PAYMENT_CREATE_TIMEOUT: float = 30.0  # Создание счета
+        self.PAYMENT_CHECK_TIMEOUT: float = 10.0  # Проверка статуса
+        self.PAYMENT_RETRIES: int = int(self._get_env_var('PAYMENT_RETRIES', default='3'))
+        self.PAYMENT_RETRY_BACKOFF: float = 0.5  # Базовая пауза повтора, секунд
+        self.PAYMENT_RATE_LIMIT: float = float(self._get_env_var('PAYMENT_RATE_LIMIT', default='10'))  # Запросов в секунду
+
+        # Фоновая проверка pending-платежей
+        self.PAYMENT_POLL_TICK: int = 5  # Период поиска платежей, которым пора на проверку
+        self.PAYMENT_POLL_MIN: int = 10  # Пауза для свежих платежей, секунд
+        self.PAYMENT_POLL_MAX: int = 30 * 60  # Пауза для старых платежей, секунд
+        self.PAYMENT_POLL_FACTOR: float = 0.2  # Пауза как доля возраста платежа
+        self.PAYMENT_POLL_CONCURRENCY: int = int(self._get_env_var('PAYMENT_POLL_CONCURRENCY', default='8'))
+        self.PAYMENT_POLL_PAGE: int = 500
+        self.PAYMENT_STATUS_TTL: float = 5  # Сколько секунд ответ провайдера о статусе считается свежим
+
+        # Прием уведомлений провайдера (LOLZ_CALLBACK_URL должен вести сюда)
+        self.PAYMENT_WEBHOOK_ENABLED: bool = self._get_bool('PAYMENT_WEBHOOK_ENABLED', default=bool(self.LOLZ_CALLBACK_URL))
+        self.PAYMENT_WEBHOOK_HOST: str = self._get_env_var('PAYMENT_WEBHOOK_HOST', default='0.0.0.0')
+        self.PAYMENT_WEBHOOK_PORT: int = int(self._get_env_var('PAYMENT_WEBHOOK_PORT', default='8081'))
+        self.PAYMENT_WEBHOOK_PATH: str = self._get_env_var('PAYMENT_WEBHOOK_PATH', default='/payments/callback')
+        self.PAYMENT_RECONCILE_MIN: int = 10 * 60  # Пауза сверки при работающих уведомлениях, секунд
         
         # Настройки обработки видео
-        self.VIDEO_PRICE: int = 30  # Стоимость обработки в рублях
+        self.VIDEO_PRICE: int = 30  # Стоимость обработки в рублях (тариф по умолчанию)
         self.MAX_VIDEO_SIZE: int = 1024 * 1024 * 1024  # 1GB
         self.ALLOWED_EXTENSIONS: Set[str] = {'mp4', 'mov', 'avi', 'mkv'}
         self.TEMP_DIR: Path = Path('temp_files')
         self.PROCESSED_DIR: Path = Path('processed_videos')
+
+        # Тарифы качества: профиль кодирования, лимиты и цена
+        # priority - чем меньше, тем раньше задача попадает в обработку
+        self.QUALITY_TIERS: Dict[str, dict] = {
+            'fast': {
+                'title': '⚡ Fast (720p)',
+                'preset': 'veryfast',
+                'crf': 26,
+                'max_height': 720,
+                'max_fps': 30,
+                'price': 15,
+                'priority': 2,
+            },
+            'standard': {
+                'title': '🎯 Standard (1080p)',
+                'preset': 'medium',
+                'crf': 23,
+                'max_height': 1080,
+                'max_fps': 30,
+                'price': self.VIDEO_PRICE,
+                'priority': 1,
+            },
+            'premium': {
+                'title': '💎 Premium (исходное качество)',
+                'preset': 'slow',
+                'crf': 20,
+                'max_height': None,
+                'max_fps': 60,
+                'price': 60,
+                'priority': 0,
+            },
+        }
+        self.DEFAULT_TIER: str = self._get_env_var('DEFAULT_TIER', default='standard')
+
+        # Уровни силы эффектов комнат: от самого слабого к самому сильному
+        self.EFFECT_LEVELS: Dict[str, List[dict]] = {
+            'crocodile': [
+                {'contrast': 1.03, 'saturation': 1.05, 'brightness': 0.01, 'blur': 0.3},
+                {'contrast': 1.05, 'saturation': 1.1, 'brightness': 0.03, 'blur': 0.5},
+                {'contrast': 1.1, 'saturation': 1.2, 'brightness': 0.05, 'blur': 0.8},
+            ],
+            'dolphin': [
+                {'noise': 5, 'scale': 0.98},
+                {'noise': 10, 'scale': 0.97},
+                {'noise': 20, 'scale': 0.95},
+            ],
+            'grizzly': [
+                {'slow': 0.95, 'fast': 1.05, 'cut': 0.05},
+                {'slow': 0.9, 'fast': 1.1, 'cut': 0.07},
+                {'slow': 0.8, 'fast': 1.2, 'cut': 0.1},
+            ],
+        }
+        # Используемый уровень для каждой комнаты (по умолчанию - самый сильный)
+        self.EFFECT_LEVEL: Dict[str, int] = {
+            method: len(levels) - 1 for method, levels in self.EFFECT_LEVELS.items()
+        }
+        # Минимальная доля различающихся битов pHash между исходником и результатом
+        self.UNIQUENESS_THRESHOLD: float = float(self._get_env_var('UNIQUENESS_THRESHOLD', default='0.25'))
+        self.VIDEO_WORKERS: int = int(self._get_env_var('VIDEO_WORKERS', default='2'))
+        self.FFMPEG_THREADS: int = int(self._get_env_var('FFMPEG_THREADS', default='2'))  # Потоков на одну задачу
+
+        # Пакетная обработка (альбомы и серии видео)
+        self.BATCH_WINDOW: float = float(self._get_env_var('BATCH_WINDOW', default='2.0'))  # Секунд ожидания следующего видео
+        self.MAX_BATCH_SIZE: int = 10  # Не больше одного альбома Telegram
         
         # Настройки кэширования
         self.CACHE_TTL: int = 24 * 3600  # 24 часа в секундах
+        self.CLEANUP_INTERVAL: int = 3600  # Период очистки временных файлов, секунд
         self.CACHE_MAX_SIZE: int = 10 * 1024 * 1024 * 1024  # 10GB
         
+        # Кэш пользователей в памяти процесса
+        self.USER_CACHE_SIZE: int = 50_000
+        self.USER_CACHE_TTL: int = 300  # Секунд до повторного чтения из БД
+        self.USER_FLUSH_INTERVAL: int = 30  # Период пакетной записи last_active и профиля
+        
+        # Агрегаты для админ-панели
+        self.ROLLUP_INTERVAL: int = 300  # Период работы агрегатора, секунд
+        self.ROLLUP_RECOMPUTE_HOURS: int = 24  # Окно пересчета (платежи меняют статус до 24 ч)
+        
         # Бонусная система
         self.START_BONUS: int = 50  # Стартовый бонус для новых пользователей
         self.REFERRAL_BONUS: int = 30  # Бонус за приглашенного пользователя
+        self.NOTIFY_WINDOW: float = 3  # Сколько секунд копить уведомления получателя в одно сообщение
         
         # Настройки вебхуков (если используются)
         self.WEBHOOK_HOST: Optional[str] = self._get_env_var('WEBHOOK_HOST')
         self.WEBHOOK_PATH: str = self._get_env_var('WEBHOOK_PATH', default='/webhook')
         self.WEBHOOK_SECRET: Optional[str] = self._get_env_var('WEBHOOK_SECRET')
+        self.WEBHOOK_LISTEN_HOST: str = self._get_env_var('WEBHOOK_LISTEN_HOST', default='0.0.0.0')
+        self.WEBHOOK_LISTEN_PORT: int = int(self._get_env_var('WEBHOOK_LISTEN_PORT', default='8080'))
+        self.WEBHOOK_CONCURRENCY: int = int(self._get_env_var('WEBHOOK_CONCURRENCY', default='32'))  # Обновлений одновременно
+        self.WEBHOOK_MAX_BACKLOG: int = 2000  # Принятых необработанных обновлений, дальше - 503
+        self.WEBHOOK_MAX_CONNECTIONS: int = 40  # Соединений Telegram к вебхуку
+        
+        # Лимиты исходящих сообщений Telegram
+        self.TG_GLOBAL_RATE: float = 28  # Сообщений в секунду на бота (лимит Telegram - 30)
+        self.TG_GLOBAL_BURST: int = 2
+        self.TG_CHAT_RATE: float = 1  # В личный чат
+        self.TG_CHAT_BURST: int = 3
+        self.TG_GROUP_RATE: float = 20 / 60  # В группу или канал
+        self.TG_GROUP_BURST: int = 3
+        self.TG_FLOOD_RETRIES: int = 3  # Повторов после ответа 429
+        
+        # Хранилище состояний диалогов (FSM)
+        self.FSM_STORAGE: str = self._get_env_var('FSM_STORAGE', default='db')  # db (основная БД), redis, memory
+        self.FSM_REDIS_URL: str = self._get_env_var('FSM_REDIS_URL', default='redis://localhost:6379/0')
+        self.FSM_TTL: int = 24 * 3600  # Брошенный диалог сбрасывается через сутки
+        self.FSM_CACHE_SIZE: int = 10_000
+        # Кэш процесса, секунд (0 - выключен). Только для одного процесса бота: несколько
+        # процессов за вебхуком читали бы из него состояние, уже измененное другим процессом
+        self.FSM_CACHE_TTL: int = int(self._get_env_var('FSM_CACHE_TTL', default='0'))
+        
+        # Рассылки (темп задают лимиты выше)
+        self.BROADCAST_PAGE: int = 1000  # Получателей на одну выборку по id
+        self.BROADCAST_CHUNK: int = 50  # Отправок между сохранениями прогресса
+        self.BROADCAST_PROGRESS_INTERVAL: int = 10  # Период обновления прогресса у администратора, секунд
+        
+        # Локальный Bot API сервер (telegram-bot-api --local): файлы до 2 ГБ без передачи по HTTP.
+        # Перед первым переключением бота нужно один раз вывести из api.telegram.org вручную
+        # (https://api.telegram.org/bot<BOT_TOKEN>/logOut) - сам бот logOut не вызывает.
+        # Результаты отправляются из TEMP_DIR и PROCESSED_DIR по file:// - сервер должен видеть
+        # эти каталоги; если они смонтированы у него по другому пути (Docker), пути задаются ниже
+        self.BOT_API_SERVER: Optional[str] = self._get_env_var('BOT_API_SERVER')  # Например, http://localhost:8082
+        self.BOT_API_SERVER_DIR: Path = Path(self._get_env_var('BOT_API_SERVER_DIR', default='/var/lib/telegram-bot-api'))
+        self.BOT_API_FILES_DIR: Path = Path(self._get_env_var('BOT_API_FILES_DIR', default=str(self.BOT_API_SERVER_DIR)))  # Тот же каталог у бота
+        self.BOT_API_TEMP_DIR: Path = Path(self._get_env_var('BOT_API_TEMP_DIR', default=str(self.TEMP_DIR.resolve())))  # TEMP_DIR у сервера
+        self.BOT_API_PROCESSED_DIR: Path = Path(self._get_env_var('BOT_API_PROCESSED_DIR', default=str(self.PROCESSED_DIR.resolve())))  # PROCESSED_DIR у сервера
         
         # Создаем необходимые директории
         self._setup_dirs()
@@ -76,6 +255,20 @@ class Config:
         except OSError as e:
             raise RuntimeError(f"Ошибка при создании директорий: {e}")
 
+    def get_tier(self, name: Optional[str]) -> dict:
+        """Параметры тарифа качества (тариф по умолчанию для неизвестных)"""
+        return self.QUALITY_TIERS.get(name) or self.QUALITY_TIERS[self.DEFAULT_TIER]
+
+    def get_effects(self, method: str) -> dict:
+        """Параметры эффектов комнаты для текущего уровня силы"""
+        levels = self.EFFECT_LEVELS[method]
+        return levels[min(self.EFFECT_LEVEL.get(method, len(levels) - 1), len(levels) - 1)]
+
+    @property
+    def min_video_price(self) -> int:
+        """Минимальная цена обработки среди всех тарифов"""
+        return min(tier['price'] for tier in self.QUALITY_TIERS.values())
+
     @property
     def webhook_url(self) -> Optional[str]:
         """Полный URL вебхука"""
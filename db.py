@@ -9,68 +9,133 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Определяем модели для инициализации
-DB_MODELS = ["database.models"]
-if config.USE_MIGRATIONS:
-    DB_MODELS.append("aerich.models")  # Добавляем только если используются миграции
-
-TORTOISE_ORM = {
-    "connections": {
-        "default": {
-            "engine": "tortoise.backends.sqlite",
-            "credentials": {
-                "file_path": str(config.DB_PATH),
-                "journal_mode": "WAL",
-                "timeout": 30,
-            }
+DB_MODELS = list(config.DB_MODELS)
+
+def sqlite_connection(file_path: Path) -> dict:
+    """Соединение SQLite (один процесс)"""
+    return {
+        "engine": "tortoise.backends.sqlite",
+        "credentials": {
+            "file_path": str(file_path),
+            "journal_mode": "WAL",
+            # Остальные параметры Tortoise передает как PRAGMA
+            **config.SQLITE_PRAGMAS,
         }
-    },
-    "apps": {
-        "models": {
-            "models": ["database.models"],
-            "default_connection": "default",
+    }
+
+def postgres_connection() -> dict:
+    """Пул соединений PostgreSQL (несколько процессов бота и воркеров)"""
+    return {
+        "engine": "tortoise.backends.asyncpg",
+        "credentials": {
+            "host": config.DB_HOST,
+            "port": config.DB_PORT,
+            "user": config.DB_USER,
+            "password": config.DB_PASSWORD,
+            "database": config.DB_NAME,
+            "minsize": config.DB_POOL_MIN,
+            "maxsize": config.DB_POOL_MAX,
+            # Зависший запрос не держит соединение пула бесконечно
+            "server_settings": {"statement_timeout": str(config.DB_STATEMENT_TIMEOUT)},
+            "application_name": "video_bot",
         }
-    },
-    "use_tz": True,
-    "timezone": "UTC",
-}
+    }
+
+def orm_config(connection: dict) -> dict:
+    """Конфигурация Tortoise с общим набором моделей"""
+    return {
+        "connections": {"default": connection},
+        "apps": {
+            "models": {
+                "models": DB_MODELS,
+                "default_connection": "default",
+            }
+        },
+        "use_tz": True,
+        "timezone": "UTC",
+    }
+
+if config.DB_ENGINE == "postgres":
+    TORTOISE_ORM = orm_config(postgres_connection())
+elif config.DB_ENGINE == "sqlite":
+    TORTOISE_ORM = orm_config(sqlite_connection(config.DB_PATH))
+else:
+    raise ConfigurationError(f"Unknown DB_ENGINE: {config.DB_ENGINE}")
+
+def dialect() -> str:
+    """Диалект подключенной БД: sqlite или postgres"""
+    return Tortoise.get_connection("default").capabilities.dialect
+
+def placeholders(query: str, db_dialect: str = None) -> str:
+    """Параметры пишутся как ?, для PostgreSQL заменяются на $1, $2, ..."""
+    if (db_dialect or dialect()) != "postgres":
+        return query
+    parts = query.split("?")
+    return "".join(
+        part + (f"${index}" if index < len(parts) else "")
+        for index, part in enumerate(parts, start=1)
+    )
 
 async def init_db():
-    """Инициализация БД с гарантированным созданием таблиц"""
+    """
+    Подключение к существующей БД (данные сохраняются между перезапусками),
+    применение недостающих миграций и быстрая проверка схемы.
+    """
     try:
-        # Удаляем старую БД если существует (для теста)
-        if config.DB_PATH.exists():
-            config.DB_PATH.unlink()
-        
-        # Создаем директорию
-        config.DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-        
-        logger.info(f"Initializing database at {config.DB_PATH}")
-        
+        if config.DB_ENGINE == "sqlite":
+            # Создаем директорию
+            config.DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+            location = config.DB_PATH
+        else:
+            location = f"{config.DB_HOST}:{config.DB_PORT}/{config.DB_NAME}"
+
         # Инициализация Tortoise
         await Tortoise.init(config=TORTOISE_ORM)
-        
-        # Принудительное создание таблиц
-        await Tortoise.generate_schemas()
-        
-        logger.info("Database tables created successfully")
-        
-        # Проверяем существование таблицы users
-        if not await check_table_exists("users"):
-            raise DBConnectionError("Failed to create users table")
-            
+
+        fresh = not await check_table_exists("users")
+        logger.info(f"Initializing {config.DB_ENGINE} database at {location} ({'new' if fresh else 'existing'})")
+
+        if config.USE_MIGRATIONS:
+            from database.migrations import migrate
+            await migrate(fresh)
+        else:
+            # Только создание отсутствующих таблиц и индексов
+            await Tortoise.generate_schemas(safe=True)
+
+        missing = await verify_schema()
+        if missing:
+            raise DBConnectionError(f"Database schema is incomplete, missing tables: {', '.join(missing)}")
+
+        logger.info("Database is ready")
+
     except Exception as e:
         logger.error(f"Database initialization failed: {e}")
         raise
 
+_TABLES_SQL = {
+    "sqlite": "SELECT name FROM sqlite_master WHERE type='table'",
+    "postgres": "SELECT table_name AS name FROM information_schema.tables WHERE table_schema = current_schema()",
+}
+
+async def verify_schema() -> list:
+    """Таблицы моделей, отсутствующие в БД (один запрос к каталогу)"""
+    _, rows = await execute_query(_TABLES_SQL[dialect()])
+    existing = {row["name"] for row in rows}
+    expected = {
+        model._meta.db_table
+        for app in Tortoise.apps.values()
+        for model in app.values()
+    }
+    return sorted(expected - existing)
+
 async def check_table_exists(table_name: str) -> bool:
     """Проверка существования таблицы"""
     try:
-        conn = Tortoise.get_connection("default")
-        tables = await conn.execute_query(
-            "SELECT name FROM sqlite_master WHERE type='table' AND name=?;",
+        _, rows = await execute_query(
+            f"SELECT name FROM ({_TABLES_SQL[dialect()]}) AS tables WHERE name = ?",
             [table_name]
         )
-        return len(tables) > 0
+        return len(rows) > 0
     except Exception as e:
         logger.error(f"Table check failed: {e}")
         return False
@@ -93,11 +158,11 @@ def register_db(app):
         logger.error(f"Failed to register Tortoise ORM: {e}")
         raise
 
-async def execute_query(query: str, params: dict = None):
-    """Безопасное выполнение SQL запроса с обработкой ошибок"""
+async def execute_query(query: str, params: list = None):
+    """Безопасное выполнение SQL запроса с обработкой ошибок (параметры - ?)"""
     try:
         conn = Tortoise.get_connection("default")
-        result = await conn.execute_query(query, params)
+        result = await conn.execute_query(placeholders(query, conn.capabilities.dialect), params)
         return result
     except Exception as e:
         logger.error(f"Query execution failed: {e}\nQuery: {query}")
@@ -114,15 +179,9 @@ async def health_check():
         return False
 
 async def backup_db(backup_path: Path):
-    """Создание резервной копии базы данных"""
-    try:
-        import shutil
-        shutil.copy2(config.DB_PATH, backup_path)
-        logger.info(f"Database backup created at {backup_path}")
-        return True
-    except Exception as e:
-        logger.error(f"Backup failed: {e}")
-        return False
+    """Создание резервной копии базы данных (онлайн, без блокировки event loop)"""
+    from services.backup import backup_service
+    return await backup_service.backup(backup_path) is not None
 
 if __name__ == '__main__':
     # Тестирование подключения к БД
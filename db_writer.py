@@ -0,0 +1,254 @@
+import asyncio
+import contextvars
+import logging
+import time
+from typing import Awaitable, Callable, List, Optional, Tuple, TypeVar
+
+from tortoise import Tortoise
+from tortoise.backends.base.client import BaseDBAsyncClient, TransactionContext
+from tortoise.backends.sqlite.client import TransactionWrapper
+from tortoise.transactions import in_transaction
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+WriteFunc = Callable[[BaseDBAsyncClient], Awaitable[T]]
+
+# Метка остановки в очереди: записи, поставленные раньше нее, фиксируются
+_STOP = object()
+
+# Соединение пакета, в котором выполняется текущая запись
+_batch_connection: contextvars.ContextVar[Optional[BaseDBAsyncClient]] = \
+    contextvars.ContextVar('batch_connection', default=None)
+# Действия текущей записи, выполняемые после фиксации
+_after_commit: contextvars.ContextVar[Optional[List[Callable[[], None]]]] = \
+    contextvars.ContextVar('after_commit', default=None)
+
+def _run_callbacks(callbacks: List[Callable[[], None]]):
+    for callback in callbacks:
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"After-commit callback failed: {e}")
+
+class _ImmediateTransaction(TransactionWrapper):
+    """
+    Транзакция SQLite, берущая блокировку записи сразу (BEGIN IMMEDIATE).
+    Обычный BEGIN откладывает блокировку до первой записи, и ожидание
+    другого писателя (бэкап, воркер) растворялось бы в выполнении записей пакета
+    """
+
+    async def start(self) -> None:
+        await self._connection.commit()
+        await self._connection.execute("BEGIN IMMEDIATE")
+
+class WriteMetrics:
+    """Размер пакетов и ожидание блокировки записи"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.batches = 0
+        self.writes = 0
+        self.failed = 0
+        self.max_batch = 0
+        self.lock_wait = 0.0
+        self.max_lock_wait = 0.0
+        self.queue_wait = 0.0
+
+    def record(self, size: int, failed: int, lock_wait: float, queue_wait: float):
+        self.batches += 1
+        self.writes += size
+        self.failed += failed
+        self.max_batch = max(self.max_batch, size)
+        self.lock_wait += lock_wait
+        self.max_lock_wait = max(self.max_lock_wait, lock_wait)
+        self.queue_wait += queue_wait
+
+    def snapshot(self) -> dict:
+        batches = self.batches or 1
+        return {
+            'batches': self.batches,
+            'writes': self.writes,
+            'failed': self.failed,
+            'avg_batch': round(self.writes / batches, 2),
+            'max_batch': self.max_batch,
+            'avg_lock_wait_ms': round(self.lock_wait / batches * 1000, 2),
+            'max_lock_wait_ms': round(self.max_lock_wait * 1000, 2),
+            'avg_queue_wait_ms': round(self.queue_wait / (self.writes or 1) * 1000, 2),
+        }
+
+class WriteCoordinator:
+    """
+    Групповая фиксация записей в режиме SQLite.
+    Мелкие транзакции обработчиков выполняются одной фоновой задачей:
+    каждая - в своей точке сохранения, а весь пакет фиксируется одним COMMIT.
+    Ошибка одной записи откатывает только ее точку сохранения.
+    В режиме PostgreSQL (или при выключенной опции) запись - обычная транзакция.
+    """
+
+    def __init__(self):
+        self.enabled = config.DB_WRITE_COALESCING and config.DB_ENGINE == 'sqlite'
+        self.batch_max = config.DB_WRITE_BATCH_MAX
+        self.window = config.DB_WRITE_BATCH_WINDOW
+        self.metrics = WriteMetrics()
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    async def transaction(self, func: WriteFunc) -> T:
+        """Выполнение func(conn) в транзакции; результат возвращается после фиксации"""
+        conn = _batch_connection.get()
+        if conn is not None:
+            # Вложенная запись из другой записи пакета
+            return await func(conn)
+
+        if not self.enabled or self._stopping:
+            # При остановке фоновая задача уже не берет записи из очереди
+            outer = _after_commit.get()
+            callbacks = []
+            token = _after_commit.set(callbacks)
+            try:
+                async with in_transaction() as conn:
+                    result = await func(conn)
+            finally:
+                _after_commit.reset(token)
+            if outer is not None:
+                # Вложенная транзакция фиксируется вместе с внешней
+                outer.extend(callbacks)
+            else:
+                _run_callbacks(callbacks)
+            return result
+
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((func, future, time.perf_counter()))
+        return await future
+
+    @staticmethod
+    def after_commit(callback: Callable[[], None]):
+        """
+        Вызов callback после фиксации текущей записи (например, сброс кэша).
+        При откате записи не вызывается; вне транзакции db_writer - вызывается сразу
+        """
+        callbacks = _after_commit.get()
+        if callbacks is None:
+            callback()
+        else:
+            callbacks.append(callback)
+
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            self._queue = self._queue or asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+    async def _run(self):
+        last_report = time.monotonic()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            try:
+                stopping = self._drain(batch)
+                if len(batch) == 1 and self.window and not stopping:
+                    # Одиночная запись ждет попутчиков не дольше окна
+                    await asyncio.sleep(self.window)
+                    stopping = self._drain(batch)
+
+                await self._commit(batch)
+            except asyncio.CancelledError:
+                # Задачу все же отменили (например, при остановке цикла событий):
+                # транзакция откатилась, вызывающие получают ошибку, а не вечное ожидание
+                error = RuntimeError("DB write was cancelled before commit")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                raise
+
+            if time.monotonic() - last_report >= 60:
+                logger.info(f"DB writer: {self.metrics.snapshot()}")
+                last_report = time.monotonic()
+
+    def _drain(self, batch: List[Tuple]) -> bool:
+        """Добор записей из очереди в пакет; True - встретилась метка остановки"""
+        while len(batch) < self.batch_max and not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is _STOP:
+                return True
+            batch.append(item)
+        return False
+
+    async def _commit(self, batch: List[Tuple]):
+        results = []
+        started = time.perf_counter()
+        lock_wait = 0.0
+        try:
+            # Время входа - ожидание блокировки записи (в процессе и между процессами)
+            async with TransactionContext(_ImmediateTransaction(Tortoise.get_connection("default"))) as conn:
+                lock_wait = time.perf_counter() - started
+                token = _batch_connection.set(conn)
+                try:
+                    for index, (func, future, _) in enumerate(batch):
+                        if future.done():
+                            # Вызывающий уже отменил ожидание
+                            continue
+                        await conn.execute_query(f"SAVEPOINT write_{index}")
+                        callbacks = []
+                        callbacks_token = _after_commit.set(callbacks)
+                        try:
+                            result = await func(conn)
+                        except Exception as e:
+                            await conn.execute_query(f"ROLLBACK TO write_{index}")
+                            results.append((future, None, e, []))
+                        else:
+                            results.append((future, result, None, callbacks))
+                        finally:
+                            _after_commit.reset(callbacks_token)
+                        await conn.execute_query(f"RELEASE write_{index}")
+                finally:
+                    _batch_connection.reset(token)
+        except Exception as e:
+            logger.error(f"DB write batch of {len(batch)} failed: {e}")
+            results = [(future, None, e, []) for _, future, _ in batch]
+
+        queue_wait = sum(started - queued for _, _, queued in batch)
+        failed = sum(1 for _, _, error, _ in results if error is not None)
+        self.metrics.record(len(batch), failed, lock_wait, queue_wait)
+
+        for future, result, error, callbacks in results:
+            _run_callbacks(callbacks)
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    async def close(self):
+        """
+        Остановка фоновой задачи: она фиксирует текущий пакет и всю очередь
+        и завершается сама. Записи после вызова идут обычными транзакциями
+        """
+        if self._worker is None:
+            return
+        self._stopping = True
+        if not self._worker.done():
+            await self._queue.put(_STOP)
+            # Без отмены: прерванный COMMIT потерял бы уже принятые записи
+            await asyncio.shield(self._worker)
+        # Очередь задачи, завершившейся раньше (например, в другом цикле событий)
+        while not self._queue.empty():
+            batch = []
+            self._drain(batch)
+            if batch:
+                await self._commit(batch)
+        self._stopping = False
+        self._worker = None
+
+# Глобальный экземпляр для использования в системе
+db_writer = WriteCoordinator()
\ No newline at end of file
@@ -0,0 +1,66 @@
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Awaitable, Callable, DefaultDict, List, NamedTuple, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# --- События предметной области: публикуются после фиксации записи ---
+
+class ReferralCreated(NamedTuple):
+    referrer_id: int
+    user_id: int
+    bonus: Decimal
+
+class PaymentCredited(NamedTuple):
+    user_id: int
+    payment_id: int
+    amount: Decimal
+    notify: bool = True  # False - пользователь уже видит зачисление (кнопка проверки оплаты)
+
+class VideoCompleted(NamedTuple):
+    user_id: int
+    method: str
+    tier: str
+    count: int
+    spent: Decimal
+
+class TicketOpened(NamedTuple):
+    ticket_id: int
+    user_id: int
+    username: Optional[str]
+    text: str
+    created_at: datetime
+
+Handler = Callable[[Any], Awaitable[None]]
+
+class EventBus:
+    """
+    Шина событий внутри процесса.
+    Обработчики выполняются фоновыми задачами и не задерживают код,
+    опубликовавший событие; ошибка обработчика только логируется.
+    """
+
+    def __init__(self):
+        self._handlers: DefaultDict[type, List[Handler]] = defaultdict(list)
+        self._tasks: Set[asyncio.Task] = set()
+
+    def subscribe(self, event_type: type, handler: Handler):
+        self._handlers[event_type].append(handler)
+
+    def publish(self, event: NamedTuple):
+        for handler in self._handlers.get(type(event), []):
+            task = asyncio.create_task(self._call(handler, event))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _call(self, handler: Handler, event: NamedTuple):
+        try:
+            await handler(event)
+        except Exception as e:
+            logger.error(f"{type(event).__name__} handler {handler.__qualname__} failed: {e}", exc_info=True)
+
+# Глобальный экземпляр для использования в системе
+event_bus = EventBus()
@@ -0,0 +1,113 @@
+import asyncio
+import logging
+from dataclasses import astuple
+from datetime import timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from cachetools import TTLCache
+from tortoise import timezone
+
+from config import config
+from database.models import FsmRecord
+from services.db_writer import db_writer
+
+logger = logging.getLogger(__name__)
+
+Record = Tuple[Optional[str], Dict[str, Any]]  # (состояние, данные)
+
+class DatabaseStorage(BaseStorage):
+    """
+    Состояния диалогов в основной БД (SQLite или PostgreSQL) - переживают
+    перезапуск и доступны всем процессам бота.
+    Записи идут сразу в БД (через db_writer, мелкие записи фиксируются пачками).
+    Чтения по умолчанию тоже идут в БД; LRU-кэш процесса (FSM_CACHE_TTL)
+    включается только при одном процессе бота.
+    Диалог, не менявшийся FSM_TTL секунд, считается брошенным и сбрасывается.
+    """
+
+    def __init__(self):
+        self.ttl = timedelta(seconds=config.FSM_TTL)
+        self._cache: Optional[TTLCache] = \
+            TTLCache(maxsize=config.FSM_CACHE_SIZE, ttl=config.FSM_CACHE_TTL) if config.FSM_CACHE_TTL else None
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return ":".join("" if part is None else str(part) for part in astuple(key))
+
+    async def _get(self, key: str) -> Record:
+        if self._cache is not None and key in self._cache:
+            return self._cache[key]
+
+        row = await FsmRecord.get_or_none(key=key)
+        if row is None or row.updated_at < timezone.now() - self.ttl:
+            record = (None, {})
+        else:
+            record = (row.state, row.data or {})
+        if self._cache is not None:
+            self._cache[key] = record
+        return record
+
+    async def _write(self, key: str, state: Optional[str], data: Dict[str, Any]):
+        async def write(conn):
+            if state is None and not data:
+                # Пустой диалог не хранится
+                await FsmRecord.filter(key=key).using_db(conn).delete()
+                return
+            updated = await FsmRecord.filter(key=key).using_db(conn) \
+                .update(state=state, data=data, updated_at=timezone.now())
+            if not updated:
+                await FsmRecord.create(key=key, state=state, data=data, using_db=conn)
+
+        await db_writer.transaction(write)
+        if self._cache is not None:
+            self._cache[key] = (state, data)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key = self._key(key)
+        _, data = await self._get(storage_key)
+        await self._write(storage_key, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._get(self._key(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        storage_key = self._key(key)
+        state, _ = await self._get(storage_key)
+        await self._write(storage_key, state, data.copy())
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._get(self._key(key))
+        return data.copy()
+
+    async def close(self) -> None:
+        pass
+
+    async def cleanup(self) -> int:
+        """Удаление брошенных диалогов"""
+        deleted = await FsmRecord.filter(updated_at__lt=timezone.now() - self.ttl).delete()
+        if deleted:
+            logger.info(f"Removed {deleted} expired FSM states")
+        return deleted
+
+    async def run_periodic_cleanup(self):
+        """Фоновая очистка раз в час"""
+        while True:
+            try:
+                await self.cleanup()
+            except Exception as e:
+                logger.error(f"FSM cleanup failed: {e}")
+            await asyncio.sleep(3600)
+
+def create_storage() -> BaseStorage:
+    """Хранилище FSM по FSM_STORAGE: db, redis или memory"""
+    if config.FSM_STORAGE == 'memory':
+        return MemoryStorage()
+    if config.FSM_STORAGE == 'redis':
+        # Нужен пакет redis; подходит и совместимый сервер (KeyDB, Dragonfly, Valkey)
+        from aiogram.fsm.storage.redis import RedisStorage
+        return RedisStorage.from_url(config.FSM_REDIS_URL, state_ttl=config.FSM_TTL, data_ttl=config.FSM_TTL)
+    return DatabaseStorage()
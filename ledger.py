@@ -0,0 +1,105 @@
+import logging
+from decimal import Decimal
+from typing import Optional, Union
+
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.exceptions import IntegrityError
+
+from database.models import LedgerEntry, LedgerKind
+from services.db_writer import db_writer
+from services.user_cache import user_cache
+
+logger = logging.getLogger(__name__)
+
+Amount = Union[int, float, Decimal]
+
+class InsufficientFunds(Exception):
+    """Недостаточно средств для списания"""
+
+class Ledger:
+    """
+    Изменение баланса одним условным UPDATE с записью в журнал
+    в той же транзакции. Повторный вызов с тем же idempotency_key
+    ничего не меняет.
+    """
+
+    # В SQLite DecimalField хранится как VARCHAR, поэтому нужен CAST.
+    # Для asyncpg запрос, начинающийся с UPDATE, Tortoise выполняет без
+    # чтения строк, поэтому RETURNING читается через CTE
+    _SQL = {
+        'sqlite': (
+            "UPDATE users SET balance = ROUND(CAST(balance AS NUMERIC) + ?, 2) "
+            "WHERE id = ? AND CAST(balance AS NUMERIC) + ? >= 0 RETURNING balance"
+        ),
+        'postgres': (
+            "WITH updated AS (UPDATE users SET balance = balance + $1 "
+            "WHERE id = $2 AND balance + $3 >= 0 RETURNING balance) SELECT balance FROM updated"
+        ),
+    }
+
+    async def credit(self, user_id: int, amount: Amount, kind: LedgerKind,
+                     description: str = None, idempotency_key: str = None,
+                     connection: BaseDBAsyncClient = None) -> Optional[Decimal]:
+        """Зачисление. Возвращает новый баланс или None, если ключ уже применен"""
+        return await self._apply(user_id, Decimal(str(amount)), kind, description, idempotency_key, connection)
+
+    async def debit(self, user_id: int, amount: Amount, kind: LedgerKind,
+                    description: str = None, idempotency_key: str = None,
+                    connection: BaseDBAsyncClient = None) -> Optional[Decimal]:
+        """Списание. Бросает InsufficientFunds, если баланса не хватает"""
+        return await self._apply(user_id, -Decimal(str(amount)), kind, description, idempotency_key, connection)
+
+    async def _apply(self, user_id: int, delta: Decimal, kind: LedgerKind,
+                     description: Optional[str], idempotency_key: Optional[str],
+                     connection: Optional[BaseDBAsyncClient]) -> Optional[Decimal]:
+        try:
+            if connection is not None:
+                # Внутри внешней транзакции (например, подтверждение платежа).
+                # Точка сохранения: повтор ключа не должен оставить измененный баланс
+                await connection.execute_query("SAVEPOINT ledger")
+                try:
+                    balance = await self._execute(connection, user_id, delta, kind, description, idempotency_key)
+                except Exception:
+                    await connection.execute_query("ROLLBACK TO SAVEPOINT ledger")
+                    raise
+                finally:
+                    await connection.execute_query("RELEASE SAVEPOINT ledger")
+            else:
+                balance = await db_writer.transaction(
+                    lambda conn: self._execute(conn, user_id, delta, kind, description, idempotency_key)
+                )
+        except IntegrityError:
+            if idempotency_key is None:
+                raise
+            logger.info(f"Ledger key already applied: {idempotency_key}")
+            return None
+
+        return balance
+
+    async def _execute(self, conn: BaseDBAsyncClient, user_id: int, delta: Decimal,
+                       kind: LedgerKind, description: Optional[str],
+                       idempotency_key: Optional[str]) -> Decimal:
+        """UPDATE баланса и запись журнала на одном соединении"""
+        dialect = conn.capabilities.dialect
+        value = str(delta) if dialect == 'sqlite' else delta
+        _, rows = await conn.execute_query(self._SQL[dialect], [value, user_id, value])
+        if not rows:
+            raise InsufficientFunds(f"User {user_id} cannot be charged {-delta}")
+
+        balance = Decimal(str(rows[0]['balance'])).quantize(Decimal('0.01'))
+        await LedgerEntry.create(
+            user_id=user_id,
+            amount=delta,
+            balance_after=balance,
+            kind=kind,
+            description=description,
+            idempotency_key=idempotency_key,
+            using_db=conn
+        )
+        # Сброс кэша до фиксации позволил бы параллельному промаху
+        # закэшировать баланс до изменения
+        db_writer.after_commit(lambda: user_cache.invalidate(user_id))
+        return balance
+
+# Глобальный экземпляр для использования в системе
+ledger = Ledger()
\ No newline at end of file
@@ -1,9 +1,9 @@
 import asyncio
 import logging
+from typing import List
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.utils.callback_answer import CallbackAnswerMiddleware
 from middlewares import UserMiddleware, ThrottlingMiddleware
 
@@ -18,8 +18,19 @@ from handlers import (
     payments
 )
 from handlers.payments import payment_system
-from services.notifications import NotificationService
+from services.notifications import notifications
 from services.cleanup import file_cleanup
+from services.user_cache import user_cache
+from services.rollups import rollups
+from services.db_writer import db_writer
+from services.backup import backup_service
+from services.archive import archive
+from services import payment_webhook
+from services.bot_webhook import BotWebhook
+from services.bot_api import bot_session
+from services.telegram_limiter import telegram_limiter
+from services.broadcast import broadcasts
+from services.fsm_storage import DatabaseStorage, create_storage
 
 # Настройка логирования
 logging.basicConfig(
@@ -28,7 +39,19 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-async def on_startup(bot: Bot):
+# Периодические задачи пишут в БД - при остановке отменяются до закрытия записи
+background_tasks: List[asyncio.Task] = []
+
+def start_background(coro):
+    background_tasks.append(asyncio.create_task(coro))
+
+async def stop_background():
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+
+async def on_startup(bot: Bot, dispatcher: Dispatcher):
     """Действия при запуске бота"""
     try:
         # Инициализация БД
@@ -40,21 +63,39 @@ async def on_startup(bot: Bot):
         logger.info(f"Bot @{config.BOT_USERNAME} started")
         
         # Запуск фоновых задач
-        asyncio.create_task(payment_system.start_payment_checker(bot))
-        asyncio.create_task(NotificationService(bot).start_periodic_check())
-        asyncio.create_task(file_cleanup.run_periodic_cleanup())
+        notifications.start(bot)
+        start_background(payment_system.start_payment_checker())
+        start_background(file_cleanup.run_periodic_cleanup())
+        start_background(user_cache.run_periodic_flush())
+        start_background(rollups.run_periodic())
+        start_background(backup_service.run_periodic())
+        start_background(archive.run_periodic())
+        if isinstance(dispatcher.storage, DatabaseStorage):
+            start_background(dispatcher.storage.run_periodic_cleanup())
+        await broadcasts.resume(bot)
         
-        # Настройка платежного webhook (если используется)
-        if config.WEBHOOK_HOST:
-            await payment_system.setup_webhook()
+        # Прием уведомлений платежной системы (опрос остается сверкой)
+        if config.PAYMENT_WEBHOOK_ENABLED:
+            payment_webhook.callback_server.start()
         
     except Exception as e:
         logger.error(f"Startup error: {e}", exc_info=True)
         raise
 
-async def on_shutdown(bot: Bot):
+async def on_shutdown(bot: Bot, dispatcher: Dispatcher):
     """Действия при остановке бота"""
     try:
+        # Уведомления платежей пишут в БД - прием прекращается первым
+        await payment_webhook.callback_server.stop()
+        # Затем остальные источники записей: рассылки, статистика, архив, проверка платежей
+        await broadcasts.close()
+        await stop_background()
+        # Дописываем накопленные обновления пользователей до закрытия БД
+        await user_cache.flush()
+        await notifications.close()
+        await dispatcher.storage.close()
+        await db_writer.close()
+        await payment_system.close()
         await close_db()
         await bot.session.close()
         logger.info("Bot stopped gracefully")
@@ -81,10 +122,13 @@ async def main():
     # Инициализация бота с новым синтаксисом
     bot = Bot(
         token=config.BOT_TOKEN,
+        session=bot_session(),
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
+    bot.session.middleware(telegram_limiter)
     
-    storage = MemoryStorage()
+    # Состояния диалогов переживают перезапуск (FSM_STORAGE)
+    storage = create_storage()
     dp = Dispatcher(storage=storage)
     
     # Настройка middleware
@@ -99,19 +143,16 @@ async def main():
     dp.shutdown.register(on_shutdown)
     
     try:
-        # Запуск поллинга
-        await bot.delete_webhook(drop_pending_updates=True)
-        await dp.start_polling(bot)
+        if config.webhook_url:
+            # Обновления принимает встроенный HTTP-сервер
+            await BotWebhook(dp, bot).run()
+        else:
+            # Запуск поллинга
+            await bot.delete_webhook(drop_pending_updates=True)
+            await dp.start_polling(bot)
     finally:
         await bot.session.close()
 
-async def on_startup(bot: Bot):
-    try:
-        await init_db()
-    except Exception as e:
-        logger.error(f"Database initialization error: {e}")
-        raise
-
 if __name__ == "__main__":
     try:
         asyncio.run(main())
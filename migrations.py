@@ -0,0 +1,136 @@
+import logging
+import time
+from typing import Awaitable, Callable, List, NamedTuple
+
+from tortoise import Tortoise
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.transactions import in_transaction
+from tortoise.utils import get_schema_sql
+
+from database.db import placeholders
+
+logger = logging.getLogger(__name__)
+
+VERSION_TABLE = "schema_version"
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[[BaseDBAsyncClient], Awaitable[None]]
+
+async def column_exists(conn: BaseDBAsyncClient, table: str, column: str) -> bool:
+    """Проверка наличия колонки в таблице"""
+    if conn.capabilities.dialect == "postgres":
+        _, rows = await conn.execute_query(
+            "SELECT column_name AS name FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = $1",
+            [table]
+        )
+    else:
+        _, rows = await conn.execute_query(f"PRAGMA table_info({table})")
+    return any(row["name"] == column for row in rows)
+
+async def add_column(conn: BaseDBAsyncClient, table: str, column: str, definition: str):
+    """ALTER TABLE ADD COLUMN, если колонки еще нет (повторный запуск безопасен)"""
+    if not await column_exists(conn, table, column):
+        # execute_script в SQLite фиксирует открытую транзакцию, поэтому execute_query
+        await conn.execute_query(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+async def create_missing_tables(conn: BaseDBAsyncClient):
+    """Новые таблицы и индексы моделей (CREATE ... IF NOT EXISTS)"""
+    # generate_schemas выполняет SQL через execute_script (см. add_column), поэтому DDL
+    # идет по одному выражению через execute_query и откатывается вместе с миграцией
+    for statement in get_schema_sql(conn, safe=True).split(";\n"):
+        statement = statement.strip().rstrip(";")
+        if statement:
+            await conn.execute_query(statement)
+
+# --- Миграции: только добавляются в конец, номера не меняются ---
+
+async def _v1_tiers_ledger_stats(conn: BaseDBAsyncClient):
+    # База, созданная до миграций, содержит только исходные таблицы
+    await add_column(conn, "video_processing", "tier", "VARCHAR(16) NOT NULL DEFAULT 'standard'")
+    await create_missing_tables(conn)
+
+    from services.user_stats import user_stats
+    await user_stats.rebuild()
+
+async def _v2_archive_tables(conn: BaseDBAsyncClient):
+    await create_missing_tables(conn)
+
+async def _v3_payment_provider_fields(conn: BaseDBAsyncClient):
+    for table in ("payments", "payments_archive"):
+        await add_column(conn, table, "payment_id", "VARCHAR(64)")
+        await add_column(conn, table, "currency", "VARCHAR(8) NOT NULL DEFAULT 'RUB'")
+        await add_column(conn, table, "description", "VARCHAR(255)")
+    await conn.execute_query(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uid_payments_payment_id ON payments (payment_id)"
+    )
+
+async def _v4_pending_payments_index(conn: BaseDBAsyncClient):
+    await create_missing_tables(conn)
+
+async def _v5_broadcasts(conn: BaseDBAsyncClient):
+    await create_missing_tables(conn)
+
+async def _v6_fsm_states(conn: BaseDBAsyncClient):
+    await create_missing_tables(conn)
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "quality tiers, balance ledger, user stats, rollups, indexes", _v1_tiers_ledger_stats),
+    Migration(2, "archive tables for videos, payments, ticket messages, referrals", _v2_archive_tables),
+    Migration(3, "provider payment id, currency and description on payments", _v3_payment_provider_fields),
+    Migration(4, "payments (status, id) index for the pending checker", _v4_pending_payments_index),
+    Migration(5, "broadcasts with resumable progress", _v5_broadcasts),
+    Migration(6, "persistent FSM states", _v6_fsm_states),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version if MIGRATIONS else 0
+
+async def get_version(conn: BaseDBAsyncClient) -> int:
+    """Текущая версия схемы (0 - таблица версий отсутствует)"""
+    await conn.execute_script(
+        f"CREATE TABLE IF NOT EXISTS {VERSION_TABLE} ("
+        "version INT NOT NULL PRIMARY KEY, description VARCHAR(255), applied_at TIMESTAMP)"
+    )
+    _, rows = await conn.execute_query(f"SELECT MAX(version) AS version FROM {VERSION_TABLE}")
+    return (rows[0]["version"] if rows else None) or 0
+
+async def _stamp(conn: BaseDBAsyncClient, migration: Migration):
+    await conn.execute_query(
+        placeholders(
+            f"INSERT INTO {VERSION_TABLE} (version, description, applied_at) VALUES (?, ?, CURRENT_TIMESTAMP)",
+            conn.capabilities.dialect
+        ),
+        [migration.version, migration.description]
+    )
+
+async def migrate(fresh: bool) -> int:
+    """
+    Приведение схемы к последней версии.
+    Новая база создается целиком и помечается последней версией,
+    существующая получает только недостающие миграции.
+    """
+    started = time.perf_counter()
+    conn = Tortoise.get_connection("default")
+    version = await get_version(conn)
+
+    if fresh:
+        async with in_transaction() as tx:
+            await create_missing_tables(tx)
+            for migration in MIGRATIONS:
+                await _stamp(tx, migration)
+        logger.info(f"Database schema created at version {LATEST_VERSION}")
+        return LATEST_VERSION
+
+    for migration in MIGRATIONS:
+        if migration.version <= version:
+            continue
+        logger.info(f"Applying migration {migration.version}: {migration.description}")
+        async with in_transaction() as tx:
+            await migration.apply(tx)
+            await _stamp(tx, migration)
+        version = migration.version
+
+    logger.info(f"Database schema at version {version} ({(time.perf_counter() - started) * 1000:.1f} ms)")
+    return version
\ No newline at end of file
@@ -24,6 +24,19 @@ class TicketStatus(str, Enum):
     ANSWERED = "answered"
     CLOSED = "closed"
 
+class BroadcastStatus(str, Enum):
+    RUNNING = "running"
+    DONE = "done"
+    CANCELLED = "cancelled"
+
+class LedgerKind(str, Enum):
+    DEPOSIT = "deposit"
+    VIDEO = "video"
+    REFUND = "refund"
+    REFERRAL_BONUS = "referral_bonus"
+    START_BONUS = "start_bonus"
+    ADMIN = "admin"
+
 class User(Model):
     """Модель пользователя Telegram"""
     id = fields.BigIntField(pk=True)
@@ -37,8 +50,8 @@ class User(Model):
     language_code = fields.CharField(max_length=8, default="ru")
     is_admin = fields.BooleanField(default=False)
     is_active = fields.BooleanField(default=True)
-    registered_at = fields.DatetimeField(auto_now_add=True)
-    last_active = fields.DatetimeField(auto_now=True)
+    registered_at = fields.DatetimeField(auto_now_add=True, index=True)
+    last_active = fields.DatetimeField(auto_now=True, index=True)
 
     class Meta:
         table = "users"
@@ -55,8 +68,11 @@ class User(Model):
 class Payment(Model):
     """Модель платежа"""
     id = fields.IntField(pk=True)
+    payment_id = fields.CharField(max_length=64, null=True, unique=True)  # ID платежа у провайдера
     user = fields.ForeignKeyField("models.User", related_name="payments")
     amount = fields.DecimalField(max_digits=10, decimal_places=2)
+    currency = fields.CharField(max_length=8, default="RUB")
+    description = fields.CharField(max_length=255, null=True)
     status = fields.CharEnumField(PaymentStatus, default=PaymentStatus.PENDING)
     created_at = fields.DatetimeField(auto_now_add=True)
     paid_at = fields.DatetimeField(null=True)
@@ -64,6 +80,12 @@ class Payment(Model):
     class Meta:
         table = "payments"
         ordering = ["-created_at"]
+        indexes = [
+            ("status", "created_at"),  # Платежи по статусу за период
+            ("status", "id"),          # Постраничный обход pending-платежей
+            ("user", "created_at"),    # Последний платеж пользователя
+            ("status", "paid_at"),     # Выручка за период
+        ]
 
     @classmethod
     async def create_payment(
@@ -85,6 +107,7 @@ class VideoProcessing(Model):
     id = fields.IntField(pk=True)
     user = fields.ForeignKeyField("models.User", related_name="videos", on_delete=fields.CASCADE)
     method = fields.CharField(max_length=20)  # crocodile, dolphin, grizzly
+    tier = fields.CharField(max_length=16, default="standard")  # fast, standard, premium
     status = fields.CharEnumField(VideoStatus, default=VideoStatus.QUEUED)
     original_file = fields.CharField(max_length=256)
     processed_file = fields.CharField(max_length=256, null=True)
@@ -97,6 +120,10 @@ class VideoProcessing(Model):
     class Meta:
         table = "video_processing"
         ordering = ["-created_at"]
+        indexes = [
+            ("user", "created_at"),  # История пользователя
+            ("created_at",),         # Агрегаты по интервалам
+        ]
 
     async def start_processing(self):
         """Обновление статуса при начале обработки"""
@@ -123,6 +150,7 @@ class SupportTicket(Model):
     class Meta:
         table = "support_tickets"
         ordering = ["-updated_at"]
+        indexes = [("user", "created_at")]
 
 class TicketMessage(Model):
     """Модель сообщений в тикете"""
@@ -136,6 +164,7 @@ class TicketMessage(Model):
     class Meta:
         table = "ticket_messages"
         ordering = ["created_at"]
+        indexes = [("ticket", "created_at")]
 
 class Referral(Model):
     """Модель реферальной системы с бонусами"""
@@ -149,6 +178,148 @@ class Referral(Model):
     class Meta:
         table = "referrals"
         unique_together = [("user", "referrer")]  # Уникальная пара
+        indexes = [
+            ("referrer", "created_at"),  # Рефералы пользователя
+            ("created_at",),             # Новые рефералы и агрегаты
+        ]
+
+class UserStats(Model):
+    """Счетчики профиля, обновляются в тех же транзакциях, что и исходные записи"""
+    user = fields.OneToOneField("models.User", related_name="stats", pk=True, on_delete=fields.CASCADE)
+    videos_count = fields.IntField(default=0)
+    videos_spent = fields.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    referrals_count = fields.IntField(default=0)
+    referral_income = fields.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    deposits_total = fields.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    updated_at = fields.DatetimeField(auto_now=True)
+
+    class Meta:
+        table = "user_stats"
+
+class StatsRollup(Model):
+    """Предагрегированные метрики по часовым и дневным интервалам"""
+    id = fields.IntField(pk=True)
+    period = fields.CharField(max_length=8)  # hour, day
+    bucket = fields.DatetimeField()  # Начало интервала
+    metric = fields.CharField(max_length=64)  # new_users, payments_paid_amount, videos:crocodile:completed, ...
+    value = fields.DecimalField(max_digits=16, decimal_places=2, default=Decimal('0.00'))
+
+    class Meta:
+        table = "stats_rollups"
+        unique_together = [("period", "bucket", "metric")]
+
+class LedgerEntry(Model):
+    """Журнал изменений баланса (зачисления > 0, списания < 0)"""
+    id = fields.IntField(pk=True)
+    user = fields.ForeignKeyField("models.User", related_name="ledger_entries", on_delete=fields.CASCADE)
+    amount = fields.DecimalField(max_digits=12, decimal_places=2)
+    balance_after = fields.DecimalField(max_digits=12, decimal_places=2)
+    kind = fields.CharEnumField(LedgerKind)
+    description = fields.CharField(max_length=128, null=True)
+    idempotency_key = fields.CharField(max_length=64, null=True, unique=True)
+    created_at = fields.DatetimeField(auto_now_add=True)
+
+    class Meta:
+        table = "balance_ledger"
+        ordering = ["-created_at"]
+        indexes = [("user", "created_at")]
+
+class Broadcast(Model):
+    """Рассылка копии сообщения администратора с сохраняемым прогрессом"""
+    id = fields.IntField(pk=True)
+    admin_id = fields.BigIntField()
+    from_chat_id = fields.BigIntField()
+    message_id = fields.IntField()
+    segment = fields.CharField(max_length=32, default="all")  # Фильтр получателей (services.broadcast.SEGMENTS)
+    status = fields.CharEnumField(BroadcastStatus, default=BroadcastStatus.RUNNING)
+    last_user_id = fields.BigIntField(default=0)  # Курсор: пользователи с меньшим id уже обработаны
+    total = fields.IntField(default=0)
+    sent = fields.IntField(default=0)
+    failed = fields.IntField(default=0)
+    blocked = fields.IntField(default=0)
+    created_at = fields.DatetimeField(auto_now_add=True)
+    finished_at = fields.DatetimeField(null=True)
+
+    class Meta:
+        table = "broadcasts"
+        indexes = [("status",)]
+
+class FsmRecord(Model):
+    """Состояние диалога aiogram (FSM) и его данные"""
+    key = fields.CharField(max_length=255, pk=True)  # bot_id:chat_id:user_id:thread_id:destiny
+    state = fields.CharField(max_length=255, null=True)
+    data = fields.JSONField(default=dict)
+    updated_at = fields.DatetimeField(auto_now=True, index=True)
+
+    class Meta:
+        table = "fsm_states"
+
+# Архивные таблицы: те же колонки, что и в рабочих таблицах, но без внешних ключей.
+# Строки переносятся с исходным id; читать обе таблицы - через services.archive
+
+class VideoProcessingArchive(Model):
+    """Архив завершенных обработок видео"""
+    id = fields.IntField(pk=True, generated=False)
+    user_id = fields.BigIntField()
+    method = fields.CharField(max_length=20)
+    tier = fields.CharField(max_length=16, default="standard")
+    status = fields.CharEnumField(VideoStatus)
+    original_file = fields.CharField(max_length=256)
+    processed_file = fields.CharField(max_length=256, null=True)
+    price = fields.DecimalField(max_digits=10, decimal_places=2)
+    started_at = fields.DatetimeField(null=True)
+    completed_at = fields.DatetimeField(null=True)
+    created_at = fields.DatetimeField()
+    error_message = fields.TextField(null=True)
+
+    class Meta:
+        table = "video_processing_archive"
+        ordering = ["-created_at"]
+        indexes = [("user_id", "created_at"), ("created_at",)]
+
+class PaymentArchive(Model):
+    """Архив закрытых платежей"""
+    id = fields.IntField(pk=True, generated=False)
+    payment_id = fields.CharField(max_length=64, null=True)
+    user_id = fields.BigIntField()
+    amount = fields.DecimalField(max_digits=10, decimal_places=2)
+    currency = fields.CharField(max_length=8, default="RUB")
+    description = fields.CharField(max_length=255, null=True)
+    status = fields.CharEnumField(PaymentStatus)
+    created_at = fields.DatetimeField()
+    paid_at = fields.DatetimeField(null=True)
+
+    class Meta:
+        table = "payments_archive"
+        ordering = ["-created_at"]
+        indexes = [("user_id", "created_at"), ("created_at",), ("status", "paid_at")]
+
+class TicketMessageArchive(Model):
+    """Архив сообщений закрытых тикетов"""
+    id = fields.IntField(pk=True, generated=False)
+    ticket_id = fields.IntField()
+    user_id = fields.BigIntField()
+    text = fields.TextField()
+    is_admin_reply = fields.BooleanField(default=False)
+    created_at = fields.DatetimeField()
+
+    class Meta:
+        table = "ticket_messages_archive"
+        ordering = ["created_at"]
+        indexes = [("ticket_id", "created_at")]
+
+class ReferralArchive(Model):
+    """Архив рефералов"""
+    id = fields.IntField(pk=True, generated=False)
+    user_id = fields.BigIntField()
+    referrer_id = fields.BigIntField()
+    bonus_credited = fields.BooleanField(default=False)
+    bonus_amount = fields.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+    created_at = fields.DatetimeField()
+
+    class Meta:
+        table = "referrals_archive"
+        indexes = [("user_id",), ("referrer_id", "created_at"), ("created_at",)]
 
 # Pydantic модели для API (опционально)
 class UserOut(BaseModel):
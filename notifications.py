@@ -1,41 +1,131 @@
+import asyncio
 import logging
-from datetime import datetime, timedelta
+from html import escape
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
 from aiogram import Bot
+from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 from config import config
-from database.models import Referral
+from database.models import User
+from services.events import PaymentCredited, ReferralCreated, TicketOpened, event_bus
+from services.telegram_limiter import bulk_lane
+from utils.helpers import format_rub
 
 logger = logging.getLogger(__name__)
 
 class NotificationService:
-    def __init__(self, bot: Bot):
+    """
+    Уведомления по событиям шины вместо опроса таблиц.
+    События одного получателя копятся NOTIFY_WINDOW секунд и уходят одним
+    сообщением; повторная публикация того же события не дает второго уведомления.
+    VideoCompleted не уведомляется: результат пользователь получает в чате.
+    """
+
+    def __init__(self):
+        self.bot: Optional[Bot] = None
+        self.window = config.NOTIFY_WINDOW
+        self._pending: Dict[int, Dict[Tuple, NamedTuple]] = {}  # Получатель -> события по ключу
+        self._timers: Dict[int, asyncio.Task] = {}
+
+    def start(self, bot: Bot):
         self.bot = bot
-        self.last_checked = datetime.now() - timedelta(minutes=5)
-
-    async def check_new_referrals(self):
-        """Проверка новых рефералов с кэшированием"""
-        new_referrals = await Referral.filter(
-            created_at__gt=self.last_checked
-        ).prefetch_related("user", "referrer")
-        
-        if new_referrals:
-            stats = {}
-            for referral in new_referrals:
-                if referral.referrer.id not in stats:
-                    stats[referral.referrer.id] = {
-                        'count': 0,
-                        'referrer': referral.referrer
-                    }
-                stats[referral.referrer.id]['count'] += 1
-
-            for referrer_id, data in stats.items():
-                try:
-                    await self.bot.send_message(
-                        referrer_id,
-                        f"🎉 У вас {data['count']} новых рефералов!\n"
-                        f"💰 Сумма бонусов: {data['count'] * config.REFERRAL_BONUS} RUB"
-                    )
-                except Exception as e:
-                    logger.error(f"Referral notification failed: {e}")
-
-        self.last_checked = datetime.now()
\ No newline at end of file
+        event_bus.subscribe(ReferralCreated, self.on_referral)
+        event_bus.subscribe(PaymentCredited, self.on_payment)
+        event_bus.subscribe(TicketOpened, self.on_ticket)
+
+    async def on_referral(self, event: ReferralCreated):
+        self._add(event.referrer_id, ("referral", event.user_id), event)
+
+    async def on_payment(self, event: PaymentCredited):
+        if event.notify:
+            self._add(event.user_id, ("payment", event.payment_id), event)
+
+    async def on_ticket(self, event: TicketOpened):
+        for admin_id in config.ADMIN_IDS:
+            self._add(admin_id, ("ticket", event.ticket_id), event)
+
+    def _add(self, recipient: int, key: Tuple, event: NamedTuple):
+        events = self._pending.setdefault(recipient, {})
+        events.setdefault(key, event)
+        if recipient not in self._timers:
+            self._timers[recipient] = asyncio.create_task(self._flush_later(recipient))
+
+    async def _flush_later(self, recipient: int):
+        try:
+            await asyncio.sleep(self.window)
+        finally:
+            self._timers.pop(recipient, None)
+        await self._flush(recipient)
+
+    async def _flush(self, recipient: int):
+        events = list(self._pending.pop(recipient, {}).values())
+        if not events or self.bot is None:
+            return
+        try:
+            text, markup = await self._render(recipient, events)
+            with bulk_lane():
+                await self.bot.send_message(recipient, text, reply_markup=markup)
+        except Exception as e:
+            logger.error(f"Notification to {recipient} failed: {e}")
+
+    async def _render(self, recipient: int, events: List[NamedTuple]):
+        payments = [event for event in events if isinstance(event, PaymentCredited)]
+        referrals = [event for event in events if isinstance(event, ReferralCreated)]
+        tickets = [event for event in events if isinstance(event, TicketOpened)]
+        parts = []
+        markup = None
+
+        if payments:
+            parts.append(f"✅ Баланс пополнен на {format_rub(sum(event.amount for event in payments))}")
+        if len(referrals) == 1:
+            parts.append(f"🎉 Вы получили {format_rub(referrals[0].bonus)} за приглашенного друга!")
+        elif referrals:
+            parts.append(
+                f"🎉 У вас {len(referrals)} новых рефералов!\n"
+                f"🎁 Сумма бонусов: {format_rub(sum(event.bonus for event in referrals))}"
+            )
+        if payments or referrals:
+            user = await User.get_or_none(id=recipient)
+            if user:
+                parts.append(f"💰 Ваш баланс: {format_rub(user.balance)}")
+
+        if tickets:
+            parts.append(self._tickets_text(tickets))
+            builder = InlineKeyboardBuilder()
+            for ticket in tickets:
+                text = "📝 Ответить" if len(tickets) == 1 else f"📝 Ответить #{ticket.ticket_id}"
+                builder.button(text=text, callback_data=f"reply_ticket_{ticket.ticket_id}")
+            builder.adjust(1)
+            markup = builder.as_markup()
+
+        return "\n\n".join(parts), markup
+
+    @staticmethod
+    def _tickets_text(tickets: List[TicketOpened]) -> str:
+        if len(tickets) == 1:
+            ticket = tickets[0]
+            return (
+                "🆕 <b>Новое обращение в поддержку</b>\n\n"
+                f"ID: <code>{ticket.ticket_id}</code>\n"
+                f"Пользователь: @{escape(ticket.username or '-')} | <code>{ticket.user_id}</code>\n"
+                f"Дата: {ticket.created_at.strftime('%d.%m.%Y %H:%M')}\n\n"
+                "<b>Текст обращения:</b>\n"
+                f"{escape(ticket.text)}"
+            )
+        lines = [f"🆕 <b>Новых обращений: {len(tickets)}</b>\n"]
+        for ticket in tickets:
+            preview = ticket.text if len(ticket.text) <= 100 else ticket.text[:100] + "…"
+            lines.append(f"#{ticket.ticket_id} @{escape(ticket.username or '-')}: {escape(preview)}")
+        return "\n".join(lines)
+
+    async def close(self):
+        """Отправка накопленных уведомлений без ожидания окна (при остановке)"""
+        for task in list(self._timers.values()):
+            task.cancel()
+        self._timers.clear()
+        for recipient in list(self._pending):
+            await self._flush(recipient)
+
+# Глобальный экземпляр для использования в системе
+notifications = NotificationService()
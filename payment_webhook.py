@@ -0,0 +1,133 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+from decimal import Decimal, InvalidOperation
+from typing import Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from config import config
+from database.models import Payment, PaymentStatus
+from services.payments import CLOSED_STATUSES, CREDITABLE_STATUSES, payment_system
+
+logger = logging.getLogger(__name__)
+
+# Подпись: hex HMAC-SHA256 тела запроса на LOLZ_SECRET_KEY
+SIGNATURE_HEADER = "X-Signature"
+
+app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None)
+
+def sign(body: bytes) -> str:
+    return hmac.new(config.LOLZ_SECRET_KEY.encode(), body, hashlib.sha256).hexdigest()
+
+def verify_signature(body: bytes, signature: Optional[str]) -> bool:
+    return bool(signature) and hmac.compare_digest(sign(body), signature.strip().lower())
+
+@app.post(config.PAYMENT_WEBHOOK_PATH)
+async def payment_callback(request: Request):
+    """
+    Уведомление провайдера о смене статуса платежа.
+    Зачисление идемпотентно, поэтому повторная доставка безопасна;
+    ответ 2xx отправляется только после записи в БД.
+    """
+    body = await request.body()
+    if not verify_signature(body, request.headers.get(SIGNATURE_HEADER)):
+        logger.warning(f"Payment callback with invalid signature from {request.client.host if request.client else '?'}")
+        return JSONResponse({"error": "invalid signature"}, status_code=401)
+
+    try:
+        data = json.loads(body)
+        payment_id = str(data.get("payment_id") or data["id"])
+        status = data["status"]
+        amount = data.get("amount")
+        if amount is not None:
+            amount = Decimal(str(amount))
+            if not amount.is_finite():
+                raise ValueError(f"amount {amount}")
+    except (ValueError, KeyError, TypeError, InvalidOperation):
+        return JSONResponse({"error": "invalid payload"}, status_code=400)
+
+    payment = await Payment.get_or_none(payment_id=payment_id)
+    if payment is None:
+        return JSONResponse({"error": "unknown payment"}, status_code=404)
+
+    if status == "paid":
+        if amount is not None and amount != payment.amount:
+            logger.error(f"Payment {payment_id} callback amount {amount} != {payment.amount}")
+            return JSONResponse({"error": "amount mismatch"}, status_code=400)
+        if payment.status in CREDITABLE_STATUSES:
+            await payment_system._process_paid_payment(payment, data)
+    elif status in CLOSED_STATUSES and payment.status == PaymentStatus.PENDING:
+        await payment_system._close_payment(payment, CLOSED_STATUSES[status])
+
+    return {"ok": True}
+
+class CallbackServer:
+    """HTTP-сервер уведомлений в event loop бота"""
+
+    def __init__(self):
+        self._server: Optional[uvicorn.Server] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._server = uvicorn.Server(uvicorn.Config(
+            app,
+            host=config.PAYMENT_WEBHOOK_HOST,
+            port=config.PAYMENT_WEBHOOK_PORT,
+            log_level="warning",
+            access_log=False
+        ))
+        # Сигналы остановки обрабатывает бот
+        self._server.install_signal_handlers = lambda: None
+        self._task = asyncio.create_task(self._server.serve())
+        logger.info(f"Payment callbacks on {config.PAYMENT_WEBHOOK_HOST}:{config.PAYMENT_WEBHOOK_PORT}{config.PAYMENT_WEBHOOK_PATH}")
+
+    async def stop(self):
+        """Прекращение приема до закрытия БД: начатые запросы дописываются, новые не принимаются"""
+        if self._server is None:
+            return
+        self._server.should_exit = True
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._server = self._task = None
+
+# Глобальный экземпляр для использования в системе
+callback_server = CallbackServer()
+
+if __name__ == '__main__':
+    # Отдельный процесс приема уведомлений: python -m services.payment_webhook
+    from aiogram import Bot
+    from aiogram.client.default import DefaultBotProperties
+    from aiogram.enums import ParseMode
+    from database.db import init_db, close_db
+    from services.bot_api import bot_session
+    from services.db_writer import db_writer
+    from services.notifications import notifications
+    from services.telegram_limiter import telegram_limiter
+
+    # Уведомления о зачислении отправляет этот процесс: PaymentCredited
+    # публикуется в шину того процесса, где прошло зачисление
+    bot = Bot(
+        token=config.BOT_TOKEN,
+        session=bot_session(),
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+    )
+    bot.session.middleware(telegram_limiter)
+
+    @app.on_event("startup")
+    async def startup():
+        await init_db()
+        notifications.start(bot)
+
+    @app.on_event("shutdown")
+    async def shutdown():
+        await notifications.close()
+        await payment_system.close()
+        await db_writer.close()
+        await close_db()
+        await bot.session.close()
+
+    uvicorn.run(app, host=config.PAYMENT_WEBHOOK_HOST, port=config.PAYMENT_WEBHOOK_PORT)
\ No newline at end of file
@@ -5,8 +5,9 @@ from aiogram.filters import Command
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 from config import config
-from database.models import Payment  # Импорт модели Payment
+from database.models import Payment, PaymentStatus
 from services.payments import payment_system
+from utils.helpers import format_rub
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -29,7 +30,7 @@ async def pay_command(message: Message):
         balance = await payment_system.get_user_balance(message.from_user.id)
         
         await message.answer(
-            f"💰 <b>Ваш баланс:</b> {balance} RUB\n\n"
+            f"💰 <b>Ваш баланс:</b> {format_rub(balance)}\n\n"
             "Выберите сумму для пополнения:",
             reply_markup=builder.as_markup()
         )
@@ -76,9 +77,8 @@ async def process_deposit(callback: CallbackQuery):
 
 @router.callback_query(F.data.startswith("check:"))
 async def check_payment(callback: CallbackQuery):
-    """Проверка статуса платежа"""
+    """Проверка статуса платежа (ответ провайдера общий с фоновой проверкой)"""
     try:
-        amount = int(callback.data.split(":")[1])
         last_payment = await Payment.filter(
             user_id=callback.from_user.id
         ).order_by("-created_at").first()
@@ -87,16 +87,19 @@ async def check_payment(callback: CallbackQuery):
             await callback.answer("❌ Платеж не найден", show_alert=True)
             return
             
-        payment_data, error = await payment_system.check_payment(last_payment.payment_id)
+        # Зачисление идет здесь же, если провайдер уже видит оплату
+        status, error = await payment_system.sync_payment(last_payment, notify=False)
         
         if error:
             await callback.answer(f"⚠️ Ошибка: {error}", show_alert=True)
-        elif payment_data["status"] == "paid":
+        elif status == PaymentStatus.PAID:
             balance = await payment_system.get_user_balance(callback.from_user.id)
             await callback.message.edit_text(
-                f"✅ Баланс пополнен на {amount} RUB\n"
-                f"💰 Текущий баланс: {balance} RUB"
+                f"✅ Баланс пополнен на {format_rub(last_payment.amount)}\n"
+                f"💰 Текущий баланс: {format_rub(balance)}"
             )
+        elif status != PaymentStatus.PENDING:
+            await callback.answer("❌ Платеж отменен или истек", show_alert=True)
         else:
             await callback.answer("⌛ Платеж еще не обработан", show_alert=True)
             
@@ -1,17 +1,23 @@
+import asyncio
 import logging
 from pathlib import Path
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, InputMediaVideo
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from datetime import datetime
-from typing import Optional  # Добавьте этот импорт
+from typing import Dict, List, Optional  # Добавьте этот импорт
 
 from config import config
-from database.models import User, VideoProcessing
+from database.models import LedgerKind, User, VideoProcessing, VideoStatus
 from services.video_editor import VideoEditor
 from services.cache import video_cache
+from services.ledger import ledger, InsufficientFunds
+from services.db_writer import db_writer
+from services.bot_api import download_file, input_file
+from services.events import VideoCompleted, event_bus
+from services.user_stats import user_stats
 from handlers.payments import payment_system
 from utils.states import VideoProcessingStates
 from utils.helpers import format_timedelta
@@ -22,6 +28,10 @@ logger = logging.getLogger(__name__)
 
 video_editor = VideoEditor()
 
+# Пакеты видео, ожидающие окончания альбома (user_id -> пакет)
+_pending_batches: Dict[int, dict] = {}
+_batch_tasks = set()
+
 @router.message(Command("process"))
 async def start_video_processing(message: Message, state: FSMContext):
     """Начало процесса обработки видео"""
@@ -30,9 +40,9 @@ async def start_video_processing(message: Message, state: FSMContext):
         await message.answer("Сначала зарегистрируйтесь с помощью /start")
         return
 
-    if user.balance < config.VIDEO_PRICE:
+    if user.balance < config.min_video_price:
         await message.answer(
-            f"Недостаточно средств. Требуется {config.VIDEO_PRICE} RUB\n"
+            f"Недостаточно средств. Требуется от {config.min_video_price} RUB\n"
             "Пополните баланс через /pay"
         )
         return
@@ -57,8 +67,43 @@ async def select_method(callback: CallbackQuery, state: FSMContext):
     """Обработка выбора метода"""
     method = callback.data.split("_")[1]
     await state.update_data(method=method)
+
+    builder = InlineKeyboardBuilder()
+    for tier_name, tier in config.QUALITY_TIERS.items():
+        builder.button(
+            text=f"{tier['title']} - {tier['price']} RUB",
+            callback_data=f"tier_{tier_name}"
+        )
+    builder.adjust(1)
+
+    await callback.message.edit_text(
+        f"Выбран метод: {method.capitalize()} Room\n\n"
+        "Выберите качество обработки:",
+        reply_markup=builder.as_markup()
+    )
+    await state.set_state(VideoProcessingStates.waiting_for_tier)
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("tier_"), VideoProcessingStates.waiting_for_tier)
+async def select_tier(callback: CallbackQuery, state: FSMContext):
+    """Обработка выбора тарифа качества"""
+    tier_name = callback.data.split("_", 1)[1]
+    if tier_name not in config.QUALITY_TIERS:
+        await callback.answer("Неизвестный тариф", show_alert=True)
+        return
+
+    tier = config.QUALITY_TIERS[tier_name]
+    user = await User.get(id=callback.from_user.id)
+    if user.balance < tier['price']:
+        await callback.answer(
+            f"Недостаточно средств. Требуется {tier['price']} RUB",
+            show_alert=True
+        )
+        return
+
+    await state.update_data(tier=tier_name)
     await callback.message.edit_text(
-        f"Выбран метод: {method.capitalize()} Room\n"
+        f"Выбрано качество: {tier['title']}\n"
         "Теперь отправьте видео для обработки (до 1GB)"
     )
     await state.set_state(VideoProcessingStates.waiting_for_video)
@@ -66,68 +111,195 @@ async def select_method(callback: CallbackQuery, state: FSMContext):
 
 @router.message(F.video, VideoProcessingStates.waiting_for_video)
 async def process_video_message(message: Message, state: FSMContext):
-    """Обработка полученного видео"""
-    user = await User.get(message.from_user.id)
-    if not user or user.balance < config.VIDEO_PRICE:
-        await message.answer("Ошибка: недостаточно средств или пользователь не найден")
-        await state.clear()
+    """Обработка полученного видео (одиночного или из альбома)"""
+    video = message.video
+    _add_to_batch(message, state, video.file_id, video.file_unique_id, video.file_name)
+
+def _add_to_batch(message: Message, state: FSMContext, file_id: str,
+                  file_unique_id: str, file_name: Optional[str]):
+    """Добавление видео в пакет пользователя
+
+    Альбом (media group) или несколько видео, присланных в течение
+    BATCH_WINDOW секунд, обрабатываются как одна задача.
+    """
+    user_id = message.from_user.id
+    batch = _pending_batches.get(user_id)
+    if batch is None:
+        batch = {'message': message, 'state': state, 'files': [], 'timer': None}
+        _pending_batches[user_id] = batch
+
+    batch['files'].append((file_id, file_unique_id, file_name or f"video_{file_id}.mp4"))
+    if batch['timer']:
+        batch['timer'].cancel()
+
+    if len(batch['files']) >= config.MAX_BATCH_SIZE:
+        del _pending_batches[user_id]
+        _spawn(_process_batch(batch))
+    else:
+        batch['timer'] = _spawn(_flush_batch_later(user_id))
+
+async def _flush_batch_later(user_id: int):
+    """Запуск пакета после паузы в поступлении видео"""
+    await asyncio.sleep(config.BATCH_WINDOW)
+    batch = _pending_batches.pop(user_id, None)
+    if batch:
+        await _process_batch(batch)
+
+def _spawn(coro) -> asyncio.Task:
+    """Фоновая задача со ссылкой, чтобы её не собрал GC"""
+    task = asyncio.create_task(coro)
+    _batch_tasks.add(task)
+    task.add_done_callback(_batch_tasks.discard)
+    return task
+
+async def _process_batch(batch: dict):
+    """Обработка пакета видео: скачивание, оплата, обработка и отправка альбомом"""
+    message: Message = batch['message']
+    state: FSMContext = batch['state']
+    files = batch['files']
+
+    data = await state.get_data()
+    await state.clear()
+    method = data.get("method")
+    tier_name = data.get("tier", config.DEFAULT_TIER)
+    tier = config.get_tier(tier_name)
+    price = tier['price']
+
+    user = await User.get_or_none(id=message.from_user.id)
+    if not user or not method or user.balance < price * len(files):
+        await message.answer(
+            "Ошибка: недостаточно средств или пользователь не найден\n"
+            f"Требуется {price * len(files)} RUB за {len(files)} видео"
+        )
         return
 
     try:
-        data = await state.get_data()
-        method = data["method"]
-        
-        # Проверяем кэш
-        file_id = message.video.file_id
-        file_name = message.video.file_name or f"video_{file_id}.mp4"
-        
-        # Скачиваем видео
-        await message.answer("⏳ Скачиваю видео...")
-        file_path = await _download_video(message.bot, file_id, file_name)
-        
-        if not file_path:
-            await message.answer("Ошибка при скачивании видео")
-            await state.clear()
+        status = await message.answer(f"⏳ Скачиваю видео ({len(files)})...")
+
+        # Скачиваем все видео пакета параллельно
+        downloaded = await asyncio.gather(*(
+            _download_video(message.bot, file_id, f"{user.id}_{file_unique_id}_{file_name}")
+            for file_id, file_unique_id, file_name in files
+        ))
+        items = [
+            (file_name, path)
+            for (_, _, file_name), path in zip(files, downloaded)
+            if path
+        ]
+        if not items:
+            await status.edit_text("Ошибка при скачивании видео")
             return
 
-        # Проверяем кэш
-        if cached_path := video_cache.get_cached_video(file_path, method):
-            await message.answer("♻️ Использую кэшированную версию...")
-            output_path = cached_path
-        else:
-            # Списываем средства
-            await user.update(balance=user.balance - config.VIDEO_PRICE).apply()
-            
-            # Обрабатываем видео
-            await message.answer(f"🛠️ Обрабатываю видео методом {method}...")
-            output_path = await video_editor.process_video(file_path, method)
-            
-            # Добавляем в кэш
-            video_cache.add_to_cache(file_path, output_path, method)
-
-        # Записываем статистику
-        await VideoProcessing.create(
-            user_id=user.id,
-            method=method,
-            original_file=file_name,
-            processed_file=output_path.name,
-            file_size=output_path.stat().st_size
+        # Результаты разных тарифов кэшируются раздельно
+        cache_key = f"{method}_{tier_name}"
+        results = {}
+        cached = set()
+        to_process = []
+        for file_name, path in items:
+            if cached_path := video_cache.get_cached_video(path, cache_key):
+                results[path] = cached_path
+                cached.add(path)
+            else:
+                to_process.append(path)
+
+        # Одно атомарное списание за весь пакет
+        batch_key = f"{message.chat.id}:{message.message_id}"
+        charge = price * len(to_process)
+        balance = user.balance
+        if charge:
+            try:
+                balance = await ledger.debit(
+                    user.id, charge, LedgerKind.VIDEO,
+                    description=f"Обработка {len(to_process)} видео ({method}, {tier_name})",
+                    idempotency_key=f"video:{batch_key}"
+                )
+            except InsufficientFunds:
+                await status.edit_text(f"Недостаточно средств. Требуется {charge} RUB")
+                return
+
+        await status.edit_text(
+            f"🛠️ Обрабатываю {len(items)} видео методом {method}..."
+            + (f"\n♻️ Из кэша: {len(results)}" if results else "")
         )
+        outputs = await video_editor.process_batch(to_process, method, tier_name)
 
-        # Отправляем результат
-        with open(output_path, "rb") as video_file:
-            await message.answer_video(
-                video=video_file,
-                caption=f"✅ Готово! Метод: {method.capitalize()} Room\n"
-                       f"💵 Списано: {config.VIDEO_PRICE} RUB\n"
-                       f"💰 Ваш баланс: {user.balance - config.VIDEO_PRICE} RUB"
-            )
+        failed = 0
+        for path, output in zip(to_process, outputs):
+            if isinstance(output, Exception):
+                logger.error(f"Video processing error: {output}")
+                failed += 1
+                continue
+            video_cache.add_to_cache(path, output, cache_key)
+            results[path] = output
+
+        # Возвращаем деньги за необработанные видео одной операцией
+        refund = price * failed
+        if refund:
+            balance = await ledger.credit(
+                user.id, refund, LedgerKind.REFUND,
+                description=f"Возврат за {failed} видео",
+                idempotency_key=f"refund:{batch_key}"
+            ) or balance
+        spent = charge - refund
+
+        # Записываем историю одним запросом вместе со счетчиками профиля
+        done = [(file_name, path) for file_name, path in items if path in results]
+        if done:
+            async def record(conn):
+                await VideoProcessing.bulk_create([
+                    VideoProcessing(
+                        user_id=user.id,
+                        method=method,
+                        tier=tier_name,
+                        price=0 if path in cached else price,
+                        status=VideoStatus.COMPLETED,
+                        original_file=file_name,
+                        processed_file=results[path].name
+                    )
+                    for file_name, path in done
+                ], using_db=conn)
+                await user_stats.increment(
+                    user.id, connection=conn,
+                    videos_count=len(done), videos_spent=spent
+                )
+
+            await db_writer.transaction(record)
+            event_bus.publish(VideoCompleted(user.id, method, tier_name, len(done), spent))
+
+        if not done:
+            await status.edit_text("Произошла ошибка при обработке видео")
+            return
+
+        caption = (
+            f"✅ Готово! Метод: {method.capitalize()} Room\n"
+            f"🎚 Качество: {tier['title']}\n"
+            f"🎥 Видео: {len(done)}"
+            + (f" (ошибок: {len(items) - len(done)})" if len(done) < len(items) else "")
+            + f"\n💵 Списано: {spent} RUB\n"
+            f"💰 Ваш баланс: {balance} RUB"
+        )
+        await _send_results(message, [results[path] for _, path in done], caption)
+        await status.delete()
 
     except Exception as e:
         logger.error(f"Video processing error: {e}", exc_info=True)
         await message.answer("Произошла ошибка при обработке видео")
-    finally:
-        await state.clear()
+
+async def _send_results(message: Message, paths: List[Path], caption: str):
+    """Отправка результатов: одно видео или альбомы по 10"""
+    if len(paths) == 1:
+        await message.answer_video(video=input_file(paths[0]), caption=caption)
+        return
+
+    for offset in range(0, len(paths), 10):
+        chunk = paths[offset:offset + 10]
+        await message.answer_media_group([
+            InputMediaVideo(
+                media=input_file(path),
+                caption=caption if offset == 0 and index == 0 else None
+            )
+            for index, path in enumerate(chunk)
+        ])
 
 async def _download_video(bot, file_id: str, file_name: str) -> Optional[Path]:
     """Скачивание видео с проверкой размера"""
@@ -137,7 +309,7 @@ async def _download_video(bot, file_id: str, file_name: str) -> Optional[Path]:
             return None
 
         download_path = config.TEMP_DIR / file_name
-        await bot.download_file(file.file_path, destination=download_path)
+        await download_file(bot, file.file_path, download_path)
         return download_path
     except Exception as e:
         logger.error(f"Download error: {e}")
@@ -146,10 +318,9 @@ async def _download_video(bot, file_id: str, file_name: str) -> Optional[Path]:
 @router.message(F.document, VideoProcessingStates.waiting_for_video)
 async def process_video_document(message: Message, state: FSMContext):
     """Обработка видео, отправленного как документ"""
-    if message.document.mime_type and "video" in message.document.mime_type:
-        # Создаем объект video для совместимости
-        message.video = message.document
-        await process_video_message(message, state)
+    document = message.document
+    if document.mime_type and "video" in document.mime_type:
+        _add_to_batch(message, state, document.file_id, document.file_unique_id, document.file_name)
     else:
         await message.answer("Пожалуйста, отправьте видео файл")
         await state.clear()
@@ -4,43 +4,42 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from datetime import datetime
+from typing import Optional
 from aiogram.fsm.context import FSMContext
-import asyncio
-from utils.states import PaymentStates
 
 from config import config
-from database.models import User, Payment, VideoProcessing, Referral
-from handlers.payments import payment_system
+from database.models import User, Payment, PaymentStatus, VideoProcessing
+from services.archive import archive
+from services.user_stats import user_stats
 from utils.helpers import format_rub
-from utils.states import PaymentStates
 
 router = Router()
 logger = logging.getLogger(__name__)
 
 @router.message(Command("profile"))
-async def show_profile(message: Message):
+async def show_profile(message: Message, db_user: Optional[User] = None):
     """Отображение профиля пользователя с балансом и статистикой"""
     try:
-        user, created = await User.get_or_create(
-            id=message.from_user.id,
-            defaults={
-                'username': message.from_user.username,
-                'full_name': message.from_user.full_name,
-                'balance': 0.0,
-                'registered_at': datetime.now()
-            }
-        )
-        
-        # Получаем статистику одним запросом для оптимизации
-        stats = await asyncio.gather(
-            VideoProcessing.filter(user_id=user.id).count(),
-            VideoProcessing.filter(user_id=user.id).count() * config.VIDEO_PRICE,
-            Referral.filter(referrer_id=user.id).count(),
-            Payment.filter(user_id=user.id, description="Реферальное вознаграждение").sum("amount"),
-            _get_total_deposits(user.id)
-        )
+        # Пользователь уже получен в UserMiddleware (из кэша)
+        user = db_user
+        if user is None:
+            user, created = await User.get_or_create(
+                id=message.from_user.id,
+                defaults={
+                    'username': message.from_user.username,
+                    'full_name': message.from_user.full_name,
+                    'balance': 0.0,
+                    'registered_at': datetime.now()
+                }
+            )
         
-        processed_videos, total_spent, referrals_count, referral_income, total_deposits = stats
+        # Вся статистика - одно чтение материализованных счетчиков
+        stats = await user_stats.get(user.id)
+        processed_videos = stats.videos_count
+        total_spent = stats.videos_spent
+        referrals_count = stats.referrals_count
+        referral_income = stats.referral_income
+        total_deposits = stats.deposits_total
 
         profile_text = (
             f"👤 <b>Профиль</b>\n\n"
@@ -93,13 +92,36 @@ async def deposit_balance(callback: CallbackQuery, state: FSMContext):
     finally:
         await callback.answer()
 
-# Остальные обработчики (process_deposit, check_payment и т.д.) остаются без изменений
+@router.callback_query(F.data == "payment_history")
+async def payment_history(callback: CallbackQuery):
+    """Последние платежи и обработки видео (включая архив)"""
+    try:
+        payments = await archive.fetch(Payment, limit=10, user_id=callback.from_user.id)
+        videos = await archive.fetch(VideoProcessing, limit=10, user_id=callback.from_user.id)
+
+        statuses = {
+            PaymentStatus.PENDING: "⏳", PaymentStatus.PAID: "✅",
+            PaymentStatus.FAILED: "❌", PaymentStatus.EXPIRED: "⌛",
+        }
+        lines = ["📊 <b>История операций</b>\n", "<b>Пополнения:</b>"]
+        lines += [
+            f"{statuses.get(row['status'], '•')} {row['created_at'].strftime('%d.%m.%Y %H:%M')} — {format_rub(row['amount'])}"
+            for row in payments
+        ] or ["Пока нет"]
+        lines += ["", "<b>Обработки видео:</b>"]
+        lines += [
+            f"🎥 {row['created_at'].strftime('%d.%m.%Y %H:%M')} — {row['method'].capitalize()} ({format_rub(row['price'])})"
+            for row in videos
+        ] or ["Пока нет"]
+
+        builder = InlineKeyboardBuilder()
+        builder.button(text="🔙 Назад", callback_data="profile_back")
+
+        await callback.message.edit_text("\n".join(lines), reply_markup=builder.as_markup())
+    except Exception as e:
+        logger.error(f"Payment history error: {e}")
+        await callback.message.edit_text("⚠️ Ошибка при загрузке истории")
+    finally:
+        await callback.answer()
 
-async def _get_total_deposits(user_id: int) -> float:
-    """Получение общей суммы успешных пополнений"""
-    result = await Payment.filter(
-        user_id=user_id,
-        status="paid",
-        description="Пополнение баланса"
-    ).sum("amount")
-    return result if result else 0.0
\ No newline at end of file
+# Остальные обработчики (process_deposit, check_payment и т.д.) остаются без изменений
\ No newline at end of file
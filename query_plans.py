@@ -0,0 +1,224 @@
+"""
+Проверка планов запросов: каждый запрос, который выполняют обработчики,
+должен использовать индекс, а не полный просмотр таблицы.
+
+Запуск (код возврата 1 при регрессии):
+
+    python -m database.query_plans [--rows 50000]
+
+В тестах те же запросы проверяет tests/test_query_plans.py.
+
+Схема создается во временной SQLite-базе из тех же моделей,
+заполняется синтетическими данными и анализируется через EXPLAIN QUERY PLAN.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+# Конфиг требует токены, которые проверке не нужны
+os.environ.setdefault('BOT_TOKEN', 'query-plans')
+os.environ.setdefault('LOLZ_API_KEY', 'query-plans')
+os.environ.setdefault('LOLZ_SECRET_KEY', 'query-plans')
+
+from tortoise import Tortoise, run_async
+
+from database.db import orm_config, sqlite_connection
+from database.models import (
+    LedgerEntry, LedgerKind, Payment, PaymentArchive, PaymentStatus, Referral, ReferralArchive,
+    StatsRollup, SupportTicket, TicketMessage, TicketStatus, User, VideoProcessing,
+    VideoProcessingArchive, VideoStatus
+)
+
+NOW = datetime.now()
+USER_ID = 1
+
+# Запросы обработчиков и сервисов: (название, фабрика QuerySet, нужен ли порядок по индексу)
+QUERIES: List[Tuple[str, Callable, bool]] = [
+    ("payments: pending checker page", lambda: Payment.filter(
+        status=PaymentStatus.PENDING, id__gt=1000
+    ).order_by("id").limit(500), True),
+    ("payments: last user payment", lambda: Payment.filter(
+        user_id=USER_ID
+    ).order_by("-created_at").limit(1), True),
+    ("payments: paid in period", lambda: Payment.filter(
+        status=PaymentStatus.PAID, paid_at__gte=NOW - timedelta(days=1), paid_at__lt=NOW
+    ).count(), False),
+    ("payments: created in period", lambda: Payment.filter(
+        created_at__gte=NOW - timedelta(hours=1), created_at__lt=NOW
+    ).count(), False),
+    ("videos: by user", lambda: VideoProcessing.filter(user_id=USER_ID), True),
+    ("videos: created in period", lambda: VideoProcessing.filter(
+        created_at__gte=NOW - timedelta(hours=1), created_at__lt=NOW
+    ).count(), False),
+    ("referrals: by referrer", lambda: Referral.filter(referrer_id=USER_ID).count(), False),
+    ("referrals: exists for user", lambda: Referral.filter(user_id=USER_ID).exists(), False),
+    ("referrals: new since", lambda: Referral.filter(
+        created_at__gt=NOW - timedelta(minutes=5)
+    ), False),
+    ("tickets: by user", lambda: SupportTicket.filter(
+        user_id=USER_ID
+    ).order_by("-created_at").limit(5), True),
+    ("ticket messages: by ticket", lambda: TicketMessage.filter(ticket_id=1), True),
+    ("users: active since", lambda: User.filter(
+        last_active__gte=NOW - timedelta(days=1)
+    ).count(), False),
+    ("users: broadcast page", lambda: User.filter(
+        is_active=True, id__gt=USER_ID
+    ).order_by("id").limit(1000), True),
+    ("users: registered in period", lambda: User.filter(
+        registered_at__gte=NOW - timedelta(hours=1), registered_at__lt=NOW
+    ).count(), False),
+    ("ledger: by user", lambda: LedgerEntry.filter(user_id=USER_ID).limit(20), True),
+    ("rollups: period range", lambda: StatsRollup.filter(
+        period="day", bucket__gte=NOW - timedelta(days=30), bucket__lt=NOW
+    ), False),
+    ("archive: videos by user", lambda: VideoProcessingArchive.filter(
+        user_id=USER_ID
+    ).order_by("-created_at").limit(10), True),
+    ("archive: payments by user", lambda: PaymentArchive.filter(
+        user_id=USER_ID
+    ).order_by("-created_at").limit(10), True),
+    ("archive: paid in period", lambda: PaymentArchive.filter(
+        status=PaymentStatus.PAID, paid_at__gte=NOW - timedelta(days=1), paid_at__lt=NOW
+    ).count(), False),
+    ("archive: referral exists for user", lambda: ReferralArchive.filter(user_id=USER_ID).exists(), False),
+]
+
+
+async def seed(rows: int):
+    """Синтетические данные примерно пропорциональные боевым таблицам"""
+    rng = random.Random(42)
+    users_count = max(rows // 5, 100)
+
+    def moment() -> datetime:
+        return NOW - timedelta(seconds=rng.randint(0, 365 * 24 * 3600))
+
+    await User.bulk_create([
+        User(
+            id=uid,
+            username=f"user{uid}",
+            full_name=f"User {uid}",
+            balance=Decimal(rng.randint(0, 1000)),
+            registered_at=moment(),
+            last_active=moment()
+        )
+        for uid in range(1, users_count + 1)
+    ], batch_size=1000)
+
+    await Payment.bulk_create([
+        Payment(
+            user_id=rng.randint(1, users_count),
+            amount=Decimal(rng.choice([100, 300, 500, 1000])),
+            status=rng.choice(list(PaymentStatus)),
+            created_at=moment(),
+            paid_at=moment()
+        )
+        for _ in range(rows)
+    ], batch_size=1000)
+
+    await VideoProcessing.bulk_create([
+        VideoProcessing(
+            user_id=rng.randint(1, users_count),
+            method=rng.choice(["crocodile", "dolphin", "grizzly"]),
+            status=rng.choice(list(VideoStatus)),
+            original_file="input.mp4",
+            price=Decimal(30),
+            created_at=moment()
+        )
+        for _ in range(rows)
+    ], batch_size=1000)
+
+    await Referral.bulk_create([
+        Referral(user_id=uid, referrer_id=rng.randint(1, users_count), created_at=moment())
+        for uid in range(1, users_count + 1, 3)
+    ], batch_size=1000)
+
+    await SupportTicket.bulk_create([
+        SupportTicket(
+            user_id=rng.randint(1, users_count),
+            subject="Вопрос",
+            status=rng.choice(list(TicketStatus)),
+            created_at=moment()
+        )
+        for _ in range(rows // 10)
+    ], batch_size=1000)
+
+    await TicketMessage.bulk_create([
+        TicketMessage(
+            ticket_id=rng.randint(1, rows // 10),
+            user_id=rng.randint(1, users_count),
+            text="Сообщение",
+            created_at=moment()
+        )
+        for _ in range(rows // 5)
+    ], batch_size=1000)
+
+    await LedgerEntry.bulk_create([
+        LedgerEntry(
+            user_id=rng.randint(1, users_count),
+            amount=Decimal(30),
+            balance_after=Decimal(100),
+            kind=rng.choice(list(LedgerKind)),
+            created_at=moment()
+        )
+        for _ in range(rows)
+    ], batch_size=1000)
+
+    conn = Tortoise.get_connection("default")
+    await conn.execute_script("ANALYZE;")
+
+
+def plan_problems(plan: List[str], ordered: bool) -> List[str]:
+    """Строки плана, означающие полный просмотр или сортировку вне индекса"""
+    problems = []
+    for detail in plan:
+        if detail.startswith("SCAN") and "USING" not in detail:
+            problems.append(detail)
+        if ordered and "USE TEMP B-TREE FOR ORDER BY" in detail:
+            problems.append(detail)
+    return problems
+
+
+async def check(rows: int, queries: List[Tuple[str, Callable, bool]] = QUERIES) -> Dict[str, List[str]]:
+    """Проверка запросов (по умолчанию всех), возвращает {запрос: проблемы}"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Планы SQLite проверяются независимо от DB_ENGINE
+        await Tortoise.init(config=orm_config(sqlite_connection(Path(temp_dir) / "plans.db")))
+        try:
+            await Tortoise.generate_schemas()
+            await seed(rows)
+
+            conn = Tortoise.get_connection("default")
+            failures = {}
+            for name, factory, ordered in queries:
+                sql = factory().sql()
+                _, result = await conn.execute_query(f"EXPLAIN QUERY PLAN {sql}")
+                plan = [row["detail"] for row in result]
+                problems = plan_problems(plan, ordered)
+                print(f"{'FAIL' if problems else 'ok  '} {name}: {' | '.join(plan)}")
+                if problems:
+                    failures[name] = problems
+            return failures
+        finally:
+            await Tortoise.close_connections()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="EXPLAIN QUERY PLAN regression check")
+    parser.add_argument('--rows', type=int, default=50_000)
+    args = parser.parse_args()
+
+    async def main():
+        failures = await check(args.rows)
+        if failures:
+            print(f"\n{len(failures)} queries do not use an index")
+            sys.exit(1)
+        print("\nAll queries use indexes")
+
+    run_async(main())
\ No newline at end of file
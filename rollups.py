@@ -0,0 +1,254 @@
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from tortoise.functions import Count, Sum
+from tortoise.transactions import in_transaction
+
+from config import config
+from database.models import (
+    Payment, PaymentStatus, Referral, StatsRollup, User, VideoProcessing
+)
+from services.archive import archive
+
+logger = logging.getLogger(__name__)
+
+HOUR = 'hour'
+DAY = 'day'
+# Неаддитивная метрика: при объединении интервалов берется максимум
+ACTIVE_USERS = 'active_users'
+
+
+def _value(value) -> Decimal:
+    return Decimal(str(value or 0))
+
+
+def _enum_value(value) -> str:
+    return getattr(value, 'value', value)
+
+
+def _stored(moment: datetime) -> datetime:
+    """
+    Значение для сравнения на равенство с DatetimeField: при use_tz наивное
+    время сохраняется с +00:00, а в фильтр попадает без смещения
+    """
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+class RollupService:
+    """
+    Часовые и дневные агрегаты для админ-панели.
+    Фоновый агрегатор пересчитывает только последние ROLLUP_RECOMPUTE_HOURS
+    часов, а отчеты читают готовые интервалы вместо полных таблиц.
+    """
+
+    def __init__(self):
+        self.interval = config.ROLLUP_INTERVAL
+        self.recompute_hours = config.ROLLUP_RECOMPUTE_HOURS
+
+    @staticmethod
+    def hour_start(moment: datetime) -> datetime:
+        return moment.replace(minute=0, second=0, microsecond=0)
+
+    @staticmethod
+    def day_start(moment: datetime) -> datetime:
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    async def _collect(self, start: datetime, end: datetime) -> Dict[str, Decimal]:
+        """
+        Метрики одного интервала из исходных таблиц (запросы по диапазону дат).
+        Рабочая и архивная таблицы суммируются, чтобы backfill видел старые строки.
+        """
+        metrics: Dict[str, Decimal] = defaultdict(Decimal)
+
+        metrics['new_users'] = _value(
+            await User.filter(registered_at__gte=start, registered_at__lt=end).count()
+        )
+        metrics['referrals'] = _value(
+            await archive.count(Referral, created_at__gte=start, created_at__lt=end)
+        )
+
+        for payments in archive.querysets(Payment, created_at__gte=start, created_at__lt=end):
+            created = await payments.annotate(count=Count('id'), amount=Sum('amount')) \
+                .group_by('status').values('status', 'count', 'amount')
+            for row in created:
+                status = _enum_value(row['status'])
+                metrics[f'payments:{status}:count'] += _value(row['count'])
+                metrics[f'payments:{status}:amount'] += _value(row['amount'])
+
+        # Выручка считается по времени оплаты, а не создания счета
+        for payments in archive.querysets(Payment, status=PaymentStatus.PAID, paid_at__gte=start, paid_at__lt=end):
+            paid = await payments.annotate(count=Count('id'), amount=Sum('amount')) \
+                .group_by('status').values('count', 'amount')
+            for row in paid:
+                metrics['paid:count'] += _value(row['count'])
+                metrics['paid:amount'] += _value(row['amount'])
+
+        for videos in archive.querysets(VideoProcessing, created_at__gte=start, created_at__lt=end):
+            rows = await videos.annotate(count=Count('id')) \
+                .group_by('method', 'status').values('method', 'status', 'count')
+            for row in rows:
+                metrics[f"videos:{row['method']}:{_enum_value(row['status'])}"] += _value(row['count'])
+
+        return metrics
+
+    async def _replace_bucket(self, period: str, bucket: datetime, metrics: Dict[str, Decimal]):
+        """Замена аддитивных метрик интервала (active_users не трогаем)"""
+        async with in_transaction() as conn:
+            await StatsRollup.filter(period=period, bucket=_stored(bucket)) \
+                .exclude(metric=ACTIVE_USERS).using_db(conn).delete()
+            await StatsRollup.bulk_create([
+                StatsRollup(period=period, bucket=bucket, metric=metric, value=value)
+                for metric, value in metrics.items()
+                if value
+            ], using_db=conn)
+
+    async def _rollup_hour(self, hour: datetime):
+        await self._replace_bucket(HOUR, hour, await self._collect(hour, hour + timedelta(hours=1)))
+
+    async def _rollup_day(self, day: datetime):
+        """Дневной агрегат как сумма часовых"""
+        rows = await StatsRollup.filter(
+            period=HOUR, bucket__gte=day, bucket__lt=day + timedelta(days=1)
+        ).exclude(metric=ACTIVE_USERS) \
+            .annotate(total=Sum('value')).group_by('metric').values('metric', 'total')
+        await self._replace_bucket(DAY, day, {row['metric']: _value(row['total']) for row in rows})
+
+    async def _store_active_users(self, now: datetime):
+        """
+        Активные пользователи для открытых интервалов.
+        last_active только растет, поэтому count(last_active >= начало интервала)
+        точен, пока интервал не закрыт; закрытые интервалы не пересчитываются.
+        """
+        for period, bucket in ((HOUR, self.hour_start(now)), (DAY, self.day_start(now))):
+            active = await User.filter(last_active__gte=bucket).count()
+            await StatsRollup.bulk_create(
+                [StatsRollup(period=period, bucket=bucket, metric=ACTIVE_USERS, value=_value(active))],
+                on_conflict=['period', 'bucket', 'metric'],
+                update_fields=['value']
+            )
+
+    async def _rollup_hours(self, hours: Iterable[datetime]):
+        hours = list(hours)
+        for hour in hours:
+            await self._rollup_hour(hour)
+        for day in sorted({self.day_start(hour) for hour in hours}):
+            await self._rollup_day(day)
+
+    async def run_once(self):
+        """Пересчет окна последних часов и открытых интервалов"""
+        now = datetime.now()
+        current = self.hour_start(now)
+        await self._rollup_hours(
+            current - timedelta(hours=offset) for offset in range(self.recompute_hours, -1, -1)
+        )
+        await self._store_active_users(now)
+
+    async def backfill(self, days: int):
+        """Заполнение агрегатов за прошлые дни (active_users восстановить нельзя)"""
+        start = self.day_start(datetime.now()) - timedelta(days=days)
+        end = self.hour_start(datetime.now())
+        hour = start
+        while hour <= end:
+            day_end = min(hour + timedelta(days=1), end + timedelta(hours=1))
+            await self._rollup_hours(
+                hour + timedelta(hours=offset)
+                for offset in range(int((day_end - hour).total_seconds() // 3600))
+            )
+            hour = day_end
+        logger.info(f"Rollups backfilled for {days} days")
+
+    async def run_periodic(self):
+        """Фоновый агрегатор"""
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Rollup aggregation failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def _sum(self, period: str, start: datetime, end: datetime, totals: Dict[str, Decimal]):
+        if start >= end:
+            return
+        rows = await StatsRollup.filter(period=period, bucket__gte=start, bucket__lt=end) \
+            .exclude(metric=ACTIVE_USERS) \
+            .annotate(total=Sum('value')).group_by('metric').values('metric', 'total')
+        for row in rows:
+            totals[row['metric']] += _value(row['total'])
+
+        active = await StatsRollup.filter(
+            period=period, bucket__gte=start, bucket__lt=end, metric=ACTIVE_USERS
+        ).order_by('-value').first()
+        if active:
+            totals[ACTIVE_USERS] = max(totals[ACTIVE_USERS], active.value)
+
+    async def first_bucket(self) -> Optional[datetime]:
+        """Начало самого раннего сохраненного интервала"""
+        row = await StatsRollup.all().order_by('bucket').first()
+        # Сохраненное время возвращается с +00:00; отчеты работают с наивным
+        return row.bucket.replace(tzinfo=None) if row else None
+
+    async def totals(self, start: Optional[datetime], end: datetime) -> Dict[str, Decimal]:
+        """
+        Суммы метрик за произвольный период [start, end).
+        start=None - от самого раннего интервала (итоги за все время).
+        Полные дни берутся из дневных интервалов, края - из часовых.
+        active_users - максимум по интервалам.
+        """
+        totals: Dict[str, Decimal] = defaultdict(Decimal)
+        if start is None:
+            start = await self.first_bucket()
+            if start is None:
+                return totals
+        start, end = self.hour_start(start), self.hour_start(end + timedelta(minutes=59, seconds=59))
+
+        first_day = self.day_start(start)
+        if first_day < start:
+            first_day += timedelta(days=1)
+        last_day = self.day_start(end)
+
+        if first_day < last_day:
+            await self._sum(DAY, first_day, last_day, totals)
+            await self._sum(HOUR, start, first_day, totals)
+            await self._sum(HOUR, last_day, end, totals)
+        else:
+            await self._sum(HOUR, start, end, totals)
+        return totals
+
+    async def series(self, metric: str, start: datetime, end: datetime,
+                     period: str = DAY) -> List[Tuple[datetime, Decimal]]:
+        """Значения метрики по интервалам"""
+        rows = await StatsRollup.filter(
+            period=period, metric=metric, bucket__gte=start, bucket__lt=end
+        ).order_by('bucket').values_list('bucket', 'value')
+        return [(bucket, _value(value)) for bucket, value in rows]
+
+    @staticmethod
+    def group(totals: Dict[str, Decimal], prefix: str) -> Dict[str, Decimal]:
+        """Метрики с префиксом, например videos: -> {'crocodile:completed': 10}"""
+        return {
+            metric[len(prefix):]: value
+            for metric, value in totals.items()
+            if metric.startswith(prefix)
+        }
+
+# Глобальный экземпляр для использования в системе
+rollups = RollupService()
+
+if __name__ == '__main__':
+    # Заполнение агрегатов за прошлые дни: python -m services.rollups [days]
+    import sys
+    from tortoise import run_async
+    from database.db import init_db, close_db
+
+    async def backfill():
+        await init_db()
+        try:
+            await rollups.backfill(int(sys.argv[1]) if len(sys.argv) > 1 else 30)
+        finally:
+            await close_db()
+
+    run_async(backfill())
\ No newline at end of file
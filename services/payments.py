@@ -0,0 +1,336 @@
+import logging
+import random
+import time
+import httpx
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import asyncio
+
+from config import config
+from database.models import LedgerKind, Payment, PaymentStatus, User
+from services.db_writer import db_writer
+from services.events import PaymentCredited, event_bus
+from services.ledger import ledger
+from services.user_stats import user_stats
+
+logger = logging.getLogger(__name__)
+
+# Ответы, после которых запрос можно повторить
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Ошибки, при которых запрос гарантированно не дошел до сервера
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+# Конечные статусы провайдера, кроме paid
+CLOSED_STATUSES = {
+    "expired": PaymentStatus.EXPIRED,
+    "failed": PaymentStatus.FAILED,
+    "canceled": PaymentStatus.FAILED,
+    "cancelled": PaymentStatus.FAILED,
+}
+# Статусы, из которых платеж еще может быть зачислен: после expired
+# провайдер может сообщить о поздней оплате
+CREDITABLE_STATUSES = (PaymentStatus.PENDING, PaymentStatus.EXPIRED)
+
+class RateLimiter:
+    """Не больше rate запросов в секунду на весь процесс (равномерно)"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+class LolzPaymentSystem:
+    def __init__(self):
+        self.api_url = config.LOLZ_API_URL
+        self.check_interval = config.PAYMENT_POLL_TICK  # Как часто искать платежи, которые пора проверить
+        self.active_checks = set()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._rate_limiter = RateLimiter(config.PAYMENT_RATE_LIMIT)
+        self._poll_slots = asyncio.Semaphore(config.PAYMENT_POLL_CONCURRENCY)
+        self._next_check: Dict[int, float] = {}  # id платежа -> время следующей проверки
+        self._status_cache: Dict[str, Tuple[float, dict]] = {}  # payment_id -> (срок годности, ответ)
+        self._status_requests: Dict[str, asyncio.Task] = {}  # Запросы статуса в процессе
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Один долгоживущий клиент с keep-alive на весь процесс"""
+        if self._client is None or self._client.is_closed:
+            http2 = config.PAYMENT_HTTP2
+            if http2:
+                try:
+                    import h2  # noqa: F401
+                except ImportError:
+                    logger.warning("HTTP/2 requires the h2 package, falling back to HTTP/1.1")
+                    http2 = False
+
+            self._client = httpx.AsyncClient(
+                base_url=self.api_url,
+                headers={"Authorization": f"Bearer {config.LOLZ_API_KEY}"},
+                limits=httpx.Limits(
+                    max_connections=config.PAYMENT_MAX_CONNECTIONS,
+                    max_keepalive_connections=config.PAYMENT_MAX_KEEPALIVE,
+                    keepalive_expiry=30
+                ),
+                timeout=httpx.Timeout(config.PAYMENT_CHECK_TIMEOUT, connect=config.PAYMENT_CONNECT_TIMEOUT),
+                http2=http2
+            )
+        return self._client
+
+    async def close(self):
+        """Закрытие соединений (при остановке бота)"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _request(self, method: str, path: str, timeout: float, idempotent: bool, **kwargs) -> httpx.Response:
+        """
+        Запрос с повтором временных ошибок (экспоненциальная пауза со случайным разбросом).
+        Неидемпотентный запрос повторяется, только если он не был отправлен.
+        """
+        timeout = httpx.Timeout(timeout, connect=config.PAYMENT_CONNECT_TIMEOUT)
+        for attempt in range(config.PAYMENT_RETRIES + 1):
+            last_attempt = attempt == config.PAYMENT_RETRIES
+            try:
+                await self._rate_limiter.wait()
+                response = await self.client.request(method, path, timeout=timeout, **kwargs)
+            except httpx.TransportError as e:
+                if last_attempt or not (idempotent or isinstance(e, NOT_SENT_ERRORS)):
+                    raise
+                delay = random.uniform(0, config.PAYMENT_RETRY_BACKOFF * 2 ** attempt)
+                logger.warning(f"{method} {path} failed ({e!r}), retry in {delay:.2f}s")
+            else:
+                if response.status_code not in RETRY_STATUSES or not idempotent or last_attempt:
+                    return response
+                retry_after = response.headers.get("Retry-After", "")
+                delay = float(retry_after) if retry_after.isdigit() else \
+                    random.uniform(0, config.PAYMENT_RETRY_BACKOFF * 2 ** attempt)
+                logger.warning(f"{method} {path} returned {response.status_code}, retry in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    async def create_payment(self, user_id: int, amount: float, description: str) -> Tuple[Optional[str], Optional[str]]:
+        """Создание платежа"""
+        try:
+            payload = {
+                "amount": amount,
+                "user_id": user_id,
+                "description": description,
+                "callback_url": config.LOLZ_CALLBACK_URL
+            }
+
+            response = await self._request(
+                "POST", "/payments",
+                timeout=config.PAYMENT_CREATE_TIMEOUT,
+                idempotent=False,
+                json=payload
+            )
+
+            if response.status_code == 201:
+                data = response.json()
+                payment_id = data["id"]
+
+                # Сохраняем платеж в БД
+                await Payment.create(
+                    payment_id=payment_id,
+                    user_id=user_id,
+                    amount=amount,
+                    currency="RUB",
+                    status="pending",
+                    description=description
+                )
+
+                return data["payment_url"], None
+            else:
+                error = response.json().get("error", "Unknown error")
+                return None, error
+
+        except Exception as e:
+            logger.error(f"Create payment error: {e}")
+            return None, str(e)
+
+    async def check_payment(self, payment_id: str) -> Tuple[Optional[dict], Optional[str]]:
+        """Проверка статуса платежа"""
+        try:
+            response = await self._request(
+                "GET", f"/payments/{payment_id}",
+                timeout=config.PAYMENT_CHECK_TIMEOUT,
+                idempotent=True
+            )
+
+            if response.status_code == 200:
+                return response.json(), None
+            return None, response.text
+
+        except Exception as e:
+            logger.error(f"Check payment error: {e}")
+            return None, str(e)
+
+    async def get_payment_status(self, payment_id: str) -> Tuple[Optional[dict], Optional[str]]:
+        """
+        Статус платежа у провайдера с кэшем на PAYMENT_STATUS_TTL секунд.
+        Одновременные запросы одного платежа (кнопка проверки и фоновая
+        проверка) ждут один и тот же вызов API.
+        """
+        cached = self._status_cache.get(payment_id)
+        if cached and cached[0] > time.monotonic():
+            return cached[1], None
+
+        request = self._status_requests.get(payment_id)
+        if request is None:
+            request = asyncio.create_task(self._fetch_status(payment_id))
+            self._status_requests[payment_id] = request
+            request.add_done_callback(lambda _: self._status_requests.pop(payment_id, None))
+        # Отмена одного ожидающего не должна прерывать запрос для остальных
+        return await asyncio.shield(request)
+
+    async def _fetch_status(self, payment_id: str) -> Tuple[Optional[dict], Optional[str]]:
+        payment_data, error = await self.check_payment(payment_id)
+        if payment_data:
+            self._status_cache[payment_id] = (time.monotonic() + config.PAYMENT_STATUS_TTL, payment_data)
+        return payment_data, error
+
+    async def sync_payment(self, payment: Payment, notify: bool = True) -> Tuple[PaymentStatus, Optional[str]]:
+        """
+        Сверка платежа со статусом провайдера: оплаченный зачисляется
+        (один раз, кто бы его ни увидел, в том числе после expired),
+        отмененный закрывается. Платеж закрывается только по статусу провайдера.
+        Возвращает статус платежа в БД после сверки и ошибку запроса.
+        """
+        if payment.status not in CREDITABLE_STATUSES:
+            return payment.status, None
+
+        payment_data, error = await self.get_payment_status(payment.payment_id)
+        if error:
+            return payment.status, error
+
+        status = payment_data["status"]
+        if status == "paid":
+            await self._process_paid_payment(payment, payment_data, notify=notify)
+        elif status in CLOSED_STATUSES:
+            await self._close_payment(payment, CLOSED_STATUSES[status])
+        else:
+            return payment.status, None
+
+        # Платеж мог перевести другой обработчик - берем статус из БД
+        await payment.refresh_from_db(fields=["status", "paid_at"])
+        return payment.status, None
+
+    async def get_user_balance(self, user_id: int) -> float:
+        """Получение баланса пользователя"""
+        user = await User.get_or_none(id=user_id)
+        return user.balance if user else 0.0
+
+    async def start_payment_checker(self):
+        """
+        Фоновая проверка платежей. При включенных уведомлениях провайдера
+        это редкая сверка на случай потерянного уведомления.
+        """
+        while True:
+            try:
+                await self._check_pending_payments()
+            except Exception as e:
+                logger.error(f"Payment checker error: {e}")
+            await asyncio.sleep(self.check_interval)
+
+    @staticmethod
+    def _poll_interval(age: float) -> float:
+        """
+        Пауза до следующей проверки растет вместе с возрастом платежа:
+        свежие проверяются каждые PAYMENT_POLL_MIN секунд, брошенные - редко
+        """
+        minimum = config.PAYMENT_RECONCILE_MIN if config.PAYMENT_WEBHOOK_ENABLED else config.PAYMENT_POLL_MIN
+        return min(max(age * config.PAYMENT_POLL_FACTOR, minimum), config.PAYMENT_POLL_MAX)
+
+    async def _check_pending_payments(self):
+        """Проверка всех неоплаченных платежей, которым подошел срок (постранично по id)"""
+        now = time.monotonic()
+        pending_ids = set()
+        last_id = 0
+        while True:
+            page: List[Payment] = await Payment.filter(
+                status=PaymentStatus.PENDING, id__gt=last_id
+            ).order_by("id").limit(config.PAYMENT_POLL_PAGE)
+            if not page:
+                break
+            last_id = page[-1].id
+            pending_ids.update(payment.id for payment in page)
+
+            due = [
+                payment for payment in page
+                if self._next_check.get(payment.id, 0) <= now
+                and payment.payment_id not in self.active_checks
+            ]
+            await asyncio.gather(*(self._poll_payment(payment) for payment in due))
+
+            if len(page) < config.PAYMENT_POLL_PAGE:
+                break
+
+        # Расписание только для платежей, которые еще ждут оплаты
+        for payment_id in set(self._next_check) - pending_ids:
+            del self._next_check[payment_id]
+        now = time.monotonic()
+        for payment_id in [key for key, (expires, _) in self._status_cache.items() if expires <= now]:
+            del self._status_cache[payment_id]
+
+    async def _poll_payment(self, payment: Payment):
+        """Проверка одного платежа с ограничением числа одновременных запросов"""
+        async with self._poll_slots:
+            self.active_checks.add(payment.payment_id)
+            try:
+                status, _ = await self.sync_payment(payment)
+                age = (datetime.now(payment.created_at.tzinfo) - payment.created_at).total_seconds()
+
+                if status != PaymentStatus.PENDING:
+                    self._next_check.pop(payment.id, None)
+                else:
+                    # Срок счета знает только провайдер: ошибка запроса или ответ
+                    # pending не закрывают платеж, брошенные просто проверяются реже
+                    self._next_check[payment.id] = time.monotonic() + self._poll_interval(age)
+            except Exception as e:
+                logger.error(f"Payment check error: {e}")
+                self._next_check[payment.id] = time.monotonic() + config.PAYMENT_POLL_MIN
+            finally:
+                self.active_checks.discard(payment.payment_id)
+
+    async def _close_payment(self, payment: Payment, status: PaymentStatus):
+        """Перевод pending-платежа в конечный статус без зачисления"""
+        await Payment.filter(id=payment.id, status=PaymentStatus.PENDING).update(status=status)
+        self._next_check.pop(payment.id, None)
+
+    async def _process_paid_payment(self, payment: Payment, payment_data: dict, notify: bool = True) -> bool:
+        """Обработка успешного платежа (повторный вызов ничего не зачисляет)"""
+        async def confirm(conn) -> bool:
+            # Переводим из pending (или expired) условным UPDATE - второй обработчик получит 0 строк
+            updated = await Payment.filter(
+                id=payment.id,
+                status__in=CREDITABLE_STATUSES
+            ).using_db(conn).update(status=PaymentStatus.PAID, paid_at=datetime.now())
+            if not updated:
+                return False
+
+            await ledger.credit(
+                payment.user_id,
+                payment.amount,
+                LedgerKind.DEPOSIT,
+                description="Пополнение баланса",
+                idempotency_key=f"payment:{payment.id}",
+                connection=conn
+            )
+            await user_stats.increment(payment.user_id, connection=conn, deposits_total=payment.amount)
+            return True
+
+        self._next_check.pop(payment.id, None)
+        credited = await db_writer.transaction(confirm)
+        if credited:
+            event_bus.publish(PaymentCredited(payment.user_id, payment.id, payment.amount, notify=notify))
+        return credited
+
+payment_system = LolzPaymentSystem()
\ No newline at end of file
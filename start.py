@@ -5,10 +5,17 @@ from aiogram.filters import Command, CommandStart
 from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardBuilder
 from aiogram.utils.markdown import hbold
 from datetime import datetime  # Для работы с датами/временем
+from decimal import Decimal
+from typing import Optional
 
 from config import config
-from database.models import User, Referral
+from database.models import LedgerKind, User, Referral
 from handlers.payments import payment_system
+from services.archive import archive
+from services.db_writer import db_writer
+from services.ledger import ledger
+from services.events import ReferralCreated, event_bus
+from services.user_stats import user_stats
 from utils.helpers import escape_markdown
 
 router = Router()
@@ -16,31 +23,27 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 @router.message(CommandStart())
-async def cmd_start(message: Message):
+async def cmd_start(message: Message, db_user: Optional[User] = None, user_created: bool = False):
     """Обработчик команды /start с реферальной системой"""
     try:
-        # Регистрация пользователя
-        user, created = await User.get_or_create(
-            id=message.from_user.id,
-            defaults={
-                'username': message.from_user.username,
-                'full_name': message.from_user.full_name,
-                'balance': 0.0,
-                'registered_at': datetime.now()
-            }
-        )
+        # Пользователь уже зарегистрирован и обновлен в UserMiddleware
+        if db_user:
+            user, created = db_user, user_created
+        else:
+            user, created = await User.get_or_create(
+                id=message.from_user.id,
+                defaults={
+                    'username': message.from_user.username,
+                    'full_name': message.from_user.full_name,
+                    'balance': 0.0,
+                    'registered_at': datetime.now()
+                }
+            )
 
         # Обработка реферальной ссылки
         if len(message.text.split()) > 1 and message.text.split()[1].startswith('ref_'):
             await handle_referral(message)
 
-        # Обновление информации о пользователе
-        if not created:
-            await user.update_from_dict({
-                'username': message.from_user.username,
-                'full_name': message.from_user.full_name
-            }).save()
-
         # Отправка приветственного сообщения
         await send_welcome_message(message, user, created)
 
@@ -57,35 +60,40 @@ async def handle_referral(message: Message):
         return
 
     # Проверяем, есть ли уже такое приглашение
-    if not await Referral.exists(user_id=message.from_user.id):
-        # Создаем запись о реферале
-        await Referral.create(
-            user_id=message.from_user.id,
-            referrer_id=referrer_id
-        )
-
-        # Начисляем бонус рефереру
-        referrer = await User.get_or_none(id=referrer_id)
-        if referrer:
-            new_balance = referrer.balance + config.REFERRAL_BONUS
-            await referrer.update(balance=new_balance).apply()
-
-            # Записываем транзакцию
-            await payment_system.record_payment(
-                user_id=referrer_id,
-                amount=config.REFERRAL_BONUS,
-                description="Реферальное вознаграждение"
+    if not await archive.exists(Referral, user_id=message.from_user.id) and await User.exists(id=referrer_id):
+        # Запись о реферале и бонус рефереру - в одной транзакции
+        async def credit_referrer(conn) -> Optional[Decimal]:
+            await Referral.create(
+                user_id=message.from_user.id,
+                referrer_id=referrer_id,
+                bonus_credited=True,
+                bonus_amount=config.REFERRAL_BONUS,
+                using_db=conn
             )
-
-            # Уведомляем реферера
-            try:
-                await message.bot.send_message(
-                    referrer_id,
-                    f"🎉 Вы получили {config.REFERRAL_BONUS} RUB за приглашенного друга!\n"
-                    f"💰 Ваш баланс: {new_balance} RUB"
+            new_balance = await ledger.credit(
+                referrer_id,
+                config.REFERRAL_BONUS,
+                LedgerKind.REFERRAL_BONUS,
+                description="Реферальное вознаграждение",
+                idempotency_key=f"referral:{message.from_user.id}",
+                connection=conn
+            )
+            if new_balance is not None:
+                await user_stats.increment(
+                    referrer_id, connection=conn,
+                    referrals_count=1, referral_income=config.REFERRAL_BONUS
                 )
-            except Exception as e:
-                logger.error(f"Failed to notify referrer: {e}")
+            return new_balance
+
+        new_balance = await db_writer.transaction(credit_referrer)
+
+        if new_balance is not None:
+            # Уведомление реферера отправит подписчик шины
+            event_bus.publish(ReferralCreated(
+                referrer_id=referrer_id,
+                user_id=message.from_user.id,
+                bonus=Decimal(config.REFERRAL_BONUS)
+            ))
 
 async def send_welcome_message(message: Message, user: User, is_new: bool):
     """Отправка приветственного сообщения с клавиатурой"""
@@ -126,25 +134,23 @@ async def send_welcome_message(message: Message, user: User, is_new: bool):
 @router.callback_query(F.data == "start_bonus")
 async def give_start_bonus(callback: CallbackQuery):
     """Выдача стартового бонуса новым пользователям"""
-    user = await User.get(callback.from_user.id)
-    
-    if user.balance > 0:
-        await callback.answer("Вы уже получили бонус ранее", show_alert=True)
-        return
-    
     bonus_amount = config.START_BONUS
-    await user.update(balance=user.balance + bonus_amount).apply()
-    
-    # Записываем транзакцию
-    await payment_system.record_payment(
-        user_id=user.id,
-        amount=bonus_amount,
-        description="Стартовый бонус"
+    # Ключ идемпотентности гарантирует одно начисление на пользователя
+    new_balance = await ledger.credit(
+        callback.from_user.id,
+        bonus_amount,
+        LedgerKind.START_BONUS,
+        description="Стартовый бонус",
+        idempotency_key=f"start_bonus:{callback.from_user.id}"
     )
+
+    if new_balance is None:
+        await callback.answer("Вы уже получили бонус ранее", show_alert=True)
+        return
     
     await callback.message.edit_text(
         f"🎉 Вы получили стартовый бонус {bonus_amount} RUB!\n"
-        f"💰 Ваш баланс: {bonus_amount} RUB"
+        f"💰 Ваш баланс: {new_balance} RUB"
     )
     await callback.answer()
 
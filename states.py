@@ -9,6 +9,7 @@ class PaymentStates(StatesGroup):
 class VideoProcessingStates(StatesGroup):
     """Состояния для обработки видео"""
     waiting_for_method = State()      # Ожидание выбора метода
+    waiting_for_tier = State()        # Ожидание выбора тарифа качества
     waiting_for_video = State()       # Ожидание загрузки видео
 
 class SupportStates(StatesGroup):
@@ -20,4 +21,5 @@ class AdminStates(StatesGroup):
     """Состояния для админ-панели"""
     waiting_for_user_id = State()     # Для выдачи баланса
     waiting_for_amount = State()      # Для указания суммы
-    waiting_for_broadcast = State()   # Для рассылки сообщений
\ No newline at end of file
+    waiting_for_broadcast = State()   # Для рассылки сообщений
+    waiting_for_period = State()      # Для отчета за период
\ No newline at end of file
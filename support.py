@@ -1,14 +1,15 @@
 import logging
+from datetime import datetime
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.fsm.context import FSMContext
 
-from config import config
 from database.models import SupportTicket, User
+from services.db_writer import db_writer
+from services.events import TicketOpened, event_bus
 from utils.states import SupportStates
-from utils.helpers import escape_markdown
 
 router = Router()
 logging.basicConfig(level=logging.INFO)
@@ -51,15 +52,22 @@ async def process_ticket_text(message: Message, state: FSMContext):
         await message.answer("Пожалуйста, опишите проблему подробнее (минимум 10 символов)")
         return
         
-    ticket = await SupportTicket.create(
+    ticket = await db_writer.transaction(lambda conn: SupportTicket.create(
         user_id=message.from_user.id,
         username=message.from_user.username,
         text=message.text,
-        status="open"
-    )
+        status="open",
+        using_db=conn
+    ))
     
-    # Уведомление админов
-    await notify_admins_about_new_ticket(message.bot, ticket)
+    # Уведомление админов (пачкой через шину событий)
+    event_bus.publish(TicketOpened(
+        ticket_id=ticket.id,
+        user_id=message.from_user.id,
+        username=message.from_user.username,
+        text=message.text,
+        created_at=datetime.now()
+    ))
     
     await message.answer(
         "✅ *Ваше обращение принято\!*\n\n"
@@ -69,31 +77,6 @@ async def process_ticket_text(message: Message, state: FSMContext):
     )
     await state.clear()
 
-async def notify_admins_about_new_ticket(bot, ticket):
-    """Уведомление администраторов о новом обращении"""
-    admin_message = (
-        "🆕 *Новое обращение в поддержку*\n\n"
-        f"ID: `{ticket.id}`\n"
-        f"Пользователь: @{ticket.username} \| `{ticket.user_id}`\n"
-        f"Дата: {ticket.created_at.strftime('%d.%m.%Y %H:%M')}\n\n"
-        f"*Текст обращения:*\n"
-        f"{escape_markdown(ticket.text)}"
-    )
-    
-    builder = InlineKeyboardBuilder()
-    builder.button(text="📝 Ответить", callback_data=f"reply_ticket_{ticket.id}")
-    
-    for admin_id in config.ADMIN_IDS:
-        try:
-            await bot.send_message(
-                admin_id,
-                admin_message,
-                reply_markup=builder.as_markup(),
-                parse_mode="MarkdownV2"
-            )
-        except Exception as e:
-            logger.error(f"Failed to notify admin {admin_id}: {e}")
-
 @router.callback_query(F.data == "my_tickets")
 async def show_user_tickets(callback: CallbackQuery):
     """Показать обращения пользователя"""
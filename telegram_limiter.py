@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Deque, Dict, Optional, Union
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from cachetools import TTLCache
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 0  # Ответы пользователю из обработчиков
+BULK = 1  # Уведомления и рассылки
+
+_lane: ContextVar[int] = ContextVar('telegram_lane', default=INTERACTIVE)
+
+# Методы, на которые действуют лимиты Telegram на сообщения
+LIMITED_PREFIXES = ("send", "copy", "forward", "edit")
+UNLIMITED_METHODS = {"sendChatAction"}
+
+@contextmanager
+def bulk_lane():
+    """Запросы внутри блока пропускают вперед ответы обработчиков"""
+    token = _lane.set(BULK)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+class TokenBucket:
+    """
+    Ведро токенов: rate в секунду, не больше burst подряд.
+    Токен резервируется сразу, поэтому ожидающие получают его по очереди.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """Резерв токена; возвращает, сколько секунд ждать до его получения"""
+        now = time.monotonic()
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+        self.tokens -= 1
+        return (self.updated - now) + max(0.0, -self.tokens / self.rate)
+
+    def pause(self, seconds: float):
+        """Flood wait: следующий токен - не раньше чем через seconds"""
+        self.tokens = min(self.tokens, 1.0)
+        self.updated = max(self.updated, time.monotonic() + seconds)
+
+class ChatBucket(TokenBucket):
+    """
+    Ведро чата. Запросы в один чат проходят по очереди (lock), а токен считается
+    использованным в момент отправки: ожидание в общей очереди не копит новые.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        super().__init__(rate, burst)
+        self.lock = asyncio.Lock()
+
+    def hold(self):
+        """Зарезервированный токен использован сейчас"""
+        self.tokens = max(self.tokens, 0.0)
+        self.updated = max(self.updated, time.monotonic())
+
+class PriorityBucket:
+    """Общий лимит бота: очередь INTERACTIVE получает токены раньше BULK"""
+
+    def __init__(self, rate: float, burst: int):
+        self.bucket = TokenBucket(rate, burst)
+        self._waiters: Dict[int, Deque[asyncio.Future]] = {INTERACTIVE: deque(), BULK: deque()}
+        self._pump: Optional[asyncio.Task] = None
+
+    async def acquire(self, lane: int):
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[lane].append(future)
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.create_task(self._run())
+        await future
+
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        for lane in (INTERACTIVE, BULK):
+            queue = self._waiters[lane]
+            while queue:
+                future = queue.popleft()
+                if not future.done():  # Отмененные пропускаем
+                    return future
+        return None
+
+    async def _run(self):
+        while any(self._waiters.values()):
+            delay = self.bucket.reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            # Очередь выбирается в момент выдачи токена: срочный запрос,
+            # пришедший во время ожидания, обгоняет рассылку
+            future = self._next_waiter()
+            if future is None:
+                self.bucket.tokens += 1
+                return
+            future.set_result(None)
+
+class TelegramLimiter(BaseRequestMiddleware):
+    """
+    Лимиты исходящих сообщений на уровне сессии бота: общий (TG_GLOBAL_RATE)
+    и на каждый чат (личные - TG_CHAT_RATE, группы и каналы - TG_GROUP_RATE).
+    Ответ 429 не теряет сообщение: чат ставится на паузу retry_after,
+    и запрос повторяется до TG_FLOOD_RETRIES раз.
+    """
+
+    def __init__(self):
+        self.global_bucket = PriorityBucket(config.TG_GLOBAL_RATE, config.TG_GLOBAL_BURST)
+        self.retries = config.TG_FLOOD_RETRIES
+        self.flood_waits = 0
+        # Ведра неактивных чатов исчезают сами
+        self._chats: TTLCache = TTLCache(maxsize=100_000, ttl=600)
+
+    def _chat_bucket(self, chat_id: Union[int, str]) -> ChatBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if isinstance(chat_id, int) and chat_id > 0:
+                bucket = ChatBucket(config.TG_CHAT_RATE, config.TG_CHAT_BURST)
+            else:
+                bucket = ChatBucket(config.TG_GROUP_RATE, config.TG_GROUP_BURST)
+        self._chats[chat_id] = bucket  # Продлеваем TTL
+        return bucket
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType]
+    ) -> Response[TelegramType]:
+        api_method = method.__api_method__
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None or api_method in UNLIMITED_METHODS or not api_method.startswith(LIMITED_PREFIXES):
+            return await make_request(bot, method)
+
+        lane = _lane.get()
+        for attempt in range(self.retries + 1):
+            bucket = self._chat_bucket(chat_id)
+            async with bucket.lock:
+                delay = bucket.reserve()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                await self.global_bucket.acquire(lane)
+                # Интервал до следующего сообщения в чат - от фактической отправки
+                bucket.hold()
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == self.retries:
+                    raise
+                self.flood_waits += 1
+                logger.warning(f"Flood wait {e.retry_after}s on {api_method} to {chat_id}")
+                bucket.pause(e.retry_after)
+
+# Глобальный экземпляр для использования в системе
+telegram_limiter = TelegramLimiter()
@@ -0,0 +1,5 @@
+import os
+
+# config.py требует эти переменные при импорте; тестам реальные значения не нужны
+for name in ("BOT_TOKEN", "LOLZ_API_KEY", "LOLZ_SECRET_KEY"):
+    os.environ.setdefault(name, "test")
@@ -0,0 +1,36 @@
+"""
+Пути файлов локального Bot API сервера, когда каталоги смонтированы
+у бота и сервера по-разному (например, в Docker).
+"""
+from pathlib import Path
+
+import pytest
+
+from config import config
+from services.bot_api import input_file, local_path, server_path
+
+
+@pytest.fixture
+def mounts(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "BOT_API_SERVER", "http://localhost:8082")
+    monkeypatch.setattr(config, "TEMP_DIR", tmp_path / "temp_files")
+    monkeypatch.setattr(config, "PROCESSED_DIR", tmp_path / "processed_videos")
+    monkeypatch.setattr(config, "BOT_API_TEMP_DIR", Path("/srv/bot/temp_files"))
+    monkeypatch.setattr(config, "BOT_API_PROCESSED_DIR", Path("/srv/bot/processed_videos"))
+    monkeypatch.setattr(config, "BOT_API_SERVER_DIR", Path("/var/lib/telegram-bot-api"))
+    monkeypatch.setattr(config, "BOT_API_FILES_DIR", tmp_path / "bot-api")
+    return tmp_path
+
+
+def test_results_are_sent_by_server_path(mounts):
+    assert input_file(config.TEMP_DIR / "job" / "result.mp4") == "file:///srv/bot/temp_files/job/result.mp4"
+    assert input_file(config.PROCESSED_DIR / "cached.mp4") == "file:///srv/bot/processed_videos/cached.mp4"
+    # Каталог, известный только по одному пути, передается как есть
+    assert server_path(Path("/data/video.mp4")) == Path("/data/video.mp4")
+
+
+def test_server_and_bot_paths_are_inverse(mounts):
+    server_file = "/var/lib/telegram-bot-api/123:token/videos/file_1.mp4"
+    bot_file = local_path(server_file)
+    assert bot_file == mounts / "bot-api" / "123:token" / "videos" / "file_1.mp4"
+    assert server_path(bot_file) == Path(server_file)
@@ -0,0 +1,74 @@
+"""
+Групповая фиксация записей SQLite (db_writer): остановка не теряет
+принятые записи - ни ждущие попутчиков, ни уже выполняемые в пакете.
+"""
+import asyncio
+
+import pytest
+from tortoise import Tortoise
+from tortoise.backends.base.executor import EXECUTOR_CACHE
+
+from database.db import orm_config, sqlite_connection
+from database.migrations import migrate
+from database.models import User
+from services.db_writer import WriteMetrics, db_writer
+
+
+@pytest.fixture
+def writer(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_writer, "enabled", True)
+    monkeypatch.setattr(db_writer, "window", 0.2)
+    monkeypatch.setattr(db_writer, "batch_max", 3)
+    monkeypatch.setattr(db_writer, "metrics", WriteMetrics())
+    return orm_config(sqlite_connection(tmp_path / "bot.db"))
+
+
+def run(orm: dict, scenario):
+    async def main():
+        # SQL моделей кэшируется по имени соединения; тесты PostgreSQL могли оставить свой
+        EXECUTOR_CACHE.clear()
+        await Tortoise.init(config=orm)
+        try:
+            await migrate(fresh=True)
+            await scenario()
+        finally:
+            await db_writer.close()
+            await Tortoise.close_connections()
+
+    asyncio.run(main())
+
+
+async def create_user(user_id: int) -> int:
+    async def write(conn):
+        await User.create(id=user_id, full_name=f"User {user_id}", using_db=conn)
+        await asyncio.sleep(0.02)
+        return user_id
+
+    return await db_writer.transaction(write)
+
+
+def test_close_commits_write_waiting_in_window(writer):
+    async def scenario():
+        write = asyncio.create_task(create_user(1))
+        await asyncio.sleep(0.05)  # Запись ждет попутчиков
+        await db_writer.close()
+        assert await asyncio.wait_for(write, 1) == 1
+        assert await User.exists(id=1)
+
+    run(writer, scenario)
+
+
+def test_close_commits_running_and_queued_batches(writer):
+    async def scenario():
+        writes = [asyncio.create_task(create_user(user_id)) for user_id in range(1, 11)]
+        await asyncio.sleep(0.03)  # Первый пакет выполняется, остальные в очереди
+        await db_writer.close()
+        assert sorted(await asyncio.wait_for(asyncio.gather(*writes), 1)) == list(range(1, 11))
+        assert await User.all().count() == 10
+        assert db_writer.metrics.batches >= 4
+
+        # После остановки запись идет обычной транзакцией
+        assert await create_user(11) == 11
+        assert await User.exists(id=11)
+
+    run(writer, scenario)
@@ -0,0 +1,146 @@
+"""
+HTTP-клиент платежной системы: повторы временных ошибок и общий пул соединений.
+Ответы провайдера подставляет httpx.MockTransport, пул проверяется на локальном сервере.
+"""
+import asyncio
+import json
+import socket
+import time
+
+import httpx
+import pytest
+import uvicorn
+
+from config import config
+from services import payments
+from services.payments import LolzPaymentSystem
+
+
+@pytest.fixture
+def payment_system(monkeypatch):
+    monkeypatch.setattr(config, "PAYMENT_RATE_LIMIT", 0)
+    monkeypatch.setattr(config, "PAYMENT_RETRIES", 3)
+    monkeypatch.setattr(config, "PAYMENT_RETRY_BACKOFF", 0.01)
+    return LolzPaymentSystem()
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    """Ответы провайдера по очереди: httpx.Response или исключение транспорта"""
+    responses = []
+    requests = []
+
+    def handle(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        response = responses.pop(0) if len(responses) > 1 else responses[0]
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    client_class = httpx.AsyncClient
+    monkeypatch.setattr(
+        payments.httpx, "AsyncClient",
+        lambda **kwargs: client_class(transport=httpx.MockTransport(handle), **kwargs)
+    )
+    return responses, requests
+
+
+def test_status_check_retries_transient_errors(payment_system, provider):
+    responses, requests = provider
+    responses += [
+        httpx.Response(429, headers={"Retry-After": "1"}),
+        httpx.Response(503),
+        httpx.ReadTimeout("timed out"),
+        httpx.Response(200, json={"id": "p1", "status": "paid"}),
+    ]
+
+    async def scenario():
+        started = time.monotonic()
+        result = await payment_system.check_payment("p1")
+        await payment_system.close()
+        return result, time.monotonic() - started
+
+    (data, error), elapsed = asyncio.run(scenario())
+    assert error is None and data["status"] == "paid"
+    assert len(requests) == 4
+    assert elapsed >= 1  # Пауза из Retry-After
+    assert requests[0].headers["Authorization"] == f"Bearer {config.LOLZ_API_KEY}"
+
+
+def test_status_check_gives_up_after_retries(payment_system, provider):
+    responses, requests = provider
+    responses.append(httpx.Response(502, text="Bad Gateway"))
+
+    data, error = asyncio.run(payment_system.check_payment("p1"))
+    assert data is None and error == "Bad Gateway"
+    assert len(requests) == config.PAYMENT_RETRIES + 1
+
+
+@pytest.mark.parametrize("failure", [httpx.Response(503), httpx.ReadTimeout("timed out")])
+def test_sent_payment_creation_is_not_retried(payment_system, provider, failure):
+    responses, requests = provider
+    responses += [failure, httpx.Response(201, json={"id": "p1", "payment_url": "https://pay/p1"})]
+
+    url, error = asyncio.run(payment_system.create_payment(1, 100, "Пополнение"))
+    assert url is None and error
+    assert len(requests) == 1
+    assert requests[0].method == "POST"
+
+
+def test_unsent_payment_creation_is_retried(payment_system, provider):
+    responses, requests = provider
+    responses += [httpx.ConnectError("refused"), httpx.Response(400, json={"error": "Bad amount"})]
+
+    url, error = asyncio.run(payment_system.create_payment(1, 100, "Пополнение"))
+    assert (url, error) == (None, "Bad amount")
+    assert len(requests) == 2
+
+
+class FakeProvider:
+    """Локальный сервер платежей: запоминает адрес клиента каждого запроса"""
+
+    def __init__(self):
+        self.clients = []
+
+    async def __call__(self, scope, receive, send):
+        self.clients.append(tuple(scope["client"]))
+        body = json.dumps({"id": scope["path"].rsplit("/", 1)[-1], "status": "pending"}).encode()
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": body})
+
+
+def test_requests_share_one_pooled_client(payment_system, monkeypatch):
+    monkeypatch.setattr(config, "PAYMENT_MAX_CONNECTIONS", 4)
+    provider = FakeProvider()
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    payment_system.api_url = f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+    async def scenario():
+        server = uvicorn.Server(uvicorn.Config(provider, lifespan="off", log_level="warning"))
+        serving = asyncio.create_task(server.serve(sockets=[sock]))
+        while not server.started:
+            await asyncio.sleep(0.01)
+        try:
+            client = payment_system.client
+            for number in range(10):
+                data, error = await payment_system.check_payment(f"p{number}")
+                assert error is None and data["status"] == "pending"
+            sequential = set(provider.clients)
+
+            provider.clients.clear()
+            results = await asyncio.gather(*(payment_system.check_payment(f"p{number}") for number in range(20)))
+            assert all(error is None for _, error in results)
+            assert payment_system.client is client
+            return sequential, set(provider.clients)
+        finally:
+            await payment_system.close()
+            server.should_exit = True
+            await serving
+
+    sequential, concurrent = asyncio.run(scenario())
+    # Последовательные запросы идут по одному keep-alive соединению,
+    # параллельные - не больше PAYMENT_MAX_CONNECTIONS
+    assert len(sequential) == 1
+    assert 1 <= len(concurrent) <= 4
@@ -0,0 +1,35 @@
+"""
+Планы запросов обработчиков на заполненной SQLite-базе (database.query_plans):
+регрессия индекса роняет тесты, а не только ручной запуск скрипта.
+"""
+import asyncio
+
+import pytest
+from tortoise.backends.base.executor import EXECUTOR_CACHE
+
+from database.models import User
+from database.query_plans import QUERIES, check
+
+ROWS = 5_000
+
+
+def run_check(*args):
+    # SQL моделей кэшируется по имени соединения; другие тесты могли оставить в кэше PostgreSQL
+    EXECUTOR_CACHE.clear()
+    return asyncio.run(check(ROWS, *args))
+
+
+@pytest.fixture(scope="module")
+def failures():
+    return run_check()
+
+
+@pytest.mark.parametrize("name", [name for name, _, _ in QUERIES])
+def test_query_uses_index(failures, name):
+    assert failures.get(name) is None, failures[name]
+
+
+def test_full_scan_is_reported():
+    # Поле без индекса: проверка должна заметить полный просмотр
+    query = ("users: by full name", lambda: User.filter(full_name="User 1"), False)
+    assert run_check([query])["users: by full name"]
@@ -0,0 +1,170 @@
+"""
+Лимиты исходящих сообщений на локальном сервере Bot API:
+общий и по чатам, очередность INTERACTIVE и BULK, повтор после 429.
+"""
+import asyncio
+import socket
+import time
+from contextlib import asynccontextmanager
+
+import pytest
+import uvicorn
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramRetryAfter
+from fastapi import FastAPI, Request
+
+from config import config
+from services.telegram_limiter import TelegramLimiter, bulk_lane
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    monkeypatch.setattr(config, "TG_GLOBAL_RATE", 20)
+    monkeypatch.setattr(config, "TG_GLOBAL_BURST", 2)
+    monkeypatch.setattr(config, "TG_CHAT_RATE", 4)
+    monkeypatch.setattr(config, "TG_CHAT_BURST", 1)
+    monkeypatch.setattr(config, "TG_FLOOD_RETRIES", 2)
+    return TelegramLimiter()
+
+
+class FakeBotApi:
+    """
+    Локальный Bot API: запоминает чат и текст каждого сообщения,
+    чатам из flood_chats один раз отвечает 429.
+    Время сообщения - момент, когда лимитер отпустил запрос: ответы сервера
+    в том же цикле событий приходят с задержками и сбивали бы подсчет.
+    """
+
+    def __init__(self, flood_chats=(), retry_after=1):
+        self.sent = []  # (время, чат, текст)
+        self.released = {}  # Текст -> время выхода из лимитера
+        self.flood_chats = set(flood_chats)
+        self.retry_after = retry_after
+        self.app = FastAPI()
+        self.app.post("/bot{token}/{method}")(self.handle)
+
+    async def record(self, make_request, bot, method):
+        self.released[method.text] = time.monotonic()
+        return await make_request(bot, method)
+
+    async def handle(self, token: str, method: str, request: Request):
+        form = await request.form()
+        chat_id = int(form["chat_id"])
+        if chat_id in self.flood_chats:
+            self.flood_chats.discard(chat_id)
+            return {
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }
+        self.sent.append((self.released[form["text"]], chat_id, form["text"]))
+        return {"ok": True, "result": {
+            "message_id": len(self.sent), "date": 0,
+            "chat": {"id": chat_id, "type": "private"}, "text": form["text"],
+        }}
+
+    def times(self, prefix: str = "", chat_id: int = None):
+        return [sent for sent, chat, text in self.sent
+                if text.startswith(prefix) and chat_id in (None, chat)]
+
+
+@asynccontextmanager
+async def serve(api: FakeBotApi, limiter: TelegramLimiter):
+    """Бот с лимитером, подключенный к локальному Bot API"""
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(api.app, lifespan="off", log_level="warning"))
+    serving = asyncio.create_task(server.serve(sockets=[sock]))
+    while not server.started:
+        await asyncio.sleep(0.01)
+    session = AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{sock.getsockname()[1]}"))
+    bot = Bot("123:test", session=session)
+    bot.session.middleware(limiter)
+    bot.session.middleware(api.record)  # Внутренний: вызывается после лимитера
+    try:
+        yield bot
+    finally:
+        await bot.session.close()
+        server.should_exit = True
+        await serving
+
+
+def max_per_second(times):
+    return max(sum(1 for sent in times if start <= sent < start + 1) for start in times)
+
+
+def test_global_and_chat_caps(limiter):
+    api = FakeBotApi()
+
+    async def scenario():
+        async with serve(api, limiter) as bot:
+            await asyncio.gather(
+                *(bot.send_message(1000 + number, f"many{number}") for number in range(40)),
+                *(bot.send_message(1, f"same{number}") for number in range(6)),
+            )
+
+    asyncio.run(scenario())
+    assert len(api.sent) == 46
+    # Общий лимит: rate в секунду плюс запас burst
+    assert max_per_second(api.times()) <= config.TG_GLOBAL_RATE + config.TG_GLOBAL_BURST
+    # Один личный чат: не чаще TG_CHAT_RATE
+    same = api.times("same", chat_id=1)
+    assert max_per_second(same) <= config.TG_CHAT_RATE + config.TG_CHAT_BURST
+    assert same[-1] - same[0] >= (len(same) - config.TG_CHAT_BURST) / config.TG_CHAT_RATE - 0.05
+
+
+def test_interactive_overtakes_bulk(limiter):
+    api = FakeBotApi()
+
+    async def scenario():
+        async with serve(api, limiter) as bot:
+            async def notify(number):
+                with bulk_lane():
+                    await bot.send_message(1000 + number, f"bulk{number}")
+
+            bulk = [asyncio.create_task(notify(number)) for number in range(40)]
+            await asyncio.sleep(0.3)
+            # Ответы обработчиков приходят, когда рассылка уже в очереди
+            await asyncio.gather(*(bot.send_message(number, f"reply{number}") for number in range(1, 6)))
+            replied = time.monotonic()
+            await asyncio.gather(*bulk)
+            return replied
+
+    replied = asyncio.run(scenario())
+    replies = api.times("reply")
+    bulk = api.times("bulk")
+    assert len(replies) == 5 and len(bulk) == 40
+    # Все ответы ушли раньше хвоста рассылки, почти без ожидания
+    assert max(replies) < max(bulk)
+    assert sum(1 for sent in bulk if sent > replied) >= 20
+
+
+def test_retry_after_flood_wait(limiter):
+    api = FakeBotApi(flood_chats={7}, retry_after=1)
+
+    async def scenario():
+        async with serve(api, limiter) as bot:
+            started = time.monotonic()
+            message = await bot.send_message(7, "flood")
+            return message, time.monotonic() - started
+
+    message, elapsed = asyncio.run(scenario())
+    assert message.text == "flood"
+    assert len(api.times(chat_id=7)) == 1
+    assert limiter.flood_waits == 1
+    assert elapsed >= 1  # Чат стоял на паузе retry_after
+
+
+def test_flood_wait_gives_up_after_retries(limiter, monkeypatch):
+    monkeypatch.setattr(limiter, "retries", 0)
+    api = FakeBotApi(flood_chats={7})
+
+    async def scenario():
+        async with serve(api, limiter) as bot:
+            await bot.send_message(7, "flood")
+
+    with pytest.raises(TelegramRetryAfter):
+        asyncio.run(scenario())
+    assert api.sent == []
@@ -0,0 +1,70 @@
+"""
+Отложенная запись полей пользователя (user_cache) и флаг is_active,
+который снимает рассылка у заблокировавших бота.
+"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from tortoise import Tortoise
+from tortoise.backends.base.executor import EXECUTOR_CACHE
+
+from database.db import orm_config, sqlite_connection
+from database.migrations import migrate
+from database.models import User
+from services.db_writer import db_writer
+from services.user_cache import UserCache
+
+
+@pytest.fixture
+def orm(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_writer, "enabled", False)
+    return orm_config(sqlite_connection(tmp_path / "bot.db"))
+
+
+def run(orm: dict, scenario):
+    async def main():
+        # SQL моделей кэшируется по имени соединения; тесты PostgreSQL могли оставить свой
+        EXECUTOR_CACHE.clear()
+        await Tortoise.init(config=orm)
+        try:
+            await migrate(fresh=True)
+            await scenario()
+        finally:
+            await Tortoise.close_connections()
+
+    asyncio.run(main())
+
+
+def tg_user(user_id: int, username: str = "user"):
+    return SimpleNamespace(id=user_id, username=username, full_name="Test User")
+
+
+def test_flush_keeps_blocked_flag_from_broadcast(orm):
+    async def scenario():
+        cache = UserCache()
+        await cache.resolve(tg_user(1))
+        await cache.resolve(tg_user(1, "renamed"))  # Изменение ждет записи
+
+        # Рассылка тем временем узнала, что пользователь заблокировал бота
+        await User.filter(id=1).update(is_active=False)
+        await cache.flush()
+
+        user = await User.get(id=1)
+        assert user.username == "renamed"
+        assert user.is_active is False
+
+    run(orm, scenario)
+
+
+def test_returning_user_is_reactivated(orm):
+    async def scenario():
+        await User.create(id=1, username="user", full_name="Test User", is_active=False)
+        cache = UserCache()
+        db_user, created = await cache.resolve(tg_user(1))
+        assert not created and db_user.is_active
+        await cache.flush()
+
+        assert (await User.get(id=1)).is_active is True
+
+    run(orm, scenario)
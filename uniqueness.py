@@ -0,0 +1,174 @@
+import argparse
+import asyncio
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional
+
+import cv2
+import ffmpeg
+import numpy as np
+
+from config import config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+HASH_SIZE = 32      # Размер кадра для DCT
+HASH_LOW_FREQ = 8   # Низкочастотный блок 8x8 -> 64-битный pHash
+
+
+def _dct_matrix(size: int) -> np.ndarray:
+    """Матрица ортонормированного DCT-II"""
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    matrix = np.sqrt(2.0 / size) * np.cos(np.pi * (2 * n + 1) * k / (2 * size))
+    matrix[0] /= np.sqrt(2.0)
+    return matrix.astype(np.float32)
+
+
+_DCT = _dct_matrix(HASH_SIZE)
+
+
+class UniquenessVerifier:
+    """Оценка уникальности результата по перцептивным хэшам кадров"""
+
+    def __init__(self, samples: int = 16):
+        self.samples = samples
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def sample_frames(self, video_path: Path) -> np.ndarray:
+        """Равномерная выборка кадров в оттенках серого, массив (N, 32, 32)"""
+        capture = cv2.VideoCapture(str(video_path))
+        try:
+            total = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+            if total <= 0:
+                raise ValueError(f"No frames in {video_path}")
+
+            frames = []
+            for index in np.linspace(0, total - 1, min(self.samples, total)).astype(int):
+                capture.set(cv2.CAP_PROP_POS_FRAMES, int(index))
+                ok, frame = capture.read()
+                if not ok:
+                    continue
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                frames.append(cv2.resize(gray, (HASH_SIZE, HASH_SIZE), interpolation=cv2.INTER_AREA))
+        finally:
+            capture.release()
+
+        if not frames:
+            raise ValueError(f"Could not read frames from {video_path}")
+        return np.stack(frames).astype(np.float32)
+
+    @staticmethod
+    def phash(frames: np.ndarray) -> np.ndarray:
+        """pHash для пачки кадров сразу, массив битов (N, 64)"""
+        coeffs = np.einsum('kn,fnm,lm->fkl', _DCT, frames, _DCT)
+        low = coeffs[:, :HASH_LOW_FREQ, :HASH_LOW_FREQ].reshape(len(frames), -1)
+        # DC-коэффициент не участвует в медиане - он отражает только яркость
+        median = np.median(low[:, 1:], axis=1, keepdims=True)
+        return low > median
+
+    @staticmethod
+    def distance_matrix(hashes_a: np.ndarray, hashes_b: np.ndarray) -> np.ndarray:
+        """Доля различающихся битов для всех пар кадров, массив (len(a), len(b))"""
+        return (hashes_a[:, None, :] != hashes_b[None, :, :]).mean(axis=2)
+
+    def score(self, input_path: Path, output_path: Path) -> Dict[str, float]:
+        """
+        Оценка уникальности результата.
+        Каждый кадр результата сравнивается со всеми кадрами исходника
+        (и их зеркальными копиями), так что обрезка, смена скорости и
+        отзеркаливание не завышают оценку.
+        """
+        source = self.sample_frames(input_path)
+        result = self.sample_frames(output_path)
+
+        result_hashes = self.phash(result)
+        distances = np.minimum(
+            self.distance_matrix(result_hashes, self.phash(source)),
+            self.distance_matrix(result_hashes, self.phash(source[:, :, ::-1]))
+        )
+        nearest = distances.min(axis=1)
+
+        return {
+            'score': float(nearest.mean()),
+            'min': float(nearest.min()),
+            'frames': int(len(nearest)),
+        }
+
+    async def verify(self, input_path: Path, output_path: Path,
+                     threshold: Optional[float] = None) -> Dict[str, float]:
+        """Асинхронная проверка с признаком прохождения порога"""
+        threshold = config.UNIQUENESS_THRESHOLD if threshold is None else threshold
+        loop = asyncio.get_event_loop()
+        report = await loop.run_in_executor(self.executor, self.score, input_path, output_path)
+        report['passed'] = report['score'] >= threshold
+        return report
+
+    async def find_min_level(self, editor, input_path: Path, method: str,
+                             tier: Optional[str] = None, threshold: Optional[float] = None,
+                             sample_seconds: int = 10) -> Dict[str, object]:
+        """
+        Поиск самого слабого (и самого дешевого) уровня эффектов комнаты,
+        который проходит порог уникальности.
+        Уровни проверяются по возрастанию силы на коротком фрагменте видео.
+        """
+        levels = config.EFFECT_LEVELS[method]
+        results = []
+
+        with tempfile.TemporaryDirectory(dir=config.TEMP_DIR) as temp_dir:
+            sample_path = Path(temp_dir) / f"sample_{input_path.name}"
+            (
+                ffmpeg.input(str(input_path), t=sample_seconds)
+                .output(str(sample_path), c='copy')
+                .run(quiet=True)
+            )
+
+            for level, effects in enumerate(levels):
+                output_path = await editor.process_video(sample_path, method, tier, effects=effects)
+                try:
+                    report = await self.verify(sample_path, output_path, threshold)
+                    report.update(level=level, size=output_path.stat().st_size)
+                finally:
+                    output_path.unlink(missing_ok=True)
+
+                results.append(report)
+                logger.info(f"Uniqueness {method} level {level}: {report['score']:.3f}")
+                if report['passed']:
+                    return {'method': method, 'level': level, 'effects': effects, 'reports': results}
+
+        return {'method': method, 'level': None, 'effects': None, 'reports': results}
+
+    def __del__(self):
+        self.executor.shutdown(wait=False)
+
+
+# Глобальный экземпляр для использования в системе
+uniqueness_verifier = UniquenessVerifier()
+
+if __name__ == '__main__':
+    # Проверка уникальности: python -m services.uniqueness input.mp4 output.mp4
+    # Подбор уровня:         python -m services.uniqueness input.mp4 --search crocodile
+    parser = argparse.ArgumentParser(description="Video uniqueness verifier")
+    parser.add_argument('input', type=Path)
+    parser.add_argument('output', type=Path, nargs='?')
+    parser.add_argument('--search', metavar='METHOD', choices=sorted(config.EFFECT_LEVELS))
+    parser.add_argument('--tier', default=None)
+    parser.add_argument('--threshold', type=float, default=None)
+    args = parser.parse_args()
+    if not args.search and not args.output:
+        parser.error("output is required unless --search is given")
+
+    async def run():
+        if args.search:
+            from services.video_editor import VideoEditor
+            result = await uniqueness_verifier.find_min_level(
+                VideoEditor(), args.input, args.search, args.tier, args.threshold
+            )
+        else:
+            result = await uniqueness_verifier.verify(args.input, args.output, args.threshold)
+        print(result)
+
+    asyncio.run(run())
\ No newline at end of file
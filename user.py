@@ -1,8 +1,7 @@
 from aiogram import BaseMiddleware
 from aiogram.types import TelegramObject
 from typing import Callable, Dict, Awaitable, Any
-from database.models import User
-from datetime import datetime
+from services.user_cache import user_cache
 import logging
 
 logger = logging.getLogger(__name__)
@@ -20,34 +19,18 @@ class UserMiddleware(BaseMiddleware):
             return await handler(event, data)
 
         try:
-            # Регистрируем или обновляем пользователя
-            db_user, created = await User.get_or_create(
-                id=user.id,
-                defaults={
-                    'username': user.username,
-                    'full_name': user.full_name,
-                    'last_active': datetime.now()
-                }
-            )
-
-            if not created:
-                updates = {}
-                if user.username != db_user.username:
-                    updates['username'] = user.username
-                if user.full_name != db_user.full_name:
-                    updates['full_name'] = user.full_name
-                
-                if updates:
-                    updates['last_active'] = datetime.now()
-                    await db_user.update_from_dict(updates).save()
+            # Регистрируем пользователя; обновления профиля пишутся пачками
+            db_user, created = await user_cache.resolve(user)
 
             # Добавляем пользователя в данные
             data['db_user'] = db_user
+            data['user_created'] = created
             logger.debug(f"User processed: {user.id}")
 
         except Exception as e:
             logger.error(f"User middleware error: {e}", exc_info=True)
             # Продолжаем обработку даже при ошибке
             data['db_user'] = None
+            data['user_created'] = False
 
         return await handler(event, data)
\ No newline at end of file
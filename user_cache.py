@@ -0,0 +1,97 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Set, Tuple
+
+from cachetools import TTLCache
+
+from config import config
+from database.models import User
+from services.db_writer import db_writer
+
+logger = logging.getLogger(__name__)
+
+class UserCache:
+    """
+    Кэш пользователей в памяти процесса (LRU с TTL).
+    Изменения username/full_name/last_active копятся и пишутся в БД
+    пачками раз в USER_FLUSH_INTERVAL секунд.
+    is_active в пачку не входит: рассылка снимает его в БД, пока пользователь
+    ждет записи, и слепое обновление вернуло бы True. Вернувшиеся после
+    блокировки включаются отдельным условным UPDATE.
+    """
+
+    FLUSH_FIELDS = ['username', 'full_name', 'last_active']
+
+    def __init__(self):
+        self.users: TTLCache = TTLCache(maxsize=config.USER_CACHE_SIZE, ttl=config.USER_CACHE_TTL)
+        self.dirty: Dict[int, User] = {}
+        self.reactivated: Set[int] = set()
+        self.flush_interval = config.USER_FLUSH_INTERVAL
+        self._lock = asyncio.Lock()
+
+    async def resolve(self, tg_user) -> Tuple[User, bool]:
+        """Пользователь из кэша или БД, возвращает (user, created)"""
+        db_user = self.users.get(tg_user.id)
+        if db_user is not None:
+            self._touch(db_user, tg_user)
+            return db_user, False
+
+        db_user, created = await User.get_or_create(
+            id=tg_user.id,
+            defaults={
+                'username': tg_user.username,
+                'full_name': tg_user.full_name,
+                'last_active': datetime.now()
+            }
+        )
+        if not created:
+            self._touch(db_user, tg_user)
+        self.users[tg_user.id] = db_user
+        return db_user, created
+
+    def _touch(self, db_user: User, tg_user):
+        """Обновление полей в памяти с постановкой в очередь записи"""
+        db_user.username = tg_user.username
+        db_user.full_name = tg_user.full_name
+        db_user.last_active = datetime.now()
+        if not db_user.is_active:
+            # Вернулся после блокировки бота - снова получает рассылки
+            db_user.is_active = True
+            self.reactivated.add(db_user.id)
+        self.dirty[db_user.id] = db_user
+
+    def invalidate(self, user_id: int):
+        """Сброс кэша пользователя (после изменения баланса и т.п.)"""
+        self.users.pop(user_id, None)
+
+    async def flush(self):
+        """Запись накопленных изменений пачкой UPDATE-запросов"""
+        async with self._lock:
+            if not self.dirty:
+                return
+            pending, self.dirty = list(self.dirty.values()), {}
+            reactivated, self.reactivated = list(self.reactivated), set()
+            try:
+                await User.bulk_update(pending, fields=self.FLUSH_FIELDS, batch_size=500)
+                if reactivated:
+                    await db_writer.transaction(
+                        lambda conn: User.filter(id__in=reactivated, is_active=False)
+                        .using_db(conn).update(is_active=True)
+                    )
+                logger.debug(f"Flushed {len(pending)} user updates")
+            except Exception as e:
+                logger.error(f"User flush failed: {e}")
+                # Возвращаем в очередь то, что не было перезаписано новыми изменениями
+                for db_user in pending:
+                    self.dirty.setdefault(db_user.id, db_user)
+                self.reactivated.update(reactivated)
+
+    async def run_periodic_flush(self):
+        """Фоновая запись изменений"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+# Глобальный экземпляр для использования в системе
+user_cache = UserCache()
\ No newline at end of file
@@ -0,0 +1,104 @@
+import logging
+from collections import defaultdict
+from decimal import Decimal
+from typing import Dict, Optional
+
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.expressions import F
+from tortoise.functions import Count, Sum
+from tortoise.transactions import in_transaction
+
+from database.models import Payment, PaymentStatus, Referral, UserStats, VideoProcessing, VideoStatus
+from services.archive import archive
+
+logger = logging.getLogger(__name__)
+
+STAT_FIELDS = ('videos_count', 'videos_spent', 'referrals_count', 'referral_income', 'deposits_total')
+
+class UserStatsService:
+    """Материализованные счетчики профиля пользователя"""
+
+    async def get(self, user_id: int) -> UserStats:
+        """Счетчики одним чтением по первичному ключу (нули, если записи нет)"""
+        stats = await UserStats.get_or_none(user_id=user_id)
+        return stats or UserStats(user_id=user_id)
+
+    async def increment(self, user_id: int, connection: Optional[BaseDBAsyncClient] = None, **deltas):
+        """
+        Увеличение счетчиков. Вызывается внутри транзакции, создающей
+        видео, реферала или платеж, чтобы счетчики не расходились с данными.
+        """
+        unknown = set(deltas) - set(STAT_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown stat fields: {unknown}")
+
+        updates = {name: F(name) + value for name, value in deltas.items() if value}
+        if not updates:
+            return
+
+        updated = await UserStats.filter(user_id=user_id).using_db(connection).update(**updates)
+        if not updated:
+            # Первая запись для пользователя
+            await UserStats.get_or_create(user_id=user_id, using_db=connection)
+            await UserStats.filter(user_id=user_id).using_db(connection).update(**updates)
+
+    async def rebuild(self, user_id: Optional[int] = None) -> int:
+        """Пересчет счетчиков из исходных и архивных таблиц (backfill), возвращает число записей"""
+        def scoped(field: str) -> dict:
+            return {field: user_id} if user_id is not None else {}
+
+        totals: Dict[int, Dict[str, Decimal]] = defaultdict(lambda: defaultdict(Decimal))
+
+        def add(uid: int, **values):
+            for name, value in values.items():
+                totals[uid][name] += Decimal(str(value or 0))
+
+        for videos in archive.querysets(VideoProcessing, status=VideoStatus.COMPLETED, **scoped('user_id')):
+            rows = await videos.annotate(count=Count('id'), spent=Sum('price')) \
+                .group_by('user_id').values('user_id', 'count', 'spent')
+            for row in rows:
+                add(row['user_id'], videos_count=row['count'], videos_spent=row['spent'])
+
+        for referrals in archive.querysets(Referral, **scoped('referrer_id')):
+            rows = await referrals.annotate(count=Count('id'), income=Sum('bonus_amount')) \
+                .group_by('referrer_id').values('referrer_id', 'count', 'income')
+            for row in rows:
+                add(row['referrer_id'], referrals_count=row['count'], referral_income=row['income'])
+
+        for deposits in archive.querysets(Payment, status=PaymentStatus.PAID, **scoped('user_id')):
+            rows = await deposits.annotate(total=Sum('amount')) \
+                .group_by('user_id').values('user_id', 'total')
+            for row in rows:
+                add(row['user_id'], deposits_total=row['total'])
+
+        async with in_transaction() as conn:
+            await UserStats.filter(**scoped('user_id')).using_db(conn).delete()
+            await UserStats.bulk_create([
+                UserStats(
+                    user_id=uid,
+                    **{name: value if 'count' not in name else int(value)
+                       for name, value in values.items()}
+                )
+                for uid, values in totals.items()
+            ], batch_size=1000, using_db=conn)
+
+        logger.info(f"User stats rebuilt for {len(totals)} users")
+        return len(totals)
+
+# Глобальный экземпляр для использования в системе
+user_stats = UserStatsService()
+
+if __name__ == '__main__':
+    # Пересчет счетчиков: python -m services.user_stats [user_id]
+    import sys
+    from tortoise import run_async
+    from database.db import init_db, close_db
+
+    async def backfill():
+        await init_db()
+        try:
+            await user_stats.rebuild(int(sys.argv[1]) if len(sys.argv) > 1 else None)
+        finally:
+            await close_db()
+
+    run_async(backfill())
\ No newline at end of file
@@ -3,107 +3,249 @@ import subprocess
 import cv2
 import numpy as np
 from pathlib import Path
-from typing import Tuple, Optional
+from typing import List, Tuple, Optional
 import logging
 from config import config
 import ffmpeg
 import tempfile
 from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
+from cachetools import LRUCache
 import asyncio
+import heapq
+import itertools
+import threading
 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class PriorityGate:
+    """Ограничение числа одновременных задач с очередью по приоритету"""
+
+    def __init__(self, slots: int):
+        self._free = slots
+        self._waiters = []  # куча (priority, seq, future)
+        self._seq = itertools.count()
+
+    async def acquire(self, priority: int = 0):
+        """Ожидание свободного слота (меньший priority - раньше)"""
+        if self._free > 0 and not self._waiters:
+            self._free -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Слот мог быть передан нам до отмены - возвращаем его
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        """Передача слота следующей задаче в очереди"""
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._free += 1
+
 class VideoEditor:
     def __init__(self):
         self.temp_dir = config.TEMP_DIR
-        self.executor = ThreadPoolExecutor(max_workers=2)
-        
-    async def process_video(self, input_path: Path, method: str) -> Path:
-        """Основной метод обработки видео"""
-        methods = {
+        self.executor = ThreadPoolExecutor(max_workers=config.VIDEO_WORKERS)
+        self.gate = PriorityGate(config.VIDEO_WORKERS)
+        self._probe_cache = LRUCache(maxsize=256)
+        self._probe_lock = threading.Lock()
+        self.methods = {
             'crocodile': self._crocodile_room,
             'dolphin': self._dolphin_room,
             'grizzly': self._grizzly_room
         }
         
-        if method not in methods:
+    async def process_video(self, input_path: Path, method: str, tier: str = None,
+                            effects: Optional[dict] = None) -> Path:
+        """Основной метод обработки видео
+
+        effects - параметры эффектов комнаты (по умолчанию уровень из конфига).
+        """
+        if method not in self.methods:
             raise ValueError(f"Unknown method: {method}")
         
-        output_path = self.temp_dir / f"processed_{method}_{input_path.name}"
+        tier_name = tier if tier in config.QUALITY_TIERS else config.DEFAULT_TIER
+        tier_params = config.get_tier(tier_name)
+        output_path = self.temp_dir / f"processed_{method}_{tier_name}_{input_path.name}"
         
+        # Задачи дорогих тарифов получают свободный воркер первыми
+        await self.gate.acquire(tier_params['priority'])
         try:
             # Обработка в отдельном потоке для избежания блокировки event loop
-            processed_path = await self.run_in_thread(
-                methods[method], 
-                input_path, 
-                output_path
+            return await self.run_in_thread(
+                self.render,
+                input_path,
+                output_path,
+                method,
+                tier_params,
+                effects
             )
-            self._clean_metadata(processed_path)
-            return processed_path
         except Exception as e:
             logger.error(f"Error processing video: {e}")
             raise
+        finally:
+            self.gate.release()
+
+    def render(self, input_path: Path, output_path: Path, method: str,
+               tier_params: dict, effects: Optional[dict] = None) -> Path:
+        """Синхронная обработка одного видео с готовыми параметрами тарифа"""
+        if effects is None:
+            effects = config.get_effects(method)
+        processed_path = self.methods[method](input_path, output_path, tier_params, effects)
+        self._clean_metadata(processed_path)
+        return processed_path
+
+    async def process_batch(self, input_paths: List[Path], method: str, tier: str = None) -> list:
+        """Обработка пакета видео
+
+        Задачи пакета встают в очередь воркеров подряд, с одним приоритетом.
+        Возвращает список путей или исключений в порядке входных файлов.
+        """
+        return await asyncio.gather(
+            *(self.process_video(path, method, tier) for path in input_paths),
+            return_exceptions=True
+        )
 
     async def run_in_thread(self, func, *args):
         """Запуск блокирующих операций в отдельном потоке"""
         loop = asyncio.get_event_loop()
         return await loop.run_in_executor(self.executor, func, *args)
 
-    def _crocodile_room(self, input_path: Path, output_path: Path) -> Path:
+    def _crocodile_room(self, input_path: Path, output_path: Path, tier: dict, effects: dict) -> Path:
         """Изменение контраста, насыщенности, размытие и отзеркаливание"""
         with tempfile.NamedTemporaryFile(suffix='.mp4') as temp_file:
             # Первый проход: обработка цветов и эффектов
+            stream = self._apply_tier(ffmpeg.input(str(input_path)), input_path, tier)
             (
-                ffmpeg.input(str(input_path))
-                .filter('contrast', contrast=1.1)
-                .filter('saturation', saturation=1.2)
-                .filter('brightness', brightness=0.05)
+                stream
+                .filter('contrast', contrast=effects['contrast'])
+                .filter('saturation', saturation=effects['saturation'])
+                .filter('brightness', brightness=effects['brightness'])
                 .filter('hflip')  # Горизонтальное отзеркаливание
-                .filter('gblur', sigma=0.8)
-                .output(temp_file.name, **self._get_output_params())
+                .filter('gblur', sigma=effects['blur'])
+                .output(temp_file.name, **self._get_output_params(tier))
                 .run(quiet=True)
             )
             
             # Второй проход: оптимизация
-            self._optimize_video(temp_file.name, output_path)
+            self._optimize_video(temp_file.name, output_path, tier)
         return output_path
 
-    def _dolphin_room(self, input_path: Path, output_path: Path) -> Path:
+    def _dolphin_room(self, input_path: Path, output_path: Path, tier: dict, effects: dict) -> Path:
         """Добавление шума, fade-in и масштабирование"""
         with tempfile.NamedTemporaryFile(suffix='.mp4') as temp_file:
+            stream = self._apply_tier(ffmpeg.input(str(input_path)), input_path, tier)
             (
-                ffmpeg.input(str(input_path))
-                .filter('noise', alls=20, allf='t')
+                stream
+                .filter('noise', alls=effects['noise'], allf='t')
                 .filter('fade', type='in', start_frame=0, nb_frames=25)
-                .filter('scale', w='iw*0.95', h='ih*0.95')
-                .output(temp_file.name, **self._get_output_params())
+                .filter('scale', w=f"iw*{effects['scale']}", h=f"ih*{effects['scale']}")
+                .output(temp_file.name, **self._get_output_params(tier))
                 .run(quiet=True)
             )
-            self._optimize_video(temp_file.name, output_path)
+            self._optimize_video(temp_file.name, output_path, tier)
         return output_path
 
-    def _grizzly_room(self, input_path: Path, output_path: Path) -> Path:
+    def _grizzly_room(self, input_path: Path, output_path: Path, tier: dict, effects: dict) -> Path:
         """Замедление/ускорение и обрезка концов"""
-        duration = float(ffmpeg.probe(input_path)['format']['duration'])
+        duration = float(self._probe(input_path)['format']['duration'])
         
         # Автоматическое определение параметров
-        speed = 0.8 if duration < 30 else 1.2
-        cut_duration = min(3, duration * 0.1)
-        
-        with tempfile.NamedTemporaryFile(suffix='.mp4') as temp_file:
-            (
-                ffmpeg.input(str(input_path))
-                .filter('setpts', f'{1/speed}*PTS')
-                .trim(start=cut_duration, end=duration-cut_duration)
-                .setpts('PTS-STARTPTS')
-                .output(temp_file.name, **self._get_output_params())
-                .run(quiet=True)
+        speed = effects['slow'] if duration < 30 else effects['fast']
+        cut_duration = min(3, duration * effects['cut'])
+        keep_duration = duration - 2 * cut_duration
+
+        # Seek на входе: обрезанные концы не декодируются вовсе
+        source = ffmpeg.input(str(input_path), ss=cut_duration, t=keep_duration)
+        video = source.video.filter('setpts', f'(PTS-STARTPTS)/{speed}')
+        streams = [self._apply_tier(video, input_path, tier, speed=speed)]
+
+        # Звук ускоряется/замедляется синхронно с видео
+        if self._has_audio(input_path):
+            streams.append(
+                source.audio
+                .filter('asetpts', 'PTS-STARTPTS')
+                .filter('atempo', speed)
             )
-            self._optimize_video(temp_file.name, output_path)
+
+        # Один проход кодирования вместо промежуточного файла и оптимизации
+        (
+            ffmpeg.output(
+                *streams,
+                str(output_path),
+                **self._get_output_params(tier),
+                movflags='faststart'
+            )
+            .run(quiet=True)
+        )
         return output_path
 
+    def _probe(self, input_path: Path) -> dict:
+        """ffprobe с кэшированием по пути, размеру и времени изменения файла"""
+        stat = input_path.stat()
+        key = (str(input_path), stat.st_size, stat.st_mtime_ns)
+        with self._probe_lock:
+            if key in self._probe_cache:
+                return self._probe_cache[key]
+
+        info = ffmpeg.probe(str(input_path))
+        with self._probe_lock:
+            self._probe_cache[key] = info
+        return info
+
+    def _video_stream_info(self, input_path: Path) -> dict:
+        """Параметры первой видеодорожки"""
+        for stream in self._probe(input_path).get('streams', []):
+            if stream.get('codec_type') == 'video':
+                return stream
+        return {}
+
+    def _has_audio(self, input_path: Path) -> bool:
+        """Есть ли во входном файле аудиодорожка"""
+        return any(
+            stream.get('codec_type') == 'audio'
+            for stream in self._probe(input_path).get('streams', [])
+        )
+
+    def _apply_tier(self, stream, input_path: Path, tier: dict, speed: float = 1.0):
+        """Ограничение разрешения и частоты кадров по тарифу
+
+        speed - коэффициент изменения скорости, уже применённый к потоку
+        (ускорение повышает итоговую частоту кадров).
+        """
+        info = self._video_stream_info(input_path)
+        max_height = tier.get('max_height')
+        max_fps = tier.get('max_fps')
+
+        # Лимит разрешения применяется к короткой стороне (720p и для вертикальных видео)
+        short_side = min(int(info.get('width', 0)), int(info.get('height', 0)))
+        if max_height and short_side > max_height:
+            stream = stream.filter(
+                'scale',
+                w=f'if(gt(iw,ih),-2,{max_height})',
+                h=f'if(gt(iw,ih),{max_height},-2)'
+            )
+
+        try:
+            source_fps = float(Fraction(info.get('r_frame_rate', '0/1'))) * speed
+        except (ValueError, ZeroDivisionError):
+            source_fps = 0.0
+        if max_fps and source_fps > max_fps:
+            stream = stream.filter('fps', fps=max_fps)
+
+        return stream
+
     def _clean_metadata(self, file_path: Path):
         """Очистка метаданных с сохранением качества"""
         temp_path = file_path.with_stem(f"{file_path.stem}_clean")
@@ -114,29 +256,29 @@ class VideoEditor:
         )
         os.replace(temp_path, file_path)
 
-    def _optimize_video(self, input_path: str, output_path: Path):
+    def _optimize_video(self, input_path: str, output_path: Path, tier: dict):
         """Оптимизация видео для уменьшения размера"""
         (
             ffmpeg.input(input_path)
             .output(
                 str(output_path),
-                **self._get_output_params(),
-                movflags='faststart',
-                preset='slow',
-                crf=23
+                **self._get_output_params(tier),
+                movflags='faststart'
             )
             .run(quiet=True)
         )
 
-    def _get_output_params(self) -> dict:
+    def _get_output_params(self, tier: dict) -> dict:
         """Параметры вывода для FFmpeg"""
         return {
             'c:v': 'libx264',
             'c:a': 'aac',
             'strict': 'experimental',
-            'threads': '2',
+            'threads': str(tier.get('threads', config.FFMPEG_THREADS)),
             'pix_fmt': 'yuv420p',
-            'max_muxing_queue_size': '1024'
+            'max_muxing_queue_size': '1024',
+            'preset': tier['preset'],
+            'crf': tier['crf']
         }
 
     def __del__(self):